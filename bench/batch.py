@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+"""Batched remote calls: get_stat for many files, one call per file vs.
+Board.remote_batch, over a telnet link with added latency. The result and
+error checks are in tests/test_batch.py.
+
+    python bench/batch.py [files [delay_ms]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from latency import LatencyProxy
+from telnet import connect
+
+from fileops import auto, auto_batch, get_stat
+
+import time
+
+
+def main():
+    nfiles = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    server = FakeBoardServer().start()
+    for i in range(nfiles):
+        with open(os.path.join(server.root, 'flash', 'f{}.py'.format(i)), 'w') as f:
+            f.write('#' * i)
+    proxy = LatencyProxy(server.address, delay).start()
+    boards = connect(proxy)
+    filenames = ['/flash/f{}.py'.format(i) for i in range(nfiles)]
+    auto(boards, get_stat, '/flash')  # define helper
+
+    start = time.perf_counter()
+    [auto(boards, get_stat, fn) for fn in filenames]
+    t_single = time.perf_counter() - start
+    start = time.perf_counter()
+    auto_batch(boards, get_stat, filenames)
+    t_batch = time.perf_counter() - start
+
+    print("get_stat of {} files, {:.0f} ms one-way delay".format(nfiles, delay * 1000))
+    print("  one call per file {:8.3f} s".format(t_single))
+    print("  remote_batch      {:8.3f} s   ({:.0f}x)".format(t_batch, t_single / t_batch))
+    boards.default.disconnect()
+
+
+if __name__ == "__main__":
+    main()
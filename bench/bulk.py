@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""Multi-file upload: one transfer per file (cp) vs. one bulk transfer
+(cp_many) for many small files, over a telnet link with added latency.
+The round trip and per-file failure checks are in tests/test_bulk.py.
+
+    python bench/bulk.py [files [delay_ms]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from latency import LatencyProxy
+from telnet import connect
+
+from fileops import cp, cp_many
+
+import random
+import tempfile
+import time
+
+
+def files(n):
+    """n small host files, half of them compressible, some empty"""
+    root = tempfile.mkdtemp()
+    names = []
+    for i in range(n):
+        name = os.path.join(root, 'f{}.py'.format(i))
+        with open(name, 'wb') as f:
+            if i % 2:
+                f.write(bytes(random.getrandbits(8) for _ in range(i * 37 % 3000)))
+            else:
+                f.write(b'print("hello")\n' * (i * 7 % 200))
+        names.append(name)
+    return names
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    names = files(n)
+    print("{} files, {} kB, {:.0f} ms one-way delay".format(
+        n, sum(os.path.getsize(f) for f in names) // 1024, delay * 1000))
+    print("{:>10s} {:>10s} {:>10s}".format("has_buffer", "mode", "time [s]"))
+    for buffered in (True, False):
+        server = FakeBoardServer(uid=b'bulk' + bytes([buffered]), buffered=buffered).start()
+        os.mkdir(os.path.join(server.root, 'flash', 'a'))
+        os.mkdir(os.path.join(server.root, 'flash', 'b'))
+        boards = connect(LatencyProxy(server.address, delay).start())
+
+        pairs = [(f, '/flash/a/' + os.path.basename(f)) for f in names]
+        start = time.perf_counter()
+        assert all(cp(boards, src, dst) for src, dst in pairs)
+        t_single = time.perf_counter() - start
+
+        pairs = [(f, '/flash/b/' + os.path.basename(f)) for f in names]
+        start = time.perf_counter()
+        assert all(cp_many(boards, pairs))
+        t_bulk = time.perf_counter() - start
+
+        print("{:>10s} {:>10s} {:>10.3f}".format(str(buffered), "cp", t_single))
+        print("{:>10s} {:>10s} {:>10.3f}   ({:.0f}x)".format(
+            str(buffered), "cp_many", t_bulk, t_single / t_bulk))
+        boards.default.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""Compressed file transfers: effective throughput with and without deflate.
+
+Copies Python source (compresses well) and random bytes (does not) to and
+from fake boards behind a latency proxy limited to rate_kbs, with the
+compress option off and on, for boards with and without sys.stdin.buffer.
+
+    python bench/compress.py [size_kb [delay_ms [rate_kbs]]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from latency import LatencyProxy
+from telnet import connect
+
+from fileops import cp
+
+import tempfile
+import time
+
+
+def source(size):
+    """Python source of approximately size bytes"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib', 'fileops.py'), 'rb') as f:
+        text = f.read()
+    return (text * (size // len(text) + 1))[:size]
+
+
+def transfer(boards, server, data):
+    """Upload and download data, return times"""
+    tmp = tempfile.mkdtemp()
+    src = os.path.join(tmp, 'src')
+    dst = os.path.join(tmp, 'dst')
+    with open(src, 'wb') as f:
+        f.write(data)
+    start = time.perf_counter()
+    assert cp(boards, src, '/flash/data'), "upload failed"
+    up = time.perf_counter() - start
+    start = time.perf_counter()
+    assert cp(boards, '/flash/data', dst), "download failed"
+    down = time.perf_counter() - start
+    return up, down
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 64 * 1024
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    rate = float(sys.argv[3]) * 1024 if len(sys.argv) > 3 else 50 * 1024
+    print("{} kB, {:.0f} ms one-way delay, {:.0f} kB/s link".format(
+        size // 1024, delay * 1000, rate / 1024))
+    print("{:>10s} {:>8s} {:>10s} {:>12s} {:>12s}".format(
+        "has_buffer", "data", "compress", "up [kB/s]", "down [kB/s]"))
+    for buffered in (True, False):
+        server = FakeBoardServer(uid=b'compress' + bytes([buffered]), buffered=buffered).start()
+        proxy = LatencyProxy(server.address, delay, rate=rate).start()
+        for name, data in (("source", source(size)), ("random", os.urandom(size))):
+            for compress in (False, True):
+                boards = connect(proxy, compress=compress)
+                up, down = transfer(boards, server, data)
+                print("{:>10s} {:>8s} {:>10s} {:>12.1f} {:>12.1f}".format(
+                    str(buffered), name, str(compress), size / 1024 / up, size / 1024 / down))
+                boards.default.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""Delta upload: re-copy a large board file after a one line change,
+full upload vs. delta, over a latency proxy limited to rate_kbs.
+The patch and delta upload checks are in tests/test_delta.py.
+
+    python bench/delta.py [size_kb [delay_ms [rate_kbs]]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from latency import LatencyProxy
+from telnet import connect
+
+from fileops import cp, make_patch, block_checksums, DELTA_BLOCK
+
+import random
+import tempfile
+import time
+
+
+def table(size):
+    """CSV data table of approximately size bytes"""
+    rows = ['{},{:.4f},{:.4f},{}\n'.format(i, random.random(), random.random(),
+                                            random.choice(['ok', 'warn', 'fail']))
+            for i in range(size // 24)]
+    return rows
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 300 * 1024
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    rate = float(sys.argv[3]) * 1024 if len(sys.argv) > 3 else 50 * 1024
+    server = FakeBoardServer().start()
+    proxy = LatencyProxy(server.address, delay, rate=rate).start()
+    rows = table(size)
+    src = os.path.join(tempfile.mkdtemp(), 'table.csv')
+    board_file = os.path.join(server.root, 'flash', 'table.csv')
+    print("{} kB table, {:.0f} ms one-way delay, {:.0f} kB/s link".format(
+        len(''.join(rows)) // 1024, delay * 1000, rate / 1024))
+    print("{:>10s} {:>10s}".format("mode", "time [s]"))
+    for mode, delta_min_size in (("full", 1 << 30), ("delta", 64 * 1024)):
+        with open(src, 'w') as f:
+            f.write(''.join(rows))
+        boards = connect(proxy, delta_min_size=delta_min_size, compress=False)
+        assert cp(boards, src, '/flash/table.csv')
+        # change one line
+        rows[len(rows) // 2] = 'changed\n'
+        with open(src, 'w') as f:
+            f.write(''.join(rows))
+        start = time.perf_counter()
+        assert cp(boards, src, '/flash/table.csv')
+        elapsed = time.perf_counter() - start
+        print("{:>10s} {:>10.3f}".format(mode, elapsed))
+        boards.default.disconnect()
+
+    with open(src, 'rb') as f:
+        data = f.read()
+    start = time.perf_counter()
+    patch = make_patch(data, block_checksums(board_file, DELTA_BLOCK), DELTA_BLOCK)
+    print("host patch computation {:.3f} s, patch {} bytes".format(
+        time.perf_counter() - start, len(patch)))
+
+
+if __name__ == "__main__":
+    main()
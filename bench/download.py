@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""Large file download: host receive path of recv_file_from_remote.
+
+Compares the original receiver (a new bytes object per read, copied into
+the block buffer and sliced again for decoding) with the receiver that
+fills one preallocated buffer via readinto and writes from it through
+memoryviews. The fake board runs in a subprocess, so throughput and peak
+traced memory (tracemalloc) are those of the host side only. The download
+and cat checks are in tests/test_transfer.py.
+
+    python bench/download.py [size_kb [buffer_size]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from telnet import connect
+
+from fileops import block_crc, block_size, cp, decode, encoded_size, recv_window
+import fileops
+
+import binascii
+import io
+import socket
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+
+def original_recv_file_from_remote(dev, src_filename, dst_file, filesize, offset=0, window=1,
+                                   encoding=None):
+    """recv_file_from_remote before readinto"""
+    if recv_window(dev) == 0:
+        return
+    bytes_remaining = filesize - offset
+    buf_size = dev.buffer_size
+    write_buf = bytearray(buf_size + 8)
+    seq = 0
+    ok = True
+    while bytes_remaining > 0:
+        # block prefix of the current protocol
+        dev.read(1)
+        block = min(bytes_remaining, block_size(encoding, buf_size))
+        read_size = encoded_size(block, encoding)
+        buf_remaining = read_size + 8
+        buf_index = 0
+        while buf_remaining > 0:
+            read_buf = dev.read(buf_remaining)
+            bytes_read = len(read_buf)
+            if bytes_read:
+                write_buf[buf_index:buf_index + bytes_read] = read_buf[0:bytes_read]
+                buf_index += bytes_read
+                buf_remaining -= bytes_read
+        crc = bytes(write_buf[read_size:read_size + 8])
+        if ok:
+            try:
+                data = decode(write_buf[0:read_size], encoding)
+                ok = crc == b'--------' or crc == block_crc(data)
+            except (binascii.Error, ValueError):
+                ok = False
+        if ok:
+            if isinstance(dst_file, io.TextIOBase):
+                data = data.decode('utf-8')
+            dst_file.write(data)
+        dev.write((b'\x06' if ok else b'\x15') + bytes((0x30 + seq % 64,)))
+        seq += 1
+        bytes_remaining -= block
+
+
+class FakeBoardProcess:
+    """Fake board served by a subprocess"""
+
+    def __init__(self, *options):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self.root = tempfile.mkdtemp(prefix='fakerepl')
+        os.mkdir(os.path.join(self.root, 'flash'))
+        fakerepl = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakerepl.py')
+        self._proc = subprocess.Popen(
+            [sys.executable, fakerepl, '--port', str(self.port), '--root', self.root] +
+            list(options), stdout=subprocess.DEVNULL)
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', self.port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+
+    @property
+    def address(self):
+        return '127.0.0.1:{}'.format(self.port)
+
+    def stop(self):
+        self._proc.terminate()
+        self._proc.wait()
+
+
+def download(boards, dst, receiver):
+    """cp /flash/data dst with receiver, returns time, peak traced memory"""
+    fileops.recv_file_from_remote = receiver
+    tracemalloc.start()
+    start = time.perf_counter()
+    assert cp(boards, '/flash/data', dst), "download failed"
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 4 * 1024 * 1024
+    buffer_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    new = fileops.recv_file_from_remote
+    data = os.urandom(size)
+    dst = os.path.join(tempfile.mkdtemp(), 'data')
+    print("{} kB binary file, buffer_size {}".format(size // 1024, buffer_size))
+    print("{:>10s} {:>10s} {:>10s} {:>12s} {:>12s}".format(
+        "encoding", "receiver", "time [s]", "rate [kB/s]", "peak [kB]"))
+    for encoding, options in ((None, ()), ('base64', ('--no-buffer',))):
+        board = FakeBoardProcess(*options)
+        with open(os.path.join(board.root, 'flash', 'data'), 'wb') as f:
+            f.write(data)
+        boards = connect(board, compress=False, buffer_size=buffer_size,
+                         xfer_encoding=encoding)
+        for name, receiver in (("original", original_recv_file_from_remote),
+                               ("readinto", new)):
+            elapsed, peak = download(boards, dst, receiver)
+            print("{:>10s} {:>10s} {:>10.2f} {:>12.0f} {:>12.1f}".format(
+                str(encoding), name, elapsed, size / 1024 / elapsed, peak / 1024))
+        fileops.recv_file_from_remote = new
+        boards.default.disconnect()
+        board.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""File data encoding for boards without sys.stdin.buffer: hex vs. base64.
+
+Compares the upload and download throughput of each encoding over a
+latency proxy limited to rate_kbs. The round trip of all 256 byte values
+is checked in tests/test_transfer.py.
+
+    python bench/encoding.py [size_kb [delay_ms [rate_kbs]]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from latency import LatencyProxy
+from telnet import connect
+from compress import transfer
+
+ENCODINGS = (None, 'hex', 'base64')
+
+
+def board(server, encoding, **config):
+    """Connected board using encoding"""
+    boards = connect(server, xfer_encoding=encoding, **config)
+    assert boards.default.xfer_encoding == encoding, boards.default.xfer_encoding
+    return boards
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 64 * 1024
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    rate = float(sys.argv[3]) * 1024 if len(sys.argv) > 3 else 50 * 1024
+    servers = {
+        True: FakeBoardServer(uid=b'encbuf').start(),
+        False: FakeBoardServer(uid=b'encnobuf', buffered=False).start(),
+    }
+    print("{} kB random data, {:.0f} ms one-way delay, {:.0f} kB/s link".format(
+        size // 1024, delay * 1000, rate / 1024))
+    print("{:>10s} {:>12s} {:>12s}".format("encoding", "up [kB/s]", "down [kB/s]"))
+    data = os.urandom(size)
+    for encoding in ENCODINGS:
+        server = servers[encoding is None]
+        proxy = LatencyProxy(server.address, delay, rate=rate).start()
+        boards = board(proxy, encoding, compress=False)
+        up, down = transfer(boards, server, data)
+        print("{:>10s} {:>12.1f} {:>12.1f}".format(
+            str(encoding), size / 1024 / up, size / 1024 / down))
+        boards.default.disconnect()
+
+
+if __name__ == "__main__":
+    main()
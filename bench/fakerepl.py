@@ -0,0 +1,843 @@
+#!/usr/bin/env python3
+
+"""Host-side stand-in for a MicroPython board.
+
+Serves the MicroPython REPL protocol (friendly and raw REPL) over telnet
+or WebREPL, so shell49 can be exercised without hardware. Code sent to the raw REPL
+is executed by the host Python interpreter in a namespace that mimics the
+board: os/uos operate on a sandbox directory that plays the role of the
+board's file system, sys.stdin/sys.stdout are the telnet connection.
+
+    python bench/fakerepl.py [--port PORT] [--root DIR] [--no-buffer] [--no-raw-paste] [--webrepl]
+
+Use FakeBoardServer(...).start() to run it in a background thread.
+"""
+
+import argparse
+import base64
+import hashlib
+import binascii
+import builtins
+import os
+import select
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+import zlib
+
+# MicroPython epoch is Jan 1, 2000
+TIME_OFFSET = 946684800
+
+BANNER = b'MicroPython v1.20.0 on 2023-04-26; fakerepl with host Python\r\n' \
+         b'Type "help()" for more information.\r\n'
+
+# free heap reported by gc.mem_free()
+HEAP = 100 * 1024
+
+# raw-paste flow control window
+RAW_PASTE_WINDOW = 256
+
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+ECHO, SGA, TTYPE = 1, 3, 24
+
+
+class Disconnected(Exception):
+    pass
+
+
+def interrupted(session):
+    """^C received by session (discards input up to it)"""
+    if not session._buf and select.select([session._sock], [], [], 0)[0]:
+        session._recv()
+    i = session._buf.find(b'\x03')
+    if i < 0:
+        return False
+    del session._buf[:i + 1]
+    return True
+
+
+class TelnetSession:
+    """Server side of a telnet connection: byte stream without IAC."""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buf = bytearray()
+        # incomplete telnet command at the end of the last recv
+        self._iac = b''
+
+    def _recv(self):
+        data = self._sock.recv(65536)
+        if not data:
+            raise Disconnected()
+        # strip telnet commands sent by the client
+        data = self._iac + data
+        self._iac = b''
+        if IAC in data:
+            out = bytearray()
+            i = 0
+            while i < len(data):
+                c = data[i]
+                if c != IAC:
+                    out.append(c)
+                    i += 1
+                    continue
+                cmd = data[i + 1] if i + 1 < len(data) else None
+                if cmd is None or cmd in (DO, DONT, WILL, WONT) and i + 2 >= len(data) or \
+                   cmd == SB and data.find(bytes((IAC, SE)), i) < 0:
+                    # split across recvs
+                    self._iac = bytes(data[i:])
+                    break
+                if cmd == IAC:
+                    out.append(IAC)
+                    i += 2
+                elif cmd in (DO, DONT, WILL, WONT):
+                    i += 3
+                elif cmd == SB:
+                    i = data.index(bytes((IAC, SE)), i) + 2
+                else:
+                    i += 2
+            data = out
+        self._buf += data
+
+    def read(self, n):
+        """Blocking read of exactly n bytes"""
+        while len(self._buf) < n:
+            self._recv()
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+    def getc(self):
+        return self.read(1)[0]
+
+    def readline(self):
+        while b'\n' not in self._buf:
+            self._recv()
+        i = self._buf.index(b'\n') + 1
+        line = bytes(self._buf[:i])
+        del self._buf[:i]
+        return line
+
+    def write(self, data):
+        self._sock.sendall(bytes(data).replace(b'\xff', b'\xff\xff'))
+
+    def interrupted(self):
+        return interrupted(self)
+
+    def negotiate(self):
+        self._sock.sendall(bytes((IAC, WILL, ECHO, IAC, WILL, SGA, IAC, DO, TTYPE)))
+
+    def close(self):
+        self._sock.close()
+
+
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_TEXT, WS_BINARY, WS_CLOSE = 0x1, 0x2, 0x8
+WEBREPL_REQ_S = "<2sBBQLH64s"
+WEBREPL_PUT_FILE, WEBREPL_GET_FILE = 1, 2
+
+
+class WebSocketSession:
+    """Server side of a WebREPL connection.
+
+    Text frames are the REPL byte stream, binary frames the WebREPL file
+    transfer protocol, which is served right away in _recv.
+    """
+
+    def __init__(self, sock, root):
+        self._sock = sock
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._os = FakeOs(root)
+        self._raw = bytearray()
+        self._buf = bytearray()
+
+    def _read_raw(self, n):
+        while len(self._raw) < n:
+            data = self._sock.recv(65536)
+            if not data:
+                raise Disconnected()
+            self._raw += data
+        data = bytes(self._raw[:n])
+        del self._raw[:n]
+        return data
+
+    def handshake(self):
+        """Answer the HTTP upgrade request"""
+        while b'\r\n\r\n' not in self._raw:
+            self._raw += self._sock.recv(4096) or b''
+        header, _, rest = bytes(self._raw).partition(b'\r\n\r\n')
+        self._raw = bytearray(rest)
+        key = b''
+        for line in header.split(b'\r\n'):
+            if line.lower().startswith(b'sec-websocket-key:'):
+                key = line.split(b':', 1)[1].strip()
+        accept = base64.b64encode(hashlib.sha1(key + WS_GUID).digest())
+        self._sock.sendall(b'HTTP/1.1 101 Switching Protocols\r\n'
+                           b'Upgrade: websocket\r\n'
+                           b'Connection: Upgrade\r\n'
+                           b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+    def _read_frame(self):
+        b0, b1 = self._read_raw(2)
+        n = b1 & 0x7f
+        if n == 126:
+            n = struct.unpack('>H', self._read_raw(2))[0]
+        elif n == 127:
+            n = struct.unpack('>Q', self._read_raw(8))[0]
+        mask = self._read_raw(4) if b1 & 0x80 else None
+        payload = self._read_raw(n)
+        if mask:
+            payload = bytes(c ^ mask[i % 4] for i, c in enumerate(payload))
+        return b0 & 0x0f, payload
+
+    def _read_binary(self):
+        while True:
+            opcode, payload = self._read_frame()
+            if opcode == WS_BINARY:
+                return payload
+            if opcode == WS_TEXT:
+                self._buf += payload
+            elif opcode == WS_CLOSE:
+                raise Disconnected()
+
+    def _send_frame(self, opcode, payload):
+        n = len(payload)
+        if n < 126:
+            header = struct.pack('>BB', 0x80 | opcode, n)
+        elif n < 0x10000:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, n)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, n)
+        self._sock.sendall(header + bytes(payload))
+
+    def _recv(self):
+        opcode, payload = self._read_frame()
+        if opcode == WS_TEXT:
+            self._buf += payload
+        elif opcode == WS_BINARY:
+            self._file_transfer(payload)
+        elif opcode == WS_CLOSE:
+            raise Disconnected()
+
+    def _file_transfer(self, req):
+        if len(req) != struct.calcsize(WEBREPL_REQ_S):
+            return
+        sig, op, _, _, size, fnlen, fn = struct.unpack(WEBREPL_REQ_S, req)
+        if sig != b'WA':
+            return
+        path = self._os._path(fn[:fnlen].decode('utf-8'))
+        if op == WEBREPL_PUT_FILE:
+            try:
+                f = open(path, 'wb')
+            except OSError:
+                self._send_frame(WS_BINARY, b'WB\x01\x00')
+                return
+            self._send_frame(WS_BINARY, b'WB\x00\x00')
+            with f:
+                while size > 0:
+                    data = self._read_binary()
+                    f.write(data)
+                    size -= len(data)
+            self._send_frame(WS_BINARY, b'WB\x00\x00')
+        elif op == WEBREPL_GET_FILE:
+            try:
+                f = open(path, 'rb')
+            except OSError:
+                self._send_frame(WS_BINARY, b'WB\x01\x00')
+                return
+            self._send_frame(WS_BINARY, b'WB\x00\x00')
+            with f:
+                while True:
+                    self._read_binary()
+                    data = f.read(1024)
+                    self._send_frame(WS_BINARY, struct.pack('<H', len(data)))
+                    if not data:
+                        break
+                    self._send_frame(WS_BINARY, data)
+            self._send_frame(WS_BINARY, b'WB\x00\x00')
+
+    def read(self, n):
+        """Blocking read of exactly n bytes"""
+        while len(self._buf) < n:
+            self._recv()
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+    def getc(self):
+        return self.read(1)[0]
+
+    def readline(self):
+        while b'\r' not in self._buf:
+            self._recv()
+        i = self._buf.index(b'\r') + 1
+        line = bytes(self._buf[:i])
+        del self._buf[:i]
+        return line
+
+    def write(self, data):
+        if data:
+            self._send_frame(WS_TEXT, data)
+
+    def interrupted(self):
+        return interrupted(self)
+
+    def close(self):
+        self._sock.close()
+
+
+class FakeOs:
+    """Subset of MicroPython's os module, rooted at a host directory."""
+
+    def __init__(self, root):
+        self._root = root
+        self._cwd = '/'
+
+    def _path(self, path):
+        path = os.path.normpath(os.path.join(self._cwd, path))
+        return os.path.join(self._root, path.lstrip('/'))
+
+    def listdir(self, path='.'):
+        return sorted(os.listdir(self._path(path)))
+
+    def stat(self, path):
+        st = os.stat(self._path(path))
+        return (st.st_mode, 0, 0, 0, 0, 0, st.st_size,
+                int(st.st_atime) - TIME_OFFSET, int(st.st_mtime) - TIME_OFFSET,
+                int(st.st_ctime) - TIME_OFFSET)
+
+    def mkdir(self, path):
+        os.mkdir(self._path(path))
+
+    def rmdir(self, path):
+        os.rmdir(self._path(path))
+
+    def remove(self, path):
+        os.remove(self._path(path))
+
+    def rename(self, old, new):
+        os.rename(self._path(old), self._path(new))
+
+    def chdir(self, path):
+        self._cwd = os.path.normpath(os.path.join(self._cwd, path))
+
+    def getcwd(self):
+        return self._cwd
+
+    def uname(self):
+        from collections import namedtuple
+        u = namedtuple('uname_result', 'sysname nodename release version machine')
+        return u('esp32', 'esp32', '1.20.0', 'v1.20.0 on 2023-04-26', 'fakerepl')
+
+    def open(self, path, mode='r', *args, **kwargs):
+        return open(self._path(path), mode, *args, **kwargs)
+
+
+class FakeTime:
+    """time module, sleep is interrupted by ^C (KeyboardInterrupt)"""
+
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    def sleep(self, seconds):
+        end = time.monotonic() + seconds
+        while True:
+            if self._session.interrupted():
+                raise KeyboardInterrupt()
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.01))
+
+    def sleep_ms(self, ms):
+        self.sleep(ms / 1000)
+
+    def sleep_us(self, us):
+        self.sleep(us / 1000000)
+
+
+class FakeGc:
+    """gc module with a fixed size heap"""
+
+    def __init__(self, heap):
+        self._heap = heap
+
+    def collect(self):
+        pass
+
+    def mem_free(self):
+        return self._heap
+
+    def mem_alloc(self):
+        # host memory in use by the helpers when traced (bench/upload_heap.py)
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+class FakeDeflateIO:
+    """deflate.DeflateIO on a host stream, zlib format"""
+
+    def __init__(self, stream, format=1, wbits=0, close=False):
+        self._stream = stream
+        self._wbits = wbits
+        self._close = close
+        self._decomp = zlib.decompressobj()
+        self._comp = None
+        self._pending = b''
+
+    def readinto(self, buf, n=None):
+        n = len(buf) if n is None else n
+        while len(self._pending) < n and not self._decomp.eof:
+            chunk = self._stream.read(256)
+            if not chunk:
+                # truncated stream
+                raise OSError(22)
+            self._pending += self._decomp.decompress(chunk)
+        data, self._pending = self._pending[:n], self._pending[n:]
+        buf[:len(data)] = data
+        return len(data)
+
+    def read(self, n=-1):
+        buf = bytearray(n if n >= 0 else 1 << 20)
+        return bytes(buf[:self.readinto(buf)])
+
+    def write(self, data):
+        if self._comp is None:
+            # the board compresses with a small window, 2**8 by default
+            self._comp = zlib.compressobj(9, zlib.DEFLATED, max(9, self._wbits or 8))
+        self._stream.write(self._comp.compress(bytes(data)))
+        return len(data)
+
+    def close(self):
+        if self._comp:
+            self._stream.write(self._comp.flush())
+        if self._close:
+            self._stream.close()
+
+
+class FakeDeflate:
+    """deflate module (MicroPython v1.21+, with compression)"""
+    RAW = 0
+    ZLIB = 1
+    GZIP = 2
+    DeflateIO = FakeDeflateIO
+
+
+class FakeMachine:
+    """machine module: unique_id, reset and RTC"""
+
+    def __init__(self, uid, board=None):
+        self._uid = uid
+        self._board = board
+
+    def unique_id(self):
+        return self._uid
+
+    def reset(self):
+        """Hard reset once the command has completed, as by a watchdog"""
+        self._board.reset_pending = True
+
+    class RTC:
+        _datetime = None
+
+        def synced(self):
+            return False
+
+        def datetime(self, dt=None):
+            if dt is not None:
+                FakeMachine.RTC._datetime = dt
+            return FakeMachine.RTC._datetime
+
+
+class FakeStdin:
+
+    def __init__(self, session, buffered):
+        self._session = session
+        self._buffered = buffered
+        if buffered:
+            self.buffer = self
+
+    def _cook(self, data):
+        # the text mode stdin of boards without buffer converts CR to LF
+        return data if self._buffered else data.replace(b'\r', b'\n')
+
+    def read(self, n=1):
+        return self._cook(self._session.read(n)).decode('latin-1')
+
+    def readinto(self, buf, n=None):
+        n = len(buf) if n is None else min(n, len(buf))
+        # through a memoryview, a bytearray slice assignment copies the data
+        memoryview(buf)[:n] = self._cook(self._session.read(n))
+        return n
+
+
+class FakeStdout:
+
+    def __init__(self, session):
+        self._session = session
+        self.buffer = FakeStdoutBuffer(session)
+
+    def write(self, s):
+        if isinstance(s, str):
+            s = s.encode('utf-8')
+        self._session.write(bytes(s).replace(b'\n', b'\r\n'))
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+class FakeStdoutBuffer:
+
+    def __init__(self, session):
+        self._session = session
+
+    def write(self, b):
+        self._session.write(b)
+        return len(b)
+
+
+class FakeBoard:
+    """REPL state machine and execution namespace of one connection."""
+
+    # soft resets, all connections
+    resets = 0
+
+    def __init__(self, session, root, uid=b'fakerepl', buffered=True, raw_paste=True,
+                 reset_time=0, deflate=True):
+        self._session = session
+        self._reset_time = reset_time
+        self._root = root
+        self._uid = uid
+        self._buffered = buffered
+        self._raw_paste = raw_paste
+        self._deflate = deflate
+        self._raw = False
+        self.reset_pending = False
+        self.reset()
+
+    def soft_reset(self):
+        """Soft reset, takes reset_time seconds (boot)"""
+        FakeBoard.resets += 1
+        time.sleep(self._reset_time)
+        self.reset()
+
+    def reset(self):
+        """Fresh namespace"""
+        fake_os = FakeOs(self._root)
+        fake_sys = type(sys)('sys')
+        fake_sys.stdin = FakeStdin(self._session, self._buffered)
+        fake_sys.stdout = FakeStdout(self._session)
+        fake_sys.platform = 'esp32'
+        fake_sys.implementation = sys.implementation
+        modules = {
+            'os': fake_os, 'uos': fake_os,
+            'sys': fake_sys, 'usys': fake_sys,
+            'machine': FakeMachine(self._uid, self),
+            'time': FakeTime(self._session), 'utime': FakeTime(self._session),
+            'gc': FakeGc(HEAP),
+            'ubinascii': binascii,
+            'uhashlib': hashlib,
+        }
+        if self._deflate:
+            modules['deflate'] = FakeDeflate
+
+        def _import(name, globals=None, locals=None, fromlist=(), level=0):
+            if name in modules:
+                return modules[name]
+            return __import__(name, globals, locals, fromlist, level)
+
+        def _print(*args, **kwargs):
+            if kwargs.get('file') is None:
+                kwargs['file'] = fake_sys.stdout
+            print(*args, **kwargs)
+
+        def _exec(code, globals=None, locals=None):
+            # code exec'd in a fresh namespace must see the board's modules too
+            if globals is None:
+                globals = sys._getframe(1).f_globals
+            globals.setdefault('__builtins__', b)
+            exec(code, globals, locals)
+
+        b = dict(builtins.__dict__)
+        b.update(__import__=_import, print=_print, open=fake_os.open, exec=_exec)
+        self._globals = {'__builtins__': b, '__name__': '__main__'}
+        self._stdout = fake_sys.stdout
+
+    def write(self, data):
+        self._session.write(data)
+
+    def run(self):
+        self.write(BANNER + b'>>> ')
+        while True:
+            if self._raw:
+                self.raw_repl()
+            else:
+                self.friendly_repl()
+
+    def friendly_repl(self):
+        line = bytearray()
+        # compound statement being entered, lines after ... are auto-indented
+        block = []
+        while True:
+            c = self._session.getc()
+            if c == 0x01:
+                self.write(b'\r\nraw REPL; CTRL-B to exit\r\n>')
+                self._raw = True
+                return
+            elif c == 0x02:
+                self.write(b'\r\n' + BANNER + b'>>> ')
+                line.clear()
+                block.clear()
+            elif c == 0x03:
+                self.write(b'\r\n>>> ')
+                line.clear()
+                block.clear()
+            elif c == 0x04:
+                self.write(b'MPY: soft reboot\r\n')
+                self.soft_reset()
+                self.write(BANNER + b'>>> ')
+                line.clear()
+                block.clear()
+            elif c == 0x05 and not line and not block:
+                self.paste_mode()
+            elif c == 0x0d:
+                self.write(b'\r\n')
+                if block and line.strip():
+                    block.append(bytes(line))
+                elif block:
+                    self.execute(b'\n'.join(block), friendly=True)
+                    block.clear()
+                elif line.rstrip().endswith(b':'):
+                    block.append(bytes(line))
+                elif line:
+                    self.execute(bytes(line), friendly=True)
+                line.clear()
+                if block:
+                    # indent like the previous line, one level more after ':'
+                    last = block[-1]
+                    indent = len(last) - len(last.lstrip(b' '))
+                    if last.rstrip().endswith(b':'):
+                        indent += 4
+                    line += b' ' * indent
+                    self.write(b'... ' + line)
+                else:
+                    self.write(b'>>> ')
+            elif c == 0x7f:
+                if line:
+                    line.pop()
+                    self.write(b'\x08 \x08')
+            elif c != 0x0a:
+                line.append(c)
+                self.write(bytes((c,)))
+
+    def paste_mode(self):
+        """Collect code until Control-D, echoing it, then execute it"""
+        self.write(b'\r\npaste mode; Ctrl-C to cancel, Ctrl-D to finish\r\n=== ')
+        code = bytearray()
+        while True:
+            c = self._session.getc()
+            if c == 0x03:
+                self.write(b'\r\n>>> ')
+                return
+            if c == 0x04:
+                break
+            code.append(c)
+            self.write(b'\r\n=== ' if c == 0x0d else bytes((c,)))
+        self.write(b'\r\n')
+        self.write(self.execute(bytes(code)))
+        self.write(b'>>> ')
+
+    def raw_repl(self):
+        line = bytearray()
+        while True:
+            if self.reset_pending:
+                # boots into the friendly repl
+                self.reset_pending = False
+                self.reset()
+                self._raw = False
+                self.write(b'\r\n' + BANNER + b'>>> ')
+                return
+            c = self._session.getc()
+            if c == 0x01:
+                self.write(b'raw REPL; CTRL-B to exit\r\n>')
+                line.clear()
+            elif c == 0x02:
+                self.write(b'\r\n' + BANNER + b'>>> ')
+                self._raw = False
+                return
+            elif c == 0x03:
+                line.clear()
+            elif c == 0x04:
+                self.write(b'OK')
+                if not line:
+                    # soft reset, stays in raw REPL
+                    self.write(b'\r\nMPY: soft reboot\r\n')
+                    self.soft_reset()
+                    self.write(b'raw REPL; CTRL-B to exit\r\n>')
+                    continue
+                err = self.execute(bytes(line))
+                self.write(b'\x04' + err + b'\x04>')
+                line.clear()
+            elif c == 0x05 and self._raw_paste and not line:
+                if self._session.read(2) == b'A\x01':
+                    self.raw_paste()
+            else:
+                line.append(c)
+
+    def raw_paste(self):
+        """Receive code with flow control, then execute it"""
+        self.write(b'R\x01' + struct.pack('<H', RAW_PASTE_WINDOW))
+        code = bytearray()
+        remain = RAW_PASTE_WINDOW
+        while True:
+            c = self._session.getc()
+            if c == 0x04:
+                break
+            code.append(c)
+            remain -= 1
+            if remain == 0:
+                self.write(b'\x01')
+                remain = RAW_PASTE_WINDOW
+        self.write(b'\x04')
+        err = self.execute(bytes(code))
+        self.write(b'\x04' + err + b'\x04>')
+
+    def execute(self, code, friendly=False):
+        """Run code, return error output (traceback)"""
+        try:
+            code = code.decode('utf-8')
+            if friendly:
+                try:
+                    res = eval(code, self._globals)
+                    if res is not None:
+                        self._stdout.write(repr(res) + '\n')
+                    return b''
+                except SyntaxError:
+                    pass
+            exec(compile(code, '<stdin>', 'exec'), self._globals)
+            return b''
+        except Disconnected:
+            raise
+        except BaseException as e:
+            msg = 'Traceback (most recent call last):\n' + \
+                ''.join(traceback.format_exception_only(type(e), e))
+            msg = msg.encode('utf-8').replace(b'\n', b'\r\n')
+            if friendly:
+                self.write(msg)
+            return msg
+
+
+class FakeBoardServer:
+    """Telnet or WebREPL server with login, one FakeBoard per connection."""
+
+    def __init__(self, port=0, root=None, user='micro', password='python',
+                 uid=b'fakerepl', buffered=True, webrepl=False, raw_paste=True,
+                 reset_time=0, deflate=True):
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(('127.0.0.1', port))
+        self._listener.listen(4)
+        self.port = self._listener.getsockname()[1]
+        if root is None:
+            root = tempfile.mkdtemp(prefix='fakerepl')
+            os.mkdir(os.path.join(root, 'flash'))
+        self.root = root
+        self._user = user
+        self._password = password
+        self._uid = uid
+        self._buffered = buffered
+        self._webrepl = webrepl
+        self._raw_paste = raw_paste
+        self._reset_time = reset_time
+        self._deflate = deflate
+
+    @property
+    def address(self):
+        return '127.0.0.1:{}'.format(self.port)
+
+    def start(self):
+        """Serve in a daemon thread"""
+        t = threading.Thread(target=self.serve_forever, name='fakerepl', daemon=True)
+        t.start()
+        return self
+
+    def serve_forever(self):
+        while True:
+            sock, _ = self._listener.accept()
+            threading.Thread(target=self.handle, args=(sock,), daemon=True).start()
+
+    def handle(self, sock):
+        if self._webrepl:
+            self.handle_webrepl(sock)
+            return
+        session = TelnetSession(sock)
+        try:
+            session.negotiate()
+            session.write(b'Login as: ')
+            user = session.readline().strip().decode()
+            session.write(b'Password: ')
+            password = session.readline().strip().decode()
+            if (user, password) != (self._user, self._password):
+                session.write(b'\r\nLogin failed\r\n')
+                return
+            session.write(b'\r\nLogin succeeded!\r\n')
+            FakeBoard(session, self.root, self._uid, self._buffered, self._raw_paste,
+                      self._reset_time, self._deflate).run()
+        except (Disconnected, OSError):
+            pass
+        finally:
+            session.close()
+
+    def handle_webrepl(self, sock):
+        session = WebSocketSession(sock, self.root)
+        try:
+            session.handshake()
+            session.write(b'Password: ')
+            password = session.readline().strip().decode()
+            if password != self._password:
+                session.write(b'\r\nAccess denied\r\n')
+                return
+            session.write(b'\r\nWebREPL connected\r\n')
+            FakeBoard(session, self.root, self._uid, self._buffered, self._raw_paste,
+                      self._reset_time, self._deflate).run()
+        except (Disconnected, OSError):
+            pass
+        finally:
+            session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake MicroPython board (telnet or WebREPL)")
+    parser.add_argument('--port', type=int, default=2323)
+    parser.add_argument('--root', help="board file system (default: temporary directory)")
+    parser.add_argument('--no-buffer', dest='buffered', action='store_false',
+                        help="emulate firmware without sys.stdin.buffer")
+    parser.add_argument('--no-raw-paste', dest='raw_paste', action='store_false',
+                        help="emulate firmware without raw-paste mode (before v1.14)")
+    parser.add_argument('--no-deflate', dest='deflate', action='store_false',
+                        help="emulate firmware without the deflate module")
+    parser.add_argument('--webrepl', action='store_true',
+                        help="serve WebREPL (websocket) instead of telnet")
+    args = parser.parse_args()
+    server = FakeBoardServer(args.port, args.root, buffered=args.buffered,
+                             webrepl=args.webrepl, raw_paste=args.raw_paste,
+                             deflate=args.deflate)
+    print("fake board listening on {}, file system at {}".format(server.address, server.root))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""Fan-out deploy: rsync of one tree to many boards, one after the other
+vs. concurrently (one thread per connection).
+
+Connects to boards fake boards, each behind its own latency proxy limited
+to rate_kbs, rsyncs a small project to all of them sequentially and with
+fanout and prints the per board summary (traffic, failures). The result
+and failure checks are in tests/test_fanout.py.
+
+    python bench/fanout.py [boards [delay_ms [rate_kbs]]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from latency import LatencyProxy
+from manifest import tree
+
+from activeboards import ActiveBoards
+from config import Config
+from fanout import fanout
+from fileops import manifest, rsync
+from printing import Capture
+import printing
+
+import shutil
+import tempfile
+import time
+
+
+def connect(proxies):
+    """ActiveBoards connected to all proxies, boards named b0, b1, ..."""
+    printing.quiet(True)
+    cfg = Config(os.path.join(tempfile.mkdtemp(), 'shell49_rc.py'))
+    cfg.set(0, 'autotune', False)
+    boards = ActiveBoards(cfg)
+    for i, proxy in enumerate(proxies):
+        boards.connect_telnet(proxy.address)
+    for i, board in enumerate(boards.boards()):
+        board.name = 'b{}'.format(i)
+    return boards
+
+
+def clear(servers):
+    """Remove the deployed tree from all boards"""
+    for server in servers:
+        shutil.rmtree(os.path.join(server.root, 'flash', 't'), ignore_errors=True)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    rate = float(sys.argv[3]) * 1024 if len(sys.argv) > 3 else 50 * 1024
+    servers = [FakeBoardServer(uid='fanout{}'.format(i).encode()).start() for i in range(n)]
+    proxies = [LatencyProxy(server.address, delay, rate=rate).start() for server in servers]
+    boards = connect(proxies)
+    targets = boards.select()
+    assert len(targets) == n
+    src = tree(16)
+    print("{} boards, {:.0f} ms one-way delay, {:.0f} kB/s links, {} files and directories".format(
+        n, delay * 1000, rate / 1024, len(manifest(boards, src)) - 1))
+
+    start = time.perf_counter()
+    for board in targets:
+        rsync(boards.view(board), src, '/flash/t', mirror=True, dry_run=False, recursed=True)
+    sequential = time.perf_counter() - start
+    clear(servers)
+
+    start = time.perf_counter()
+    with Capture() as out:
+        failed = fanout(boards, targets,
+                        lambda devs: rsync(devs, src, '/flash/t', mirror=True,
+                                           dry_run=False, recursed=True))
+    concurrent = time.perf_counter() - start
+    assert not failed, out.getvalue()
+    print(out.getvalue(), end='')
+    print("{:>12s} {:>10s}".format("", "time [s]"))
+    print("{:>12s} {:>10.2f}".format("sequential", sequential))
+    print("{:>12s} {:>10.2f}".format("fanout", concurrent))
+    for board in targets:
+        board.disconnect()
+
+
+if __name__ == "__main__":
+    main()
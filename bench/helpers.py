@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+"""Board.remote call cost with and without the device-side helper registry.
+
+Calls get_stat repeatedly on a fake board, once with helpers defined only
+once per session and once redefining them on every call (the behavior
+before the registry), and reports bytes sent and time per call.
+
+    python bench/helpers.py [calls]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from telnet import connect
+
+from fileops import get_stat
+
+import time
+
+
+def run(board, calls, registry):
+    sent = [0]
+    write = board._serial.write
+    def counting_write(data):
+        sent[0] += len(data)
+        return write(data)
+    board._serial.write = counting_write
+    start = time.perf_counter()
+    for i in range(calls):
+        if not registry:
+            board._helpers.clear()
+        assert board.remote_eval(get_stat, '/flash')[0] & 0x4000
+    elapsed = time.perf_counter() - start
+    board._serial.write = write
+    return sent[0] / calls, elapsed / calls
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    board = connect(FakeBoardServer().start()).default
+    print("{:>10s} {:>14s} {:>14s}".format("registry", "bytes/call", "ms/call"))
+    for registry in (False, True):
+        sent, t = run(board, calls, registry)
+        print("{:>10s} {:>14.0f} {:>14.3f}".format(str(registry), sent, t * 1000))
+    board.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""TCP proxy that delays traffic in both directions.
+
+Put it in front of bench/fakerepl.py to emulate a wireless link:
+
+    python bench/latency.py [--port PORT] [--delay MS] [--rate KBS] TARGET_PORT
+
+Use LatencyProxy(...).start() to run it in a background thread.
+"""
+
+import argparse
+import queue
+import socket
+import threading
+import time
+
+
+class LatencyProxy:
+    """Forwards connections to target, each direction delayed by delay seconds
+    and limited to rate bytes/s (unless None)."""
+
+    def __init__(self, target, delay=0.01, port=0, rate=None):
+        host, _, target_port = target.rpartition(':')
+        self._target = (host or '127.0.0.1', int(target_port))
+        self._delay = delay
+        self._rate = rate
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(('127.0.0.1', port))
+        self._listener.listen(4)
+        self.port = self._listener.getsockname()[1]
+        self._sockets = []
+
+    @property
+    def address(self):
+        return '127.0.0.1:{}'.format(self.port)
+
+    def start(self):
+        """Serve in a daemon thread"""
+        threading.Thread(target=self.serve_forever, name='latency', daemon=True).start()
+        return self
+
+    def cut(self):
+        """Drop all open connections (e.g. a WiFi hiccup)"""
+        sockets, self._sockets = self._sockets, []
+        for s in sockets:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def serve_forever(self):
+        while True:
+            client, _ = self._listener.accept()
+            upstream = socket.create_connection(self._target)
+            for s in (client, upstream):
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sockets += [client, upstream]
+            self._pipe(client, upstream)
+            self._pipe(upstream, client)
+
+    def _pipe(self, src, dst):
+        q = queue.Queue()
+
+        def reader():
+            while True:
+                try:
+                    data = src.recv(65536)
+                except OSError:
+                    data = b''
+                q.put((time.monotonic() + self._delay, data))
+                if not data:
+                    return
+
+        def writer():
+            free = 0
+            while True:
+                due, data = q.get()
+                if self._rate:
+                    # link busy until the previous data is through
+                    due = max(due, free)
+                    free = due + len(data) / self._rate
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    if not data:
+                        dst.shutdown(socket.SHUT_WR)
+                        return
+                    dst.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=reader, daemon=True).start()
+        threading.Thread(target=writer, daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCP proxy with latency")
+    parser.add_argument('--port', type=int, default=2324)
+    parser.add_argument('--delay', type=float, default=10, help="one-way delay [ms]")
+    parser.add_argument('--rate', type=float, help="bandwidth [kB/s] (default: unlimited)")
+    parser.add_argument('target_port', type=int)
+    args = parser.parse_args()
+    proxy = LatencyProxy('127.0.0.1:{}'.format(args.target_port), args.delay / 1000, args.port,
+                         args.rate and args.rate * 1024)
+    print("forwarding {} -> {} with {} ms delay".format(proxy.address, args.target_port, args.delay))
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+"""rsync planning cost: round trips and time for a tree that is in sync.
+
+Creates a tree of dirs directories with a few files each on the host,
+rsyncs it to a fake board behind a latency proxy, then reports the number
+of raw REPL commands and the time for a second rsync that has nothing to
+copy, with and without --checksum, reading the board tree from its sync
+manifest or scanning it (--scan). The manifest is only sent if it changed.
+The checks that the manifest follows cp and rm and is not used after the
+board root was changed by someone else are in tests/test_rsync.py.
+
+    python bench/manifest.py [dirs [delay_ms]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from latency import LatencyProxy
+from telnet import connect
+
+from fileops import rsync
+
+import os
+import tempfile
+import time
+
+
+def tree(dirs):
+    """Host directory with dirs subdirectories, 2 levels deep"""
+    root = tempfile.mkdtemp()
+    for i in range(dirs):
+        d = os.path.join(root, 'd{}'.format(i // 8), 'e{}'.format(i))
+        os.makedirs(d)
+        for j in range(3):
+            with open(os.path.join(d, 'f{}.py'.format(j)), 'w') as f:
+                f.write('x = {}\n'.format(j) * (i + 1))
+    return root
+
+
+def main():
+    dirs = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    server = FakeBoardServer().start()
+    boards = connect(LatencyProxy(server.address, delay).start())
+    board = boards.default
+    src = tree(dirs)
+    rsync(boards, src, '/flash/t', mirror=True, dry_run=False, recursed=True)
+
+    commands = [0]
+    exec_no_output = board._exec_no_output
+    def counting(*args, **kwargs):
+        commands[0] += 1
+        return exec_no_output(*args, **kwargs)
+    board._exec_no_output = counting
+
+    def timed(**kwargs):
+        commands[0] = 0
+        received = board.traffic[1]
+        start = time.perf_counter()
+        rsync(boards, src, '/flash/t', mirror=True, dry_run=False, recursed=True, **kwargs)
+        return commands[0], (board.traffic[1] - received) / 1024, time.perf_counter() - start
+
+    print("{} directories, {} files, {:.0f} ms one-way delay".format(
+        dirs, dirs * 3, delay * 1000))
+    print("{:>10s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+        "checksum", "tree", "commands", "recv [kB]", "time [s]"))
+    row = "{:>10s} {:>10s} {:>10d} {:>10.1f} {:>10.3f}"
+    for checksum in (False, True):
+        # scan (rewrites the manifest), read it, unchanged since read
+        for label, scan in (("scan", True), ("manifest", False), ("unchanged", False)):
+            print(row.format(str(checksum), label, *timed(checksum=checksum, scan=scan)))
+
+    # changed by someone else: the board root stat no longer matches
+    flash = os.path.join(server.root, 'flash')
+    with open(os.path.join(flash, 'other.py'), 'w') as f:
+        f.write('other = 1\n')
+    # mtimes have a resolution of seconds, make it a later one
+    mtime = os.stat(flash).st_mtime + 2
+    os.utime(flash, (mtime, mtime))
+    print(row.format("False", "changed", *timed()))
+    print(row.format("False", "unchanged", *timed()))
+    board.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+"""Exec upload throughput: raw-paste mode vs. 256 byte slices.
+
+Runs code of increasing size on a fake board with and without raw-paste
+support and reports how fast the code reaches the board. The mode detection
+and exec output checks are in tests/test_raw_paste.py.
+
+    python bench/raw_paste.py [size_kb ...]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+
+from activeboards import ActiveBoards
+from config import Config
+import printing
+
+import tempfile
+import time
+
+
+def connect(server):
+    printing.quiet(True)
+    cfg = Config(os.path.join(tempfile.mkdtemp(), 'shell49_rc.py'))
+    cfg.set(0, 'autotune', False)
+    boards = ActiveBoards(cfg)
+    boards.connect_telnet(server.address)
+    return boards.default
+
+
+def code(size):
+    """Python source of approximately size bytes"""
+    line = "x = [i * i for i in range(10)]  # padding padding padding\n"
+    return line * (size // len(line)) + "print(len(x))\n"
+
+
+def main():
+    sizes = [int(s) * 1024 for s in sys.argv[1:]] or [1024, 8 * 1024, 32 * 1024]
+    print("{:>10s} {:>10s} {:>14s}".format("mode", "size", "upload [kB/s]"))
+    for mode, raw_paste in (("raw", False), ("raw-paste", True)):
+        board = connect(FakeBoardServer(raw_paste=raw_paste).start())
+        board.exec("pass")
+        for size in sizes:
+            cmd = code(size)
+            start = time.perf_counter()
+            board._exec_no_output(cmd)
+            elapsed = time.perf_counter() - start
+            board._exec_output()
+            print("{:>10s} {:>10d} {:>14.1f}".format(mode, len(cmd), len(cmd) / 1024 / elapsed))
+        board.disconnect()
+
+
+if __name__ == "__main__":
+    main()
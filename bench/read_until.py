@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark: Connection.read_until engines.
+
+Compares the original byte-at-a-time engine against the chunked engine in
+connection.Connection on large raw-REPL style outputs. The result and
+data_consumer checks are in tests/test_read_until.py.
+
+    python bench/read_until.py [size_kb ...]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from connection import Connection, ConnectionError
+
+import time
+
+# the byte-at-a-time engine is quadratic, skip it for larger outputs
+MAX_BYTEWISE = 256 * 1024
+
+
+class LoopbackConnection(Connection):
+    """Connection that 'receives' a fixed payload in serial-sized chunks."""
+
+    def __init__(self, payload, chunk=4096):
+        super().__init__()
+        self._payload = payload
+        self._pos = 0
+        self._chunk = chunk
+
+    def _pull(self):
+        data = self._payload[self._pos:self._pos + self._chunk]
+        self._pos += len(data)
+        self._rx.extend(data)
+        return len(data)
+
+    def write(self, data):
+        return len(data)
+
+    @property
+    def timeout(self):
+        return 1
+
+
+def read_until_bytewise(conn, min_num_bytes, ending, timeout=10, data_consumer=None):
+    """The original engine: read(1) per byte, rebuild data each time."""
+    data = conn.read(min_num_bytes)
+    if data_consumer:
+        data_consumer(data)
+    timeout_count = 0
+    while True:
+        if data.endswith(ending):
+            break
+        elif conn.in_waiting > 0:
+            new_data = conn.read(1)
+            data = data + new_data
+            if data_consumer:
+                data_consumer(new_data)
+            timeout_count = 0
+        else:
+            timeout_count += 1
+            if timeout and timeout_count >= 100 * timeout:
+                raise ConnectionError('timeout in read_until "{}"'.format(ending))
+            time.sleep(0.01)
+    return data
+
+
+def payload(size):
+    """listdir_stat-like output of approximately size bytes, then EOF."""
+    line = b"('main.py', (32768, 0, 0, 0, 0, 0, 1234, 946684800, 946684800, 946684800)), "
+    body = (line * (size // len(line) + 1))[:size]
+    return body + b'\x04' + b'\x04>'
+
+
+def run(engine, size):
+    data = payload(size)
+    conn = LoopbackConnection(data)
+    consumed = [0]
+    def consumer(b):
+        consumed[0] += len(b)
+    start = time.perf_counter()
+    engine(conn, 1, b'\x04', data_consumer=consumer)
+    return time.perf_counter() - start
+
+
+def main():
+    sizes = [int(s) * 1024 for s in sys.argv[1:]] or \
+            [16 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+    print("{:>10s} {:>14s} {:>14s} {:>10s}".format("size", "bytewise [s]", "chunked [s]", "speedup"))
+    for size in sizes:
+        new = run(Connection.read_until, size)
+        if size <= MAX_BYTEWISE:
+            old = run(read_until_bytewise, size)
+            print("{:>10d} {:>14.4f} {:>14.4f} {:>9.0f}x".format(size, old, new, old / new))
+        else:
+            print("{:>10d} {:>14s} {:>14.4f} {:>10s}".format(size, "(skipped)", new, ""))
+
+
+if __name__ == "__main__":
+    main()
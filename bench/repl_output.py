@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+"""REPL output throughput: board printing continuously in the repl.
+
+Runs a print loop on the fake board (in a subprocess) from the interactive
+repl and times until all output reached stdout. Compares the original
+reader (print of each chunk decoded on its own) with the reader that
+drains the connection, decodes incrementally and writes to
+sys.stdout.buffer. Reads return at most PACKET bytes, like a USB serial
+adapter, so multi-byte characters straddle reads.
+
+    python bench/repl_output.py [lines]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from download import FakeBoardProcess
+from telnet import connect
+
+from board import Board, QUIT_REPL_BYTE
+from connection import ConnectionError
+
+from blessed import Terminal
+
+import io
+import threading
+import time
+
+
+MARKER = b'done!'
+# bytes per read, e.g. USB full speed bulk packets
+PACKET = 64
+
+
+def original_repl_serial(self, serial_ok, started):
+    """_repl_serial before incremental decoding"""
+    term = Terminal()
+    try:
+        with serial_ok, term.raw():
+            started.set()
+            while not self._quit_serial_reader:
+                if not self._serial.wait(0.4):
+                    continue
+                n = self._serial.in_waiting
+                if n > 0:
+                    data = self._serial.read(n)
+                    print(data.decode('utf-8'), end='', flush=True)
+    except ConnectionError:
+        self.disconnect()
+    except Exception as e:
+        self.error = e
+    finally:
+        started.set()
+
+
+class Sink(io.RawIOBase):
+    """Collects everything written"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        with self.lock:
+            self.data += b
+        return len(b)
+
+    def done(self):
+        with self.lock:
+            return self.data.find(MARKER) >= 0
+
+
+def keys(board, command, sink, times):
+    """getch sending command, then quitting once all output arrived
+       or the reader failed"""
+    pending = list(command + b'\r')
+
+    def getch():
+        if pending:
+            c = bytes((pending.pop(0),))
+            if not pending:
+                times.append((time.perf_counter(), time.process_time()))
+            return c
+        while not (sink.done() or board.error):
+            time.sleep(0.001)
+        times.append((time.perf_counter(), time.process_time()))
+        return QUIT_REPL_BYTE
+    return getch
+
+
+def run(board, text, lines):
+    """Print lines of text in the repl, returns seconds, host cpu seconds,
+       bytes of output and whether it arrived intact; None if the reader failed"""
+    command = "for i in range({}): print('{{:6d}} {}'.format(i))\rprint('do'+'ne!')".format(
+        lines, text).encode('utf-8')
+    sink = Sink()
+    stdout = sys.stdout
+    sys.stdout = io.TextIOWrapper(io.BufferedWriter(sink), encoding='utf-8')
+    times = []
+    try:
+        board.repl(keys(board, command, sink, times))
+    finally:
+        sys.stdout.flush()
+        sys.stdout = stdout
+    if board.error:
+        return None
+    out = bytes(sink.data)
+    expected = '\n'.join('{:6d} {}'.format(i, text) for i in range(lines)).encode('utf-8')
+    ok = expected.replace(b'\n', b'\r\n') in out
+    (start, cpu_start), (end, cpu_end) = times[-2:]
+    return end - start, cpu_end - cpu_start, len(out), ok
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    new = Board._repl_serial
+    print("{} lines, reads of at most {} bytes".format(lines, PACKET))
+    print("{:>10s} {:>10s} {:>10s} {:>10s} {:>12s} {:>8s}".format(
+        "output", "reader", "time [s]", "cpu [s]", "rate [kB/s]", "intact"))
+    server = FakeBoardProcess()
+    try:
+        boards = connect(server)
+        board = boards.default
+        read = board._serial.read
+        board._serial.read = lambda n: read(min(n, PACKET))
+        for label, text in (("ascii", "temperature 21.5 C humidity 40 %"),
+                            ("utf-8", "température 21.5 °C — humidité 40 % 😀")):
+            # the original reader may fail, run it last
+            for name, reader in (("new", new), ("original", original_repl_serial)):
+                Board._repl_serial = reader
+                board.error = None
+                res = run(board, text, lines)
+                if res is None:
+                    print("{:>10s} {:>10s} {:>10s}".format(
+                        label, name, type(board.error).__name__))
+                    continue
+                elapsed, cpu, size, ok = res
+                print("{:>10s} {:>10s} {:>10.2f} {:>10.2f} {:>12.0f} {:>8s}".format(
+                    label, name, elapsed, cpu, size / 1024 / elapsed, str(ok)))
+        Board._repl_serial = new
+        board.disconnect()
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""Pasting code into the interactive repl.
+
+Pastes a function of about 200 lines into the fake board's repl, which
+auto-indents continuation lines like MicroPython. Compares forwarding one
+key per write (the original behaviour, as with slow typing) with sending
+the burst as one block in paste mode. Reports writes to the connection,
+time until the result is printed, and whether the function worked.
+
+    python bench/repl_paste.py [lines]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from download import FakeBoardProcess
+from repl_output import Sink
+from telnet import connect
+
+from board import QUIT_REPL_BYTE
+
+import io
+import time
+
+
+# board idle this long: done
+IDLE = 0.5
+
+
+def code(lines):
+    """Function with lines of body, call printing the result"""
+    body = ['    total = 0', '    for i in range(3):', '        if i:', '            total += i']
+    body += ['    x{0} = {0}'.format(i) for i in range(lines - len(body) - 1)]
+    body.append('    return total + x{}'.format(lines - 6))
+    src = '\n'.join(['def f():'] + body + ['', "print('result', f())", ''])
+    return src.encode(), 'result {}'.format(3 + lines - 6).encode()
+
+
+def keys(sink, data, burst, times):
+    """getch: data as one burst or key by key, quits when the board is idle"""
+    pending = [data] if burst else [bytes((b,)) for b in data]
+
+    def getch():
+        if pending:
+            if not times:
+                times.append(time.perf_counter())
+            return pending.pop(0)
+        size, changed = -1, time.perf_counter()
+        while time.perf_counter() - changed < IDLE:
+            time.sleep(0.01)
+            if len(sink.data) != size:
+                size, changed = len(sink.data), time.perf_counter()
+        times.append(changed)
+        return QUIT_REPL_BYTE
+    return getch
+
+
+def run(board, data, burst):
+    """Paste data, returns writes, seconds, output"""
+    sink = Sink()
+    writes = []
+    write = board._serial.write
+    board._serial.write = lambda b: writes.append(len(b)) or write(b)
+    stdout = sys.stdout
+    sys.stdout = io.TextIOWrapper(io.BufferedWriter(sink), encoding='utf-8')
+    times = []
+    try:
+        board.repl(keys(sink, data, burst, times))
+    finally:
+        sys.stdout.flush()
+        sys.stdout = stdout
+        board._serial.write = write
+    return len(writes), times[-1] - times[0], bytes(sink.data)
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    data, result = code(lines)
+    print("{} lines, {} bytes".format(lines, len(data)))
+    print("{:>10s} {:>8s} {:>10s} {:>10s}".format("keys", "writes", "time [s]", "result"))
+    server = FakeBoardProcess()
+    try:
+        boards = connect(server)
+        board = boards.default
+        for name, burst in (("typed", False), ("pasted", True)):
+            writes, elapsed, out = run(board, data, burst)
+            if result in out:
+                outcome = "ok"
+            else:
+                errors = [l for l in out.split(b'\r\n') if l.endswith(b'Error')
+                          or b'Error:' in l]
+                outcome = errors[0].split(b':')[0].decode() if errors else "missing"
+            print("{:>10s} {:>8d} {:>10.2f} {:>10s}".format(name, writes, elapsed, outcome))
+        board.disconnect()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""Interrupted transfers: cp --resume after a dropped connection.
+
+Copies a file to and from a fake board behind a latency proxy limited to
+rate_kbs, drops the connection half way, reconnects and resumes. Reports
+the time and the data sent again, compared to restarting from byte 0.
+The resume checks, also after a corrupted block (per-block CRC32), are in
+tests/test_resume.py.
+
+    python bench/resume.py [size_kb [delay_ms [rate_kbs]]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from latency import LatencyProxy
+from telnet import connect
+
+from connection import ConnectionError
+from fileops import cp
+
+import tempfile
+import threading
+import time
+
+
+def interrupted(proxy, cut_after, src, dst, **config):
+    """cp src dst, connection dropped after cut_after s"""
+    boards = connect(proxy, compress=False, **config)
+    timer = threading.Timer(cut_after, proxy.cut)
+    timer.start()
+    try:
+        res = cp(boards, src, dst)
+    except ConnectionError:
+        res = None
+    timer.cancel()
+    assert res is None, "transfer completed before the connection was cut"
+
+
+def resumed(proxy, src, dst, resume=True, **config):
+    """cp --resume src dst, returns time, bytes on the wire"""
+    boards = connect(proxy, compress=False, **config)
+    board = boards.default
+    traffic = sum(board.traffic)
+    start = time.perf_counter()
+    assert cp(boards, src, dst, resume=resume), "resume failed"
+    elapsed = time.perf_counter() - start
+    traffic = sum(board.traffic) - traffic
+    board.disconnect()
+    return elapsed, traffic
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 128 * 1024
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    rate = float(sys.argv[3]) * 1024 if len(sys.argv) > 3 else 50 * 1024
+    server = FakeBoardServer().start()
+    proxy = LatencyProxy(server.address, delay, rate=rate).start()
+    tmp = tempfile.mkdtemp()
+    src = os.path.join(tmp, 'src')
+    dst = os.path.join(tmp, 'dst')
+    board_file = os.path.join(server.root, 'flash', 'data')
+    data = os.urandom(size)
+    with open(src, 'wb') as f:
+        f.write(data)
+    cut_after = size / rate / 2
+    print("{} kB, {:.0f} ms one-way delay, {:.0f} kB/s link, cut after {:.1f} s".format(
+        size // 1024, delay * 1000, rate / 1024, cut_after))
+    print("{:>10s} {:>12s} {:>12s} {:>10s} {:>12s}".format(
+        "direction", "mode", "part [kB]", "time [s]", "wire [kB]"))
+
+    # upload, resumed and restarted from byte 0
+    for resume in (True, False):
+        interrupted(proxy, cut_after, src, '/flash/data')
+        part = os.path.getsize(board_file + '.part')
+        elapsed, traffic = resumed(proxy, src, '/flash/data', resume)
+        print("{:>10s} {:>12s} {:>12.1f} {:>10.2f} {:>12.1f}".format(
+            "up", "resume" if resume else "restart", part / 1024, elapsed, traffic / 1024))
+        # not a delta upload next time
+        os.remove(board_file)
+
+    # download
+    with open(board_file, 'wb') as f:
+        f.write(data)
+    interrupted(proxy, cut_after, '/flash/data', dst)
+    part = os.path.getsize(dst + '.part')
+    elapsed, traffic = resumed(proxy, '/flash/data', dst)
+    print("{:>10s} {:>12s} {:>12.1f} {:>10.2f} {:>12.1f}".format(
+        "down", "resume", part / 1024, elapsed, traffic / 1024))
+
+
+if __name__ == "__main__":
+    main()
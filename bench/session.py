@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+"""Raw REPL session: per-command overhead, including after errors.
+
+Alternates failing and successful commands on a fake board behind a
+latency proxy and reports time per command and the number of soft resets
+(the fake board emulates ESP32 boot time).
+
+    python bench/session.py [commands [delay_ms]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer, FakeBoard
+from latency import LatencyProxy
+from telnet import connect
+
+from board import BoardError
+from fileops import get_stat
+
+import time
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    server = FakeBoardServer(reset_time=0.8).start()
+    board = connect(LatencyProxy(server.address, delay).start()).default
+    board.remote_eval(get_stat, '/flash')
+    resets = FakeBoard.resets
+    start = time.perf_counter()
+    for i in range(commands // 2):
+        try:
+            board.exec("1/0")
+        except BoardError:
+            pass
+        assert board.remote_eval(get_stat, '/flash')[0] & 0x4000
+    # interrupted command
+    board._exec_no_output("import time\nwhile True: time.sleep(0.01)")
+    board.remote_eval(get_stat, '/flash')
+    elapsed = time.perf_counter() - start
+    print("{} commands, {:.0f} ms one-way delay: {:.1f} ms/command, {} soft resets".format(
+        commands + 1, delay * 1000, elapsed / (commands + 1) * 1000, FakeBoard.resets - resets))
+    board.disconnect()
+
+
+if __name__ == "__main__":
+    main()
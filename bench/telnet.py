@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""Telnet transport: handshake and file transfer against a fake board.
+
+Starts bench/fakerepl.py in a background thread, connects to it through
+TelnetConnection, copies files to and from the board and reports the
+transfer throughput. Login and IAC handling are checked in
+tests/test_telnet.py.
+
+    python bench/telnet.py [size_kb ...]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+
+from activeboards import ActiveBoards
+from config import Config
+from fileops import cp, cat
+import printing
+
+import io
+import random
+import tempfile
+import time
+
+
+def connect(server, **config):
+    """ActiveBoards connected to the fake board via telnet"""
+    printing.quiet(True)
+    cfg = Config(os.path.join(tempfile.mkdtemp(), 'shell49_rc.py'))
+    config.setdefault('autotune', False)
+    for option, value in config.items():
+        cfg.set(0, option, value)
+    boards = ActiveBoards(cfg)
+    boards.connect_telnet(server.address)
+    return boards
+
+
+def transfer(boards, server, size):
+    """Upload and download size random bytes, return times"""
+    tmp = tempfile.mkdtemp()
+    src = os.path.join(tmp, 'src.txt')
+    # text, the download path (cat) decodes utf-8
+    data = bytes(random.choice(b'abcdefghijklmnopqrstuvwxyz \n') for _ in range(size))
+    with open(src, 'wb') as f:
+        f.write(data)
+    start = time.perf_counter()
+    assert cp(boards, src, '/flash/data.bin'), "upload failed"
+    up = time.perf_counter() - start
+    out = io.StringIO()
+    start = time.perf_counter()
+    cat(boards, '/flash/data.bin', out)
+    down = time.perf_counter() - start
+    return up, down
+
+
+def main():
+    sizes = [int(s) * 1024 for s in sys.argv[1:]] or [1024, 64 * 1024, 200 * 1024]
+    server = FakeBoardServer().start()
+    start = time.perf_counter()
+    boards = connect(server)
+    board = boards.default
+    print("handshake: connected to {} (id={}) in {:.3f} s".format(
+        board.address, board.id, time.perf_counter() - start))
+    print("{:>10s} {:>12s} {:>12s}".format("size", "up [kB/s]", "down [kB/s]"))
+    for size in sizes:
+        up, down = transfer(boards, server, size)
+        print("{:>10d} {:>12.1f} {:>12.1f}".format(size, size / 1024 / up, size / 1024 / down))
+    board.disconnect()
+
+
+if __name__ == "__main__":
+    main()
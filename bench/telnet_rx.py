@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""Benchmark: telnet receive path.
+
+Simulates downloading a file over telnet: data arrives in TCP segment
+sized pieces and is consumed in transfer blocks, as recv_file_from_remote
+does. Compares the original deque-of-ints fifo with ByteFifo.
+
+    python bench/telnet_rx.py [size_kb [block_size]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from connection import ByteFifo
+
+from collections import deque
+import time
+
+SEGMENT = 1460
+
+
+class DequeFifo:
+    """The original TelnetConnection receive path."""
+
+    def __init__(self):
+        self._fifo = deque()
+
+    def __len__(self):
+        return len(self._fifo)
+
+    def extend(self, data):
+        self._fifo.extend(data)
+
+    def read(self, size):
+        data = b''
+        while len(data) < size and len(self._fifo) > 0:
+            data += bytes([self._fifo.popleft()])
+        return data
+
+
+def download(fifo, payload, block_size):
+    """Receive payload in segments, consume it in blocks."""
+    out = bytearray()
+    pos = 0
+    start = time.perf_counter()
+    while len(out) < len(payload):
+        while len(fifo) < block_size and pos < len(payload):
+            fifo.extend(payload[pos:pos + SEGMENT])
+            pos += SEGMENT
+        out += fifo.read(block_size)
+    elapsed = time.perf_counter() - start
+    assert out == payload, "corrupted download"
+    return elapsed
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 200 * 1024
+    block_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    payload = os.urandom(size)
+    print("download {} kB in {} byte blocks".format(size // 1024, block_size))
+    for name, fifo in (("deque", DequeFifo()), ("ByteFifo", ByteFifo())):
+        t = download(fifo, payload, block_size)
+        print("{:>10s} {:8.4f} s {:10.1f} kB/s".format(name, t, size / 1024 / t))
+
+
+if __name__ == "__main__":
+    main()
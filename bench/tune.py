@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""Transfer autotuning: tune on first connect over an emulated wireless link.
+
+Connects to the fake board through a LatencyProxy with autotune enabled,
+reports the parameters chosen and compares upload and download times with
+those of the default configuration. Tuning itself is checked in
+tests/test_tune.py.
+
+    python bench/tune.py [size_kb [delay_ms [rate_kbs]]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from download import FakeBoardProcess
+from latency import LatencyProxy
+from telnet import connect, transfer
+
+import time
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 256 * 1024
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    rate = int(sys.argv[3]) * 1024 if len(sys.argv) > 3 else 1024 * 1024
+    board = FakeBoardProcess()
+    proxy = LatencyProxy(board.address, delay=delay, rate=rate).start()
+    print("{} kB, delay {:.0f} ms, rate {} kB/s".format(
+        size // 1024, delay * 1000, rate // 1024))
+    print("{:>10s} {:>12s} {:>8s} {:>10s} {:>10s}".format(
+        "config", "buffer_size", "window", "up [s]", "down [s]"))
+
+    boards = connect(proxy, buffer_size=1024, compress=False)
+    dev = boards.default
+    up, down = transfer(boards, board, size)
+    print("{:>10s} {:>12d} {:>8d} {:>10.2f} {:>10.2f}".format(
+        "default", dev.buffer_size, dev.xfer_window, up, down))
+    dev.disconnect()
+
+    start = time.perf_counter()
+    boards = connect(proxy, buffer_size=1024, compress=False, autotune=True)
+    elapsed = time.perf_counter() - start
+    dev = boards.default
+    tuned = dev.get_config('xfer_tuned')
+    up, down = transfer(boards, board, size)
+    print("{:>10s} {:>12d} {:>8d} {:>10.2f} {:>10.2f}".format(
+        "tuned", dev.buffer_size, dev.xfer_window, up, down))
+    print("tuning took {:.1f} s: {}".format(elapsed, tuned))
+
+    dev.disconnect()
+    board.stop()
+
+
+if __name__ == "__main__":
+    main()
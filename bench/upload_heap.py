@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark: board side receive loop of uploads (recv_file_from_host).
+
+Runs the helper, as sent to the board, in the fake board namespace with
+the host's blocks already queued on stdin. Compares the original loop
+(read buffer copied into a second write buffer) with the loop that reads
+into a single buffer through memoryviews. Reports time, peak traced memory
+(tracemalloc, the stand-in for the board heap) and the peak the helper
+reports itself.
+
+    python bench/upload_heap.py [size_kb [buffer_size]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoard
+
+from board import helper_source
+from fileops import block_crc, block_size, encode, recv_file_from_host
+
+import io
+import tempfile
+import time
+import tracemalloc
+
+
+def original_recv_file_from_host(src_file, dst_filename, filesize, offset=0, window=1,
+                                 encoding=None):
+    """recv_file_from_host before the single buffer"""
+    import os
+    import sys
+    import binascii
+    import gc
+    crc32 = getattr(binascii, 'crc32', None)
+    part_filename = dst_filename + '.part'
+    try:
+        dst_file = open(part_filename, 'ab' if offset else 'wb')
+    except:
+        sys.stdout.write('0')
+        return False
+    ok = True
+    try:
+        with dst_file:
+            bytes_remaining = filesize - offset
+            buf_size = BUFFER_SIZE
+            if HAS_BUFFER:
+                block_size = buf_size
+            elif encoding == 'base64':
+                block_size = buf_size // 4 * 3
+            else:
+                block_size = buf_size // 2
+            write_buf = bytearray(buf_size + 8)
+            read_buf = bytearray(buf_size + 8)
+            gc.collect()
+            window = max(1, min(window, gc.mem_free() // (8 * buf_size), 63))
+            sys.stdout.write(chr(0x30 + window))
+            seq = 0
+            while bytes_remaining > 0:
+                block = min(bytes_remaining, block_size)
+                if HAS_BUFFER:
+                    read_size = block
+                elif encoding == 'base64':
+                    read_size = (block + 2) // 3 * 4
+                else:
+                    read_size = block * 2
+                buf_remaining = read_size + 8
+                buf_index = 0
+                while buf_remaining > 0:
+                    if HAS_BUFFER:
+                        bytes_read = sys.stdin.buffer.readinto(
+                            read_buf, buf_remaining)
+                    else:
+                        bytes_read = sys.stdin.readinto(
+                            read_buf, buf_remaining)
+                    if bytes_read > 0:
+                        write_buf[buf_index:buf_index + bytes_read] = read_buf[0:bytes_read]
+                        buf_index += bytes_read
+                        buf_remaining -= bytes_read
+                if ok:
+                    try:
+                        if HAS_BUFFER:
+                            data = write_buf[0:read_size]
+                        elif encoding == 'base64':
+                            data = binascii.a2b_base64(write_buf[0:read_size])
+                        else:
+                            data = binascii.unhexlify(write_buf[0:read_size])
+                        if crc32 and '{:08x}'.format(crc32(data)).encode() != \
+                           write_buf[read_size:read_size + 8]:
+                            raise ValueError
+                        dst_file.write(data)
+                    except:
+                        ok = False
+                sys.stdout.write(('\x06' if ok else '\x15') + chr(0x30 + seq % 64))
+                seq += 1
+                bytes_remaining -= block
+        if ok:
+            try:
+                os.rename(part_filename, dst_filename)
+            except OSError:
+                os.remove(dst_filename)
+                os.rename(part_filename, dst_filename)
+        return ok
+    except:
+        return False
+
+
+class Session:
+    """Board end of a connection: input queued in advance, output collected"""
+
+    def __init__(self, data):
+        self._in = io.BytesIO(data)
+        self.out = bytearray()
+
+    def read(self, n):
+        return self._in.read(n)
+
+    def write(self, data):
+        self.out += data
+
+
+def run(func, data, encoding, buffer_size):
+    """Upload data with board helper func, returns time, peak, session output"""
+    buffered = encoding is None
+    blocks = bytearray()
+    n = block_size(encoding, buffer_size)
+    # blocks start with 'B' since the host can stop after a NAK
+    prefix = b'B' if func is recv_file_from_host else b''
+    for i in range(0, len(data), n):
+        blocks += prefix + encode(data[i:i + n], encoding) + block_crc(data[i:i + n])
+    session = Session(bytes(blocks))
+    root = tempfile.mkdtemp()
+    os.mkdir(os.path.join(root, 'flash'))
+    board = FakeBoard(session, root, buffered=buffered)
+    src, _ = helper_source(func, buffered, buffer_size, 0)
+    exec(src, board._globals)
+    helper = board._globals[func.__name__]
+    tracemalloc.start()
+    start = time.perf_counter()
+    assert helper(None, '/flash/data', len(data), 0, 8, encoding), "upload failed"
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    with open(os.path.join(root, 'flash', 'data'), 'rb') as f:
+        assert f.read() == data, "upload corrupted"
+    return elapsed, peak, bytes(session.out)
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 1024 * 1024
+    buffer_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    data = os.urandom(size)
+    print("{} kB, buffer_size {}".format(size // 1024, buffer_size))
+    print("{:>10s} {:>10s} {:>10s} {:>12s} {:>16s}".format(
+        "encoding", "loop", "time [s]", "peak [kB]", "reported [kB]"))
+    for encoding in (None, 'base64'):
+        for name, func in (("original", original_recv_file_from_host),
+                           ("readinto", recv_file_from_host)):
+            elapsed, peak, out = run(func, data, encoding, buffer_size)
+            # window, buffer size, acks, heap peak
+            reported = int(out[-8:], 16) / 1024 if func is recv_file_from_host else 0
+            print("{:>10s} {:>10s} {:>10.3f} {:>12.1f} {:>16s}".format(
+                str(encoding), name, elapsed, peak / 1024,
+                "{:.1f}".format(reported) if reported else "-"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""WebREPL transport: native file transfer against a fake board.
+
+Copies files to and from a fake WebREPL board (native put/get protocol)
+and, for comparison, a fake telnet board (raw REPL transfer helpers).
+The handshake and the binary put/get are checked in tests/test_webrepl.py.
+
+    python bench/webrepl.py [size_kb ...]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+
+from activeboards import ActiveBoards
+from config import Config
+from fileops import cp, cat
+import printing
+
+import io
+import tempfile
+import time
+
+
+def connect(server, webrepl):
+    printing.quiet(True)
+    cfg = Config(os.path.join(tempfile.mkdtemp(), 'shell49_rc.py'))
+    cfg.set(0, 'autotune', False)
+    boards = ActiveBoards(cfg)
+    if webrepl:
+        boards.connect_webrepl(server.address, 'python')
+    else:
+        boards.connect_telnet(server.address)
+    return boards
+
+
+def transfer(boards, server, size):
+    """Upload and download size random bytes, return times"""
+    tmp = tempfile.mkdtemp()
+    src = os.path.join(tmp, 'src.bin')
+    dst = os.path.join(tmp, 'dst.bin')
+    # text, the raw REPL download path (cat) decodes utf-8
+    data = os.urandom(size).hex().encode()[:size]
+    with open(src, 'wb') as f:
+        f.write(data)
+    start = time.perf_counter()
+    assert cp(boards, src, '/flash/data.bin'), "upload failed"
+    up = time.perf_counter() - start
+    start = time.perf_counter()
+    if boards.default.has_file_transfer:
+        assert cp(boards, '/flash/data.bin', dst), "download failed"
+        down = time.perf_counter() - start
+    else:
+        out = io.StringIO()
+        cat(boards, '/flash/data.bin', out)
+        down = time.perf_counter() - start
+    return up, down
+
+
+def main():
+    sizes = [int(s) * 1024 for s in sys.argv[1:]] or [1024, 64 * 1024, 200 * 1024]
+    print("{:>8s} {:>10s} {:>12s} {:>12s}".format("proto", "size", "up [kB/s]", "down [kB/s]"))
+    for name, webrepl in (("telnet", False), ("webrepl", True)):
+        server = FakeBoardServer(webrepl=webrepl).start()
+        boards = connect(server, webrepl)
+        for size in sizes:
+            up, down = transfer(boards, server, size)
+            print("{:>8s} {:>10d} {:>12.1f} {:>12.1f}".format(
+                name, size, size / 1024 / up, size / 1024 / down))
+        boards.default.disconnect()
+
+
+if __name__ == "__main__":
+    main()
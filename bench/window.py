@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+"""Sliding-window file transfer: throughput vs. window size.
+
+Copies a file to and from a fake board behind a latency proxy for
+increasing xfer_window_network settings and reports the throughput in
+both directions. Delta uploads and deflate are off so that every round
+sends the whole file.
+
+    python bench/window.py [size_kb [delay_ms]]
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from fakerepl import FakeBoardServer
+from latency import LatencyProxy
+from telnet import connect, transfer
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 64 * 1024
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    server = FakeBoardServer().start()
+    proxy = LatencyProxy(server.address, delay).start()
+    print("{} kB, {:.0f} ms one-way delay, 1024 byte blocks".format(size // 1024, delay * 1000))
+    print("{:>10s} {:>12s} {:>12s}".format("window", "up [kB/s]", "down [kB/s]"))
+    for window in (1, 2, 4, 8, 16, 32):
+        # raw transfers: no delta upload of the file left by the last
+        # round, no deflate
+        boards = connect(proxy, buffer_size=1024, xfer_window_network=window,
+                         delta_min_size=1 << 30, compress=False)
+        up, down = transfer(boards, server, size)
+        print("{:>10d} {:>12.1f} {:>12.1f}".format(window, size / 1024 / up, size / 1024 / down))
+        boards.default.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 from board import Board, BoardError
+from connection import ConnectionError
 from printing import qprint
+from tune import tune
 
 class ActiveBoards:
     """List of connected boards."""
@@ -53,6 +55,28 @@ class ActiveBoards:
             if b.match(board): return b
         return None
 
+    def select(self, names=None):
+        """List of boards matching names (id, name, port, ip or url),
+        all boards if names is None. BoardError if a name does not match."""
+        if names is None:
+            return list(self.boards())
+        selected = []
+        for name in names:
+            b = self.find_board(name)
+            if not b:
+                raise BoardError("No board '{}'".format(name))
+            if b not in selected:
+                selected.append(b)
+        return selected
+
+    def view(self, board):
+        """ActiveBoards with the same boards and board as default.
+        Commands run against a view of each board to target many boards."""
+        v = ActiveBoards(self.config)
+        v._boards = list(self._boards)
+        v._default_board = board
+        return v
+
     def connected(self, name):
         """Return True if board with specified name/id/port/ip/url is already connected."""
         return self.find_board(name) != None
@@ -68,16 +92,21 @@ class ActiveBoards:
         qprint("Connecting via serial to {} @ {} baud ...".format(port, baudrate))
         b = Board(self.config)
         b.connect_serial(port, baudrate)
-        self._boards.append(b)
-        if not self._default_board: self._default_board = b
+        self._add(b)
 
     def connect_telnet(self, ip_address, user='micro', pwd='python'):
         """Connect to MicroPython board at specified IP address."""
         qprint("Connecting via telnet to '{}' ...".format(ip_address))
         b = Board(self.config)
         b.connect_telnet(ip_address, user, pwd)
-        self._boards.append(b)
-        if not self._default_board: self._default_board = b
+        self._add(b)
+
+    def connect_webrepl(self, ip_address, pwd='python'):
+        """Connect to MicroPython board at specified IP address via WebREPL."""
+        qprint("Connecting via WebREPL to '{}' ...".format(ip_address))
+        b = Board(self.config)
+        b.connect_webrepl(ip_address, pwd)
+        self._add(b)
 
     def get_dev_and_path(self, filename):
         """Check if filename is located on one of the connected boards.
@@ -99,3 +128,14 @@ class ActiveBoards:
                     board_filename = '/'
                 return (b, board_filename)
         return (None, filename)
+
+    def _add(self, board):
+        """Add connected board, tune transfers the first time it is seen (config autotune)"""
+        if board.get_config('autotune', False) and board.get_config('xfer_tuned') is None:
+            try:
+                tune(board)
+            except (BoardError, ConnectionError, OSError) as e:
+                # tuning is optional, keep the default parameters
+                qprint("{}: not tuned, {}".format(board.name, e))
+        self._boards.append(board)
+        if not self._default_board: self._default_board = board
@@ -1,13 +1,18 @@
-from connection import SerialConnection, TelnetConnection, ConnectionError
-from fileops import set_fileops_params
+from connection import SerialConnection, TelnetConnection, WebReplConnection, ConnectionError
 from autobool import AutoBool
 from printing import dprint, eprint, qprint
 import printing
 
-from threading import Thread
+from threading import Event, Thread
+import codecs
+import sys
 import time
 import inspect
 import traceback
+import tokenize
+import hashlib
+import struct
+import io
 import os
 
 from blessed import Terminal
@@ -15,6 +20,15 @@ from blessed import Terminal
 QUIT_REPL_CHAR = 'X'
 QUIT_REPL_BYTE = bytes((ord(QUIT_REPL_CHAR) - ord('@'),))  # Control-X
 
+# raw repl (without raw-paste) upload slice size
+RAW_SLICE = 256
+
+# most bytes the repl reader collects before writing them to stdout
+REPL_CHUNK = 16384
+
+# maximum number of calls per remote_batch exec (bounds memory on the board)
+REMOTE_BATCH_MAX = 64
+
 
 class BoardError(Exception):
     """Errors relating to board connections"""
@@ -35,58 +49,85 @@ class Board(object):
         self._serial = None
         self._id = None
         self._has_buffer = False
+        # deflate support: 0 none, 1 decompress, 2 compress and decompress
+        self._deflate = 0
+        # binascii has base64 support
+        self._base64 = False
         self._root_dirs = []
         # repl status (raw/normal/unknown)
         self._status = self.STATUS_UNKNOWN
+        # board supports raw-paste mode (None: not yet known)
+        self._raw_paste = None
+        # helpers defined on the board, name -> source digest
+        self._helpers = {}
+        # peak heap use reported by the board after the last upload (bytes)
+        self.heap_peak = None
 
     ###################################################################
     # connection
 
     def connect_serial(self, port, baudrate):
         """Connect to board via serial connection"""
+        start_time = time.time()
         self._serial = SerialConnection(port, baudrate)
-        self._board_characteristics()
+        self._board_characteristics(start_time)
         if not self.connected:
             raise BoardError("Failed to establish connection to board at '{}'".format(port))
 
     def connect_telnet(self, ip, user, password):
         """Connect via telnet"""
+        start_time = time.time()
         self._serial = TelnetConnection(ip, user, password)
-        self._board_characteristics()
+        self._board_characteristics(start_time)
+        if not self.connected:
+            raise BoardError("Failed to establish connection to board at '{}'".format(ip))
+
+    def connect_webrepl(self, ip, password):
+        """Connect via WebREPL"""
+        start_time = time.time()
+        self._serial = WebReplConnection(ip, password)
+        self._board_characteristics(start_time)
         if not self.connected:
             raise BoardError("Failed to establish connection to board at '{}'".format(ip))
 
-    def _board_characteristics(self):
-        """Get device id and other updates"""
-        # get unique board id
-        self._id = self.remote_eval(get_unique_id, 'BOARD HAS NO ID')
-        qprint("Connected to '{}' (id={}) ...".format(self.name, self.id), end='', flush=True)
-        # check buffer
-        self._has_buffer = self.remote_eval(test_buffer)
-        qprint(" has_buffer={}".format(self._has_buffer), end='', flush=True)
-        if self._serial.is_circuit_python:
-            qprint()
+    def _board_characteristics(self, start_time):
+        """Get device id and other characteristics, sync time.
+        Characteristics are cached in the configuration, keyed by board id
+        and firmware version, a reconnect only confirms the id."""
+        known = {}
+        for board_id in self._config.board_ids():
+            c = self._config.get(board_id, 'characteristics')
+            # entries cached by older versions of probe are refreshed
+            if c and all(k in c for k in ('deflate', 'base64')):
+                known[board_id] = c['firmware']
+        now = None
+        if not self._serial.is_circuit_python:
+            now = time.localtime(time.time())[:6]
+        self._id, root, c = self.remote_eval(probe, known, now)
+        cached = c is None
+        if cached:
+            c = self.get_config('characteristics')
         else:
-            # get root dirs
-            qprint("{} dirs=".format(self._has_buffer), end='', flush=True)
-            self._root_dirs = ['/{}/'.format(dir) for dir in self.remote_eval(listroot)]
-            qprint(self._root_dirs, end='', flush=True)
-            if not self.get_config('mac'):
-                qprint(" mac=", end='', flush=True)
-                self.set_config('mac', self.remote_eval(get_mac_address))
-                qprint(self.get_config('mac'), end='', flush=True)
-            # sync time
-            now = time.localtime(time.time())
-            qprint(" sync time ...")
-            self.remote(set_time, now.tm_year, now.tm_mon, now.tm_mday,
-                        now.tm_hour, now.tm_min, now.tm_sec)
-        qprint()
+            self.set_config('characteristics', c)
+            if c['mac']:
+                self.set_config('mac', c['mac'])
+        self._has_buffer = c['has_buffer']
+        self._deflate = c['deflate']
+        self._base64 = c['base64']
+        if not self._serial.is_circuit_python:
+            self._root_dirs = ['/{}/'.format(dir) for dir in root]
+        qprint("Connected to '{}' (id={}) in {:.2f} s, has_buffer={} dirs={}{}".format(
+            self.name, self.id, time.time() - start_time, self._has_buffer,
+            self._root_dirs, ' (cached)' if cached else ''))
 
     def disconnect(self):
         """Disconnect and release port / ip"""
         dprint("Disconnecting board", self._id)
         self._id = None
         self._root_dirs = []
+        self._raw_paste = None
+        self._helpers = {}
+        self._status = self.STATUS_UNKNOWN
         if self._serial:
             self._serial.close()
             self._serial = None
@@ -122,6 +163,11 @@ class Board(object):
         """Board is connected via telnet"""
         return self._serial.is_telnet
 
+    @property
+    def is_wireless(self):
+        """Board is connected over the network"""
+        return self._serial.is_wireless
+
     @property
     def name(self):
         """Get board name"""
@@ -174,6 +220,64 @@ class Board(object):
         """Board upy io has buffer"""
         return self._has_buffer
 
+    @property
+    def deflate(self):
+        """Board deflate support: 0 none, 1 decompress, 2 compress and decompress"""
+        return self._deflate
+
+    @property
+    def xfer_encoding(self):
+        """File data encoding on the wire: None (binary, board has buffer),
+        'base64' or 'hex' (config xfer_encoding)"""
+        if self._has_buffer:
+            return None
+        if self._base64 and self.get_config('xfer_encoding', 'base64') == 'base64':
+            return 'base64'
+        return 'hex'
+
+    @property
+    def xfer_window(self):
+        """Maximum number of blocks in flight in file transfers"""
+        if self._serial.is_wireless:
+            return self.get_config('xfer_window_network', 8)
+        return self.get_config('xfer_window_serial', 1)
+
+    @property
+    def xfer_window_option(self):
+        """Config option of xfer_window for the connection type"""
+        return 'xfer_window_network' if self._serial.is_wireless else 'xfer_window_serial'
+
+    @property
+    def buffer_size(self):
+        """Size of the board's transfer buffer (config buffer_size)"""
+        return self.get_config('buffer_size', default=128)
+
+    @property
+    def traffic(self):
+        """(bytes sent, bytes received) over the connection"""
+        return (self._serial.bytes_sent, self._serial.bytes_received)
+
+    @property
+    def has_file_transfer(self):
+        """Connection has native file transfer (e.g. WebREPL)"""
+        return self._serial.has_file_transfer
+
+    def put_file(self, src_file, dst_filename, filesize):
+        """Upload open src_file with native file transfer. True on success."""
+        try:
+            return self._serial.put_file(src_file, dst_filename, filesize)
+        except ConnectionError:
+            self.disconnect()
+            raise
+
+    def get_file(self, src_filename, dst_file):
+        """Download to open dst_file with native file transfer. True on success."""
+        try:
+            return self._serial.get_file(src_filename, dst_file)
+        except ConnectionError:
+            self.disconnect()
+            raise
+
     def write(self, bytes):
         """Send bytes to board"""
         self._serial.write(bytes)
@@ -182,6 +286,10 @@ class Board(object):
         """Read bytes from board"""
         return self._serial.read(len)
 
+    def readinto(self, buf):
+        """Read len(buf) bytes from board into buf, returns number read"""
+        return self._serial.readinto(buf)
+
 
     ###################################################################
     # repl and remote execution
@@ -192,76 +300,38 @@ class Board(object):
         return self._status
 
     def enter_raw_repl(self):
-        """Enter raw repl if not already in this mode."""
-        if self._serial.is_circuit_python:
-            self.enter_raw_repl_cp()
-        else:
-            self.enter_raw_repl_mp()
-
-    def enter_raw_repl_cp(self):
-        """Enter raw repl if not already in this mode for CIRCUITPYTHON."""
-        # Ctrl-C twice: interrupt any running program
-        dprint("^C, abort running program")
-        self._serial.write(b'\r\x03\x03')
-
-        # Ctrl-A: enter raw REPL
-        dprint("^A, raw repl")
-        self._serial.write(b'\r\x01')
-
-        expect = b"raw REPL; CTRL-B to exit"
-        data = self._serial.read_until(1, expect)
-        if not data.endswith(expect):
-            raise BoardError('Cannot enter raw repl: expected {}, got {}'.format(expect, data))
-
-        expect = b"\r\n"
-        data = self._serial.read_until(1, expect)
-        if not data.endswith(expect):
-            raise BoardError('Cannot enter raw repl: expected {}, got {}'.format(expect, data))
+        """Enter raw repl if not already in this mode.
 
-    def enter_raw_repl_mp(self):
-        """Enter raw repl if not already in this mode for MICROPYTHON."""
-        dprint("^B^C, abort running program")
-        self._serial.write(b'\r\x02\x03')
-        time.sleep(.1)
-
-        # Attempt to get to REPL prompt, send Ctrl-C on failure.
-        expect = b'> '
-        abort = True
+        The board stays in raw repl across commands (STATUS_RAW_REPL, the
+        '>' prompt has not been read yet). Otherwise (e.g. after an
+        interrupted command or the repl) ^C interrupts any running program
+        and ^A returns to the raw repl. No soft reset, see soft_reset."""
+        if self._status == self.STATUS_RAW_REPL:
+            return
         for attempt in range(3):
+            # discard stale output, e.g. of an interrupted program
+            self._serial.read(self._serial.in_waiting)
+            dprint("^C^C^A, enter raw repl")
+            self._serial.write(b'\r\x03\x03\x01')
             try:
-                self._serial.read_until(1, expect)
-                abort = False
+                self._serial.read_until(1, b'raw REPL; CTRL-B to exit\r\n')
                 break
             except ConnectionError as err:
                 dprint('ConnectionError: {0}'.format(err))
-                self._serial.write(b'\x03')
-                time.sleep(1)
-
-        # Kickout if 3rd attempt fails
-        if abort:
+        else:
             raise ConnectionError('Failed to enter raw REPL')
+        self._status = self.STATUS_RAW_REPL
+        dprint("in raw repl")
 
-        time.sleep(.1)
-
-        # Ctrl-A: enter raw REPL
-        dprint("^A, raw repl")
-        self._serial.write(b'\r\x01')
-        expect = b'raw REPL; CTRL-B to exit\r\n'
-        data = self._serial.read_until(1, expect)
-        if not data.endswith(expect):
-            raise BoardError('Cannot enter raw repl: expected {}, got {}'.format(expect, data))
-
-        # determine required steps
-        # Note 1: no soft reset breaks telnet connection
-        # Note 2: if user pressed reset button, mode status is STATUS_NORMAL_REPL
-        #         but shell49 won't know it. Hence we cannot assume RAW_REPL.
-        #         BUT soft reset is not required.
-        if self.is_telnet or self._status == self.STATUS_RAW_REPL:
-            dprint("enter_raw_repl: already in RAW REPL state, no action")
-            return
-
-        # Ctrl-D: soft reset
+    def soft_reset(self):
+        """Soft reset board, stays in raw repl"""
+        if self._serial.is_wireless:
+            raise BoardError("Soft reset would drop the wireless connection")
+        self.enter_raw_repl()
+        self._status = self.STATUS_UNKNOWN
+        self._serial.read_until(1, b'>', timeout=1)
         dprint("^D, soft reset")
+        self._helpers = {}
         self._serial.write(b'\x04')
         expect = b'soft reboot\r\n'
         data = self._serial.read_until(1, expect)
@@ -274,10 +344,7 @@ class Board(object):
         data = self._serial.read_until(1, expect)
         if not data.endswith(expect):
             raise BoardError('Soft reset failed: expected {}, got {}'.format(expect, data))
-
-        # update board status
         self._status = self.STATUS_RAW_REPL
-        dprint("in raw repl")
 
     def exit_raw_repl(self):
         """Enter friendly (normal) repl."""
@@ -285,6 +352,17 @@ class Board(object):
         self._serial.write(b'\r\x02')
         self._status = self.STATUS_NORMAL_REPL
 
+    def _raw_prompt(self):
+        """Read the raw repl prompt, a bare '>' with nothing after it.
+        False for anything else, e.g. the banner and '>>> ' of the friendly
+        repl after a reset."""
+        try:
+            data = self._serial.read_until(1, b'>', timeout=1)
+        except ConnectionError as err:
+            dprint('ConnectionError: {0}'.format(err))
+            return False
+        return data == b'>' and self._serial.in_waiting == 0
+
     def _exec_no_output(self, cmd, data_consumer=None, timeout=10):
         """Send command (string or bytes) to board for execution.
         Pass board output to data_consumer (e.g. print).
@@ -295,20 +373,77 @@ class Board(object):
         dprint("_exec_no_output:", cmd.decode('utf-8')[:20])
         # enter raw repl (if needed) and check if we have a prompt
         self.enter_raw_repl()
+        # back to STATUS_RAW_REPL once the command has completed
+        self._status = self.STATUS_UNKNOWN
         dprint("wait for >")
-        data = self._serial.read_until(1, b'>', timeout=1)
-        if not data.endswith(b'>'):
-            raise BoardError("Cannot get response from board")
+        if not self._raw_prompt():
+            # e.g. reset by watchdog or button since the last command
+            dprint("no raw repl prompt, enter raw repl")
+            self._helpers = {}
+            self.enter_raw_repl()
+            self._status = self.STATUS_UNKNOWN
+            if not self._raw_prompt():
+                raise BoardError("Cannot get response from board")
         # send command to board
-        for i in range(0, len(cmd), 256):
-            self._serial.write(cmd[i:min(i + 256, len(cmd))])
-            time.sleep(0.01)
-        # execute command
+        start_time = time.perf_counter()
+        # short commands fit the board's input buffer, raw-paste would add a round trip
+        if len(cmd) > RAW_SLICE and self._raw_paste is not False and self._raw_paste_write(cmd):
+            mode = 'raw-paste'
+        else:
+            mode = 'raw'
+            for i in range(0, len(cmd), RAW_SLICE):
+                if i:
+                    time.sleep(0.01)
+                self._serial.write(cmd[i:min(i + RAW_SLICE, len(cmd))])
+            # execute command
+            self._serial.write(b'\x04')
+            # check if successful
+            if self._serial.read(2) != b'OK':
+                raise BoardError("Could not exec '{} ...'".format(cmd.decode('utf-8').partition('\n')[0]))
+        elapsed = time.perf_counter() - start_time
+        dprint("exec upload ({}): {} bytes in {:.3f} s, {:.1f} kB/s".format(
+            mode, len(cmd), elapsed, len(cmd) / 1024 / max(elapsed, 1e-6)))
+
+    def _raw_paste_write(self, cmd):
+        """Send cmd in raw-paste mode (MicroPython 1.14+) with flow control
+        by the board. Returns False if the board does not support it."""
+        self._serial.write(b'\x05A\x01')
+        data = self._serial.read(2)
+        if data != b'R\x01':
+            if data != b'R\x00':
+                # board does not know raw-paste, it echoes the raw repl prompt
+                expect = b'w REPL; CTRL-B to exit\r\n>'
+                data = self._serial.read_until(1, expect)
+                if not data.endswith(expect):
+                    raise BoardError('Raw-paste detection failed: got {}'.format(data))
+            dprint("raw-paste mode not supported")
+            self._raw_paste = False
+            return False
+        self._raw_paste = True
+        window_size = struct.unpack('<H', self._serial.read(2))[0]
+        window_remain = window_size
+        i = 0
+        while i < len(cmd):
+            # board sends \x01 to grant another window, \x04 to abort
+            while window_remain == 0 or self._serial.in_waiting:
+                data = self._serial.read(1)
+                if data == b'\x01':
+                    window_remain += window_size
+                elif data == b'\x04':
+                    self._serial.write(b'\x04')
+                    return True
+                else:
+                    raise BoardError('Unexpected read during raw-paste: {}'.format(data))
+            chunk = cmd[i:i + window_remain]
+            self._serial.write(chunk)
+            window_remain -= len(chunk)
+            i += len(chunk)
+        # end of data, board acknowledges with \x04 and compiles the code
         self._serial.write(b'\x04')
-        # check if successful
-        if self._serial.read(2) != b'OK':
-            self._status = self.STATUS_UNKNOWN
-            raise BoardError("Could not exec '{} ...'".format(cmd.decode('utf-8').partition('\n')[0]))
+        data = self._serial.read_until(1, b'\x04')
+        if not data.endswith(b'\x04'):
+            raise BoardError('Could not complete raw-paste: {}'.format(data))
+        return True
 
     def _exec_output(self, data_consumer=None, timeout=10):
         """Read output after exec_no_output"""
@@ -322,8 +457,9 @@ class Board(object):
         if not data_err.endswith(b'\x04'):
             raise BoardError('_exec_output expected 2nd EOF, got "{}"'.format(data))
         data_err = data_err[:-1]
+        # command completed, board is back at the raw repl prompt
+        self._status = self.STATUS_RAW_REPL
         if data_err:
-            self._status = self.STATUS_UNKNOWN
             raise BoardError("Exec -> {}".format(data_err.decode('utf-8')))
         # return result
         return data
@@ -344,10 +480,7 @@ class Board(object):
         """
         with open(os.path.expanduser(filename), 'rb') as f:
             cmds = f.read()
-        try:
-            self.exec(cmds, data_consumer=data_consumer, timeout=timeout)
-        finally:
-            self._status = self.STATUS_UNKNOWN
+        self.exec(cmds, data_consumer=data_consumer, timeout=timeout)
 
 
     ###################################################################
@@ -360,38 +493,135 @@ class Board(object):
             return 'None'
         return repr_str
 
-    def remote(self, func, *args, xfer_func=None, **kwargs):
-        """Call func with args on the micropython board."""
+    def _helper(self, func):
+        """(source, digest) of helper func for this board"""
         has_buffer = self._has_buffer
-        buffer_size = self.get_config('buffer_size', default=128)
+        buffer_size = self.buffer_size
         time_offset = self.get_config('time_offset', default=946684800)
-        set_fileops_params(has_buffer, buffer_size, time_offset)
+        return helper_source(func, has_buffer, buffer_size, time_offset)
+
+    def _remote_exec(self, helpers, call, xfer=None):
+        """Exec call on the board, first defining those of helpers
+        (name -> (source, digest)) the board does not know yet.
+        xfer() is called to handle transfers once the call is running."""
+        for attempt in range(2):
+            define = [name for name, (src, digest) in helpers.items()
+                      if self._helpers.get(name) != digest]
+            cmd = call
+            if define:
+                dprint("remote: define {}".format(', '.join(define)))
+                cmd = 'try:\n    _shell49\nexcept NameError:\n    _shell49 = {}\n' + \
+                      ''.join('exec({!r}, _shell49)\n'.format(helpers[name][0])
+                              for name in define) + call
+            try:
+                self._exec_no_output(cmd)
+                if xfer:
+                    self._xfer_ready()
+                    xfer()
+                output = self._exec_output()
+                self._helpers.update((name, digest) for name, (_, digest) in helpers.items())
+                return output
+            except BoardError as e:
+                for name in define:
+                    self._helpers.pop(name, None)
+                # registry out of sync (e.g. board was reset), define and retry
+                msg = str(e)
+                stale = '_shell49' in msg or \
+                    any("KeyError: '{}'".format(name) in msg for name in helpers)
+                if not stale or len(define) == len(helpers):
+                    raise
+                for name in helpers:
+                    self._helpers.pop(name, None)
+                dprint("remote: helpers not defined on board, retry")
+
+    def remote(self, func, *args, xfer_func=None, **kwargs):
+        """Call func with args on the micropython board.
+        func is defined once per session in the board's _shell49 namespace,
+        subsequent calls only send the call."""
         args_arr = [self._remote_repr(i) for i in args]
         kwargs_arr = ["{}={}".format(k, self._remote_repr(v)) for k, v in kwargs.items()]
-        func_str = inspect.getsource(func)
-        func_str += 'output = ' + func.__name__ + '('
-        func_str += ', '.join(args_arr + kwargs_arr)
-        func_str += ')\n'
-        func_str += 'if output is None:\n'
-        func_str += '    print("None")\n'
-        func_str += 'else:\n'
-        func_str += '    print(output)\n'
-        func_str = func_str.replace('TIME_OFFSET', '{}'.format(time_offset))
-        func_str = func_str.replace('HAS_BUFFER', '{}'.format(has_buffer))
-        func_str = func_str.replace('BUFFER_SIZE', '{}'.format(buffer_size))
-        func_str = func_str.replace('IS_UPY', 'True')
-        start_time = time.time()
-        output = self._exec_no_output(func_str)
+        name = func.__name__
+        call = '_f = _shell49[{!r}]\n'.format(name)
         if xfer_func:
-            xfer_func(self, *args, **kwargs)
-        output = self._exec_output()
+            # tell the host the helper was found before starting the transfer
+            call += 'print("\\x06", end="")\n'
+        call += 'output = _f(' + ', '.join(args_arr + kwargs_arr) + ')\n'
+        call += 'if output is None:\n'
+        call += '    print("None")\n'
+        call += 'else:\n'
+        call += '    print(output)\n'
+        xfer = None
+        if xfer_func:
+            xfer = lambda: xfer_func(self, *args, **kwargs)
+        start_time = time.time()
+        output = self._remote_exec({name: self._helper(func)}, call, xfer)
         dprint("remote: {}({}) --> {},   in {:.3} s)".format(
-            func.__name__,
+            name,
             repr(args)[1:-1],
             output,
             time.time()-start_time))
         return output
 
+    def remote_batch(self, calls):
+        """Run calls [(func, args, kwargs), ...] in a single exec on the board.
+        Returns list of results (as remote_eval) or, for calls that raised
+        an exception on the board, a BoardError."""
+        results = []
+        for i in range(0, len(calls), REMOTE_BATCH_MAX):
+            results.extend(self._remote_batch(calls[i:i + REMOTE_BATCH_MAX]))
+        return results
+
+    def _remote_batch(self, calls):
+        helpers = {}
+        items = []
+        for func, args, kwargs in calls:
+            helpers[func.__name__] = self._helper(func)
+            args_str = ''.join(self._remote_repr(a) + ', ' for a in args)
+            kwargs_str = ', '.join('{!r}: {}'.format(k, self._remote_repr(v))
+                                   for k, v in kwargs.items())
+            items.append("(_shell49[{!r}], ({}), {{{}}}),\n".format(
+                func.__name__, args_str, kwargs_str))
+        # helpers are looked up outside of try, missing ones raise KeyError
+        call = '_r = []\n'
+        call += 'for _f, _a, _k in (\n' + ''.join(items) + '):\n'
+        call += '    try:\n'
+        call += '        _o = _f(*_a, **_k)\n'
+        call += '        _r.append((1, "None" if _o is None else str(_o)))\n'
+        call += '    except Exception as _e:\n'
+        call += '        _r.append((0, repr(_e)))\n'
+        call += 'print(repr(_r))\n'
+        call += 'del _r\n'
+        start_time = time.time()
+        output = self._remote_exec(helpers, call)
+        dprint("remote_batch: {} calls in {:.3} s".format(len(calls), time.time()-start_time))
+        try:
+            output = eval(output)
+        except (SyntaxError, ValueError) as e:
+            raise BoardError("remote_batch: invalid response {}".format(output))
+        results = []
+        for (func, args, kwargs), (ok, res) in zip(calls, output):
+            if not ok:
+                results.append(BoardError("{}{} -> {}".format(func.__name__, args, res)))
+                continue
+            try:
+                results.append(eval(res))
+            except (SyntaxError, ValueError) as e:
+                eprint("*** remote_batch({}, {}, {}) -> \n{} is not valid python code".format(
+                    func.__name__, args, kwargs, res))
+                results.append(None)
+        return results
+
+    def _xfer_ready(self):
+        """Wait for the helper to start (\\x06) before a transfer"""
+        data = self._serial.read(1)
+        if data == b'\x06':
+            return
+        if data != b'\x04':
+            data += self._serial.read_until(1, b'\x04')
+        data_err = self._serial.read_until(1, b'\x04')
+        self._status = self.STATUS_RAW_REPL
+        raise BoardError("Exec -> {}".format(data_err[:-1].decode('utf-8')))
+
     def remote_eval(self, func, *args, **kwargs):
         """Calls func with the indicated args on the micropython board, and
            converts the response back into python by using eval.
@@ -407,22 +637,30 @@ class Board(object):
     ###################################################################
     # repl
 
-    def _repl_serial(self, serial_ok):
-        """Thread, copies bytes from serial to out"""
+    def _repl_serial(self, serial_ok, started):
+        """Thread, copies bytes from serial to stdout"""
 
         term = Terminal()
+        # multi-byte characters may straddle reads
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
 
         try:
             with serial_ok, term.raw():
-                save_timeout = self._serial.timeout
-                # Set a timeout so that the read returns periodically with no data
-                # and allows us to check whether the main thread wants us to quit.
-                self._serial.timeout = 0.4
+                started.set()
                 while not self._quit_serial_reader:
-                    char = self._serial.read(1)
-                    if char.decode('utf-8') != '':
-                        print(char.decode('utf-8'), end='', flush=True)
-                self._serial.timeout = save_timeout
+                    # Wait with a timeout so that we periodically check
+                    # whether the main thread wants us to quit.
+                    if not self._serial.wait(0.4):
+                        continue
+                    # drain everything available, write it in one piece
+                    data = bytearray()
+                    while len(data) < REPL_CHUNK:
+                        n = self._serial.in_waiting
+                        if n == 0:
+                            break
+                        data += self._serial.read(min(n, REPL_CHUNK - len(data)))
+                    repl_write(decoder.decode(data))
+                repl_write(decoder.decode(b'', True))
         except ConnectionError as e:
             self.disconnect()
             print('\r')
@@ -434,6 +672,8 @@ class Board(object):
             print('\r', printing.ERR_COLOR)
             traceback.print_exc(file=s)
             eprint(s.getvalue().replace('\n', '\r'))
+        finally:
+            started.set()
 
     def repl(self, getch):
 
@@ -441,36 +681,97 @@ class Board(object):
         # who knows what state we are in after repl?
         serial_ok = AutoBool()
 
+        started = Event()
         self._quit_serial_reader = False
-        repl_thread = Thread(target=self._repl_serial, args=[serial_ok], name="REPL")
+        repl_thread = Thread(target=self._repl_serial, args=[serial_ok, started], name="REPL")
         repl_thread.daemon = True
         repl_thread.start()
         # wait for reader to start
-        while not serial_ok(): pass
+        started.wait()
         try:
             # Wake up the prompt
             self._serial.write(b'\r')
+            line_start = True
             while serial_ok():
-                char = getch()
-                if not char: continue
-                if char == QUIT_REPL_BYTE:
+                keys = getch()
+                if not keys: continue
+                keys, quit, _ = keys.partition(QUIT_REPL_BYTE)
+                keys = keys.replace(b'\n', b'\r')
+                if b'\r' in keys[:-1] and line_start:
+                    # several lines at once, pasted: avoid auto-indent
+                    self._repl_paste(keys)
+                elif keys:
+                    self._serial.write(keys)
+                    # Control-C also gives a fresh prompt
+                    line_start = keys.endswith((b'\r', b'\x03'))
+                if quit:
                     self._quit_serial_reader = True
                     # needed by some boards, e.g. WiPy
                     self._serial.write(b' ')
                     # wait for reader thread to notice
-                    time.sleep(0.5)
+                    repl_thread.join(1)
                     # print newline so the shell49 prompt looks good
                     print('\n')
                     # stay in the loop until the reader thread is quitting
-                    continue
-                if char == b'\n':
-                    char = b'\r'
-                self._serial.write(char)
         except (AttributeError, BoardError):
             # Board no longer present?
             self.disconnect()
             print('\n')
 
+    def _repl_paste(self, code):
+        """Send code in paste mode (Control-E ... Control-D), in one write"""
+        self._serial.write(b'\x05' + code + b'\x04')
+
+
+def repl_write(text):
+    """Write board output to stdout, bypassing the text layer if possible"""
+    out = getattr(sys.stdout, 'buffer', None)
+    if out is None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return
+    # text already written (e.g. colors) goes first
+    sys.stdout.flush()
+    out.write(text.encode(sys.stdout.encoding or 'utf-8', 'replace'))
+    out.flush()
+
+
+###################################################################
+# helper source, as sent to the board
+
+_helper_sources = {}
+
+def helper_source(func, has_buffer, buffer_size, time_offset):
+    """Source of func with placeholders substituted, docstrings and
+    comments stripped. Returns (source, digest)."""
+    key = (func, has_buffer, buffer_size, time_offset)
+    res = _helper_sources.get(key)
+    if res:
+        return res
+    src = inspect.getsource(func)
+    # lines of docstrings (string right after INDENT) and comment-only lines
+    drop = set()
+    prev = None
+    tokens = list(tokenize.generate_tokens(io.StringIO(src).readline))
+    for i, tok in enumerate(tokens):
+        if tok.type == tokenize.STRING and prev == tokenize.INDENT and \
+                tokens[i + 1].type == tokenize.NEWLINE:
+            drop.update(range(tok.start[0], tok.end[0] + 1))
+        elif tok.type == tokenize.COMMENT and tokens[i + 1].type == tokenize.NL:
+            drop.add(tok.start[0])
+        if tok.type not in (tokenize.NL, tokenize.COMMENT):
+            prev = tok.type
+    lines = src.splitlines(True)
+    src = ''.join(line for n, line in enumerate(lines, 1)
+                  if n not in drop and line.strip())
+    src = src.replace('TIME_OFFSET', '{}'.format(time_offset))
+    src = src.replace('HAS_BUFFER', '{}'.format(has_buffer))
+    src = src.replace('BUFFER_SIZE', '{}'.format(buffer_size))
+    src = src.replace('IS_UPY', 'True')
+    res = src, hashlib.sha1(src.encode('utf-8')).hexdigest()[:12]
+    _helper_sources[key] = res
+    return res
+
 
 ###################################################################
 # remote operations, these run on the uPy board
@@ -490,49 +791,82 @@ def get_unique_id(default):
             uid = default
     return repr(uid)
 
-def listroot():
-    """Return list of filenames contained in root directory."""
+def probe(known, now):
+    """Board id, root directory and characteristics, sets the time to now
+    (unless None). Characteristics are None if known (dict id -> firmware)
+    matches the board."""
     import os
-    return os.listdir('/')
-
-def get_mac_address():
+    import sys
+    try:
+        from microcontroller import cpu
+        from binascii import hexlify
+        uid = hexlify(cpu.uid).decode('ascii')
+    except:
+        try:
+            from machine import unique_id
+            from binascii import hexlify
+            uid = hexlify(unique_id()).decode('ascii')
+        except:
+            uid = 'BOARD HAS NO ID'
+    if now:
+        y, m, d, h, min, s = now
+        try:
+            import pyb
+            pyb.RTC().datetime((y, m, d, None, h, min, s))
+        except:
+            try:
+                import machine
+                rtc = machine.RTC()
+                if not rtc.synced():
+                    try:
+                        rtc.datetime((y, m, d, None, h, min, s))
+                    except:
+                        rtc.init((y, m, d, h, min, s))
+            except:
+                pass
+    try:
+        firmware = os.uname().version
+    except:
+        firmware = sys.version
+    root = os.listdir('/')
+    if known.get(uid) == firmware:
+        return repr((uid, root, None))
+    try:
+        has_buffer = sys.stdin.buffer != None
+    except:
+        has_buffer = False
     try:
         from binascii import hexlify
         from network import WLAN, STA_IF
         mac = hexlify(WLAN(STA_IF).config('mac'), ':').decode('ascii')
     except:
         mac = None
-    return repr(mac)
-
-def set_time(y, m, d, h, min, s):
-    """Set time on upy board."""
-    rtc = None
     try:
-        import pyb
-        rtc = pyb.RTC()
-        rtc.datetime((y, m, d, None, h, min, s))
-        return rtc.datetime()
+        from binascii import a2b_base64, b2a_base64
+        base64 = True
     except:
-        try:
-            import machine
-            rtc = machine.RTC()
-            if not rtc.synced():
-                try:
-                    rtc.datetime((y, m, d, None, h, min, s))
-                    return rtc.datetime()
-                except:
-                    rtc.init((y, m, d, h, min, s))
-                    return rtc.now()
-        except:
-            return None
-
-def test_buffer():
-    """Check micropython firmware to see if sys.stdin.buffer exists."""
-    import sys
+        base64 = False
+    deflate = 0
     try:
-        return sys.stdin.buffer != None
+        import zlib
+        zlib.DecompIO
+        deflate = 1
     except:
-        return False
+        pass
+    try:
+        import io
+        import deflate as d
+        deflate = 1
+        d.DeflateIO(io.BytesIO(), d.ZLIB).write(b'x')
+        deflate = 2
+    except:
+        pass
+    return repr((uid, root, {
+        'firmware': firmware,
+        'has_buffer': has_buffer,
+        'deflate': deflate,
+        'base64': base64,
+        'mac': mac }))
 
 ###################################################################
 # test code
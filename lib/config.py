@@ -70,6 +70,10 @@ class Config:
         except KeyError:
             pass
 
+    def board_ids(self):
+        """List of ids of all boards in the configuration."""
+        return [b_id for b_id in self._boards().keys() if b_id != 'default']
+
     def get_board_from_name(self, name):
         """Return board_id of board with 'name', None if no such board."""
         for b_id, d in self._boards().items():
@@ -105,6 +109,11 @@ class Config:
                 'board': 'HUZZAH32',
                 'baudrate': 115200,
                 'buffer_size': 1024,
+                'xfer_window_serial': 1,
+                'xfer_window_network': 8,
+                'xfer_encoding': 'base64',
+                'delta_min_size': 65536,
+                'autotune': False,
                 'time_offset': 946684800,
                 'user': 'micro',
                 'password': 'python',
@@ -113,6 +122,7 @@ class Config:
                 'remote_dir': '/flash',
                 'rsync_includes': '*.py,*.json,*.txt,*.html',
                 'rsync_excludes': '.*,__*__,config.py',
+                'sync_manifest': True,
                 'flash_options': "--chip esp32 --before default_reset --after hard_reset write_flash -z --flash_mode dio --flash_freq 40m --flash_size detect ",
                 'firmware_url': "https://people.eecs.berkeley.edu/~boser/iot49/firmware",
                 'flash_baudrate': 921600}
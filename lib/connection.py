@@ -3,6 +3,11 @@ from printing import qprint, dprint, eprint
 from serial import Serial
 from serial.tools.list_ports import comports
 from serial.serialutil import SerialException
+import selectors
+import select
+import socket
+import struct
+import base64
 import time
 import sys
 import os
@@ -21,17 +26,104 @@ class ConnectionError(Exception):
         super().__init__(msg)
 
 
+class ByteFifo:
+    """Contiguous receive buffer.
+
+    Data is appended at the tail and consumed from the head of a single
+    bytearray; consumed space is reclaimed in bulk, so reads return slices
+    without per-byte work and len() is O(1).
+    """
+
+    # reclaim consumed space once it exceeds this many bytes
+    COMPACT = 64 * 1024
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._head = 0
+
+    def __len__(self):
+        return len(self._buf) - self._head
+
+    def extend(self, data):
+        """Append data at the tail"""
+        self._buf += data
+
+    def peek(self, start, end):
+        """Bytes start ... end (relative to head) without consuming them"""
+        head = self._head
+        return bytes(self._buf[head + start:head + end])
+
+    def find(self, sub, start=0):
+        """Position of sub relative to head, -1 if not found"""
+        pos = self._buf.find(sub, self._head + start)
+        return pos if pos < 0 else pos - self._head
+
+    def read(self, size):
+        """Consume and return up to size bytes from the head"""
+        head = self._head
+        data = bytes(self._buf[head:head + size])
+        self._consume(len(data))
+        return data
+
+    def readinto(self, buf):
+        """Consume up to len(buf) bytes from the head into buf, returns their number"""
+        head = self._head
+        n = min(len(buf), len(self._buf) - head)
+        # released before the fifo grows again
+        with memoryview(self._buf) as src:
+            buf[:n] = src[head:head + n]
+        self._consume(n)
+        return n
+
+    def _consume(self, n):
+        head = self._head + n
+        if head >= len(self._buf):
+            self._buf = bytearray()
+            head = 0
+        elif head >= self.COMPACT and head >= len(self._buf) // 2:
+            del self._buf[:head]
+            head = 0
+        self._head = head
+
+
 class Connection:
 
     def __init__(self):
-        pass
+        # Bytes received from the device but not yet consumed.
+        self._rx = ByteFifo()
+        # traffic on the wire, including protocol overhead
+        self.bytes_sent = 0
+        self.bytes_received = 0
 
     def close(self):
         """Close connection and free up resources"""
         pass
 
-    def read(self, bytes=1):
-        """Read bytes from device"""
+    def read(self, size=1):
+        """Read bytes from device, waits at most timeout seconds"""
+        self._fill(size)
+        return self._rx.read(size)
+
+    def readinto(self, buf):
+        """Fill buf (e.g. a memoryview) with bytes from the device, waits at most
+        timeout seconds. Returns number of bytes read."""
+        self._fill(len(buf))
+        return self._rx.readinto(buf)
+
+    def _fill(self, size):
+        """Wait until size bytes are received or timeout seconds expire"""
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(self._rx) < size:
+            if self._pull():
+                continue
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            self._wait(remaining)
+
+    def _pull(self):
+        """Move data available from transport to self._rx without blocking.
+        Returns number of bytes moved."""
         raise NotImplementedError("read: connection is abstract")
 
     def write(self, bytes):
@@ -39,38 +131,67 @@ class Connection:
         raise NotImplementedError("write: connection is abstract")
 
     def read_until(self, min_num_bytes, ending, timeout=10, data_consumer=None):
-        """Read from board until 'ending'. Timeout None disables timeout."""
+        """Read from board until 'ending'. Timeout None disables timeout.
+        Searches the receive buffer in place, looking only at new data.
+        Bytes received after 'ending' are kept for the next read.
+        """
         dprint("read_until({}, {})".format(min_num_bytes, ending))
-        data = self.read(min_num_bytes)
-        if data_consumer:
-            data_consumer(data)
-        timeout_count = 0
+        rx = self._rx
+        deadline = time.monotonic() + timeout if timeout else None
+        # search from start, bytes before consumed were passed to data_consumer
+        start = max(0, min_num_bytes - len(ending))
+        consumed = 0
         while True:
-            if data.endswith(ending):
-                dprint("   data = '{}'".format(data))
+            pos = rx.find(ending, start)
+            if pos >= 0:
+                end = pos + len(ending)
+                if data_consumer and end > consumed:
+                    data_consumer(rx.peek(consumed, end))
+                data = rx.read(end)
                 break
-            elif self.in_waiting > 0:
-                new_data = self.read(1)
-                data = data + new_data
+            n = len(rx)
+            if n > consumed:
                 if data_consumer:
-                    data_consumer(new_data)
-                timeout_count = 0
-            else:
-                timeout_count += 1
-                if timeout and timeout_count >= 100 * timeout:
-                    raise ConnectionError('timeout in read_until "{}"'.format(ending))
-                time.sleep(0.01)
+                    data_consumer(rx.peek(consumed, n))
+                consumed = n
+                # ending may straddle the old and the new data
+                start = max(0, n - len(ending) + 1)
+                deadline = time.monotonic() + timeout if timeout else None
+            if self._pull():
+                continue
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                raise ConnectionError('timeout in read_until "{}"'.format(ending))
+            self._wait(remaining)
+        dprint("   data = '{}'".format(data))
         return data
 
-    @property
-    def connected(self):
-        """Connection is active"""
-        raise NotImplementedError("connected: connection is abstract")
+    def wait(self, timeout=None):
+        """Block until data is available to read or timeout (seconds) expires.
+        Timeout None waits forever. Returns True if data is available.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not (len(self._rx) or self._pull()):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._wait(remaining)
+        return True
+
+    def _wait(self, timeout):
+        """Wait until transport may have data. Fallback: poll."""
+        time.sleep(0.01 if timeout is None else min(timeout, 0.01))
 
     @property
     def in_waiting(self):
         """Number of bytes in queue waiting to be read without blocking"""
-        raise NotImplementedError("in_waiting: connection is abstract")
+        self._pull()
+        return len(self._rx)
+
+    @property
+    def connected(self):
+        """Connection is active"""
+        raise NotImplementedError("connected: connection is abstract")
 
     @property
     def timeout(self):
@@ -94,11 +215,27 @@ class Connection:
         """Board is connected via telnet"""
         return False
 
+    @property
+    def is_circuit_python(self):
+        return False
+
+    @property
+    def is_wireless(self):
+        """Board is connected over the network (soft reset drops connection)"""
+        return self.is_telnet
+
+    @property
+    def has_file_transfer(self):
+        """Connection has native file transfer (put_file, get_file)"""
+        return False
+
 
 class SerialConnection(Connection):
 
     def __init__(self, port=None, baudrate=115200):
+        super().__init__()
         self.is_circuitpy = False
+        self._selector = None
         try:
             # check which ports are available
             if not port:
@@ -133,15 +270,21 @@ class SerialConnection(Connection):
                     qprint(e)
                 time.sleep(1)
             # send Control-C to put MicroPython in known state
+            # (enter_raw_repl waits for the prompt)
             for attempt in range(20):
                 try:
                     self._serial.write(b'\x03')
-                    time.sleep(1)
                     break
                 except SerialException:
                     time.sleep(0.5)
                     qprint("Trying to talk to the MicroPython interpreter")
             self._port = port
+            try:
+                # not available on all platforms (e.g. Windows)
+                self._selector = selectors.DefaultSelector()
+                self._selector.register(self._serial.fileno(), selectors.EVENT_READ)
+            except (AttributeError, ValueError, OSError):
+                self._selector = None
             qprint(f"SerialConnection to {port} established")
         except AttributeError:
             raise ConnectionError("Failed connecting to board at '{}'".format(port))
@@ -151,15 +294,24 @@ class SerialConnection(Connection):
     def close(self):
         """Close connection and free up resources"""
         self._port = None
+        if self._selector:
+            self._selector.close()
+            self._selector = None
         if self._serial:
             self._serial.close()
             self._serial = None
 
-    def read(self, bytes=1):
-        """Read bytes from device"""
+    def _pull(self):
+        """Move bytes waiting in the serial port to the receive buffer"""
+        if not self._serial:
+            raise ConnectionError("Board disconnected, cannot read")
         try:
-            return self._serial.read(bytes)
-        except (SerialException, AttributeError):
+            n = self._serial.in_waiting
+            if n > 0:
+                self._rx.extend(self._serial.read(n))
+                self.bytes_received += n
+            return n
+        except (SerialException, AttributeError, OSError):
             self.close()
             raise ConnectionError("Board disconnected, cannot read")
 
@@ -167,21 +319,26 @@ class SerialConnection(Connection):
         """Write bytes to device"""
         try:
             self._serial.write(bytes)
+            self.bytes_sent += len(bytes)
         except (SerialException, AttributeError):
             self.close()
             raise ConnectionError("Board disconnected, cannot write")
 
+    def _wait(self, timeout):
+        """Wait for data on the serial port file descriptor"""
+        if not self._selector:
+            return super()._wait(timeout)
+        try:
+            self._selector.select(timeout)
+        except (OSError, ValueError):
+            self.close()
+            raise ConnectionError("Board disconnected, cannot read")
+
     @property
     def connected(self):
         """Connection is active"""
         return self._serial != None
 
-    @property
-    def in_waiting(self):
-        """Number of bytes in queue waiting to be read without blocking"""
-        if not self._serial: return 0
-        return self._serial.in_waiting
-
     @property
     def timeout(self):
         return self._serial.timeout
@@ -204,32 +361,85 @@ class SerialConnection(Connection):
         return self.is_circuitpy
 
 
+def open_socket(address, default_port, rcvbuf):
+    """Non-blocking TCP socket connected to 'host[:port]'"""
+    host, _, port = address.partition(':')
+    try:
+        sock = socket.create_connection((host, int(port or default_port)), timeout=15)
+    except ConnectionRefusedError:
+        raise ConnectionError("Board refused connection")
+    except (OSError, ValueError) as e:
+        raise ConnectionError("Cannot connect to '{}': {}".format(address, e))
+    # don't hold back small writes (e.g. file transfer acks)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    except OSError:
+        pass
+    sock.setblocking(False)
+    return sock
+
+
+def send_all(sock, data, timeout):
+    """Write all of data to a non-blocking socket"""
+    view = memoryview(data)
+    while view:
+        try:
+            view = view[sock.send(view):]
+        except BlockingIOError:
+            select.select([], [sock], [], timeout)
+
+
+# Telnet commands (RFC 854)
+IAC  = 255
+DONT = 254
+DO   = 253
+WONT = 252
+WILL = 251
+SB   = 250
+SE   = 240
+
+TELNET_PORT = 23
+
+
 class TelnetConnection(Connection):
+    """Telnet client on a non-blocking socket.
+
+    Implements just enough of the protocol for the MicroPython telnet
+    server: IAC escapes, refusal of all option negotiations, and skipping
+    of subnegotiations.
+    """
+
+    # socket receive buffer size
+    RCVBUF = 256 * 1024
 
     def __init__(self, ip, user, password, read_timeout=5):
+        super().__init__()
         dprint("TelnetConnection({}, user={}, password={})".format(ip, user, password))
-        import telnetlib
-        try:
-            self._telnet = telnetlib.Telnet(ip, timeout=15)
-        except ConnectionRefusedError:
-            raise ConnectionError("Board refused telnet connection")
         self._ip = ip
         self._read_timeout = read_timeout
-        if b'Login as:' in self._telnet.read_until(b'Login as:', timeout=read_timeout):
-            self._telnet.write(bytes(user, 'ascii') + b"\r\n")
+        self._sock = None
+        self._selector = None
+        # incomplete IAC sequence at the end of the last segment
+        self._iac = b''
+        self._sock = open_socket(ip, TELNET_PORT, self.RCVBUF)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ)
+        try:
+            self.read_until(1, b'Login as:', timeout=read_timeout)
+            self.write(bytes(user, 'ascii') + b"\r\n")
             dprint("sent user", user)
-            if b'Password:' in self._telnet.read_until(b'Password:', timeout=read_timeout):
-                # needed because of internal implementation details of the telnet server
-                time.sleep(0.2)
-                self._telnet.write(bytes(password, 'ascii') + b"\r\n")
-                dprint("sent password", password)
-                if b'for more information.' in self._telnet.read_until(b'Type "help()" for more information.', timeout=read_timeout):
-                    dprint("got greeting")
-                    # login succesful
-                    from collections import deque
-                    self._fifo = deque()
-                    return
-        raise ConnectionError('Failed to establish a telnet connection with the board')
+            self.read_until(1, b'Password:', timeout=read_timeout)
+            # needed because of internal implementation details of the telnet server
+            time.sleep(0.2)
+            self.write(bytes(password, 'ascii') + b"\r\n")
+            dprint("sent password", password)
+            self.read_until(1, b'Type "help()" for more information.', timeout=read_timeout)
+            dprint("got greeting")
+        except ConnectionError as e:
+            dprint("telnet login:", e)
+            self.close()
+            raise ConnectionError('Failed to establish a telnet connection with the board')
 
     def __del__(self):
         self.close()
@@ -237,62 +447,368 @@ class TelnetConnection(Connection):
     def close(self):
         """Close connection and free up resources"""
         self._ip = None
-        if self._telnet:
+        if getattr(self, '_selector', None):
+            self._selector.close()
+            self._selector = None
+        if getattr(self, '_sock', None):
             try:
-                self._telnet.close()
-            except:
-                # telnet object may not exist yet, ignore
+                self._sock.close()
+            except OSError:
                 pass
-            self._telnet = None
+            self._sock = None
 
-    def read(self, size=1):
-        """Read bytes from device"""
-        while len(self._fifo) < size:
-            timeout_count = 0
+    def write(self, data):
+        """Write bytes to device"""
+        if not self._sock:
+            raise ConnectionError("Board disconnected, cannot write")
+        escaped = bytes(data).replace(b'\xff', b'\xff\xff')
+        try:
+            send_all(self._sock, escaped, self._read_timeout)
+            self.bytes_sent += len(escaped)
+        except OSError as e:
+            self.close()
+            raise ConnectionError(e)
+        return len(data)
+
+    def _pull(self):
+        """Move data received from socket to the receive buffer"""
+        if not self._sock:
+            raise ConnectionError("Board disconnected, cannot read")
+        try:
+            data = self._sock.recv(self.RCVBUF)
+        except (BlockingIOError, InterruptedError):
+            return 0
+        except OSError as e:
+            self.close()
+            raise ConnectionError(e)
+        if not data:
+            self.close()
+            raise ConnectionError("telnet connection closed")
+        self.bytes_received += len(data)
+        if self._iac or IAC in data:
+            data = self._telnet_commands(self._iac + data)
+        self._rx.extend(data)
+        return len(data)
+
+    def _telnet_commands(self, buf):
+        """Strip telnet commands from buf and answer negotiations"""
+        data = bytearray()
+        reply = bytearray()
+        i = 0
+        self._iac = b''
+        while True:
+            j = buf.find(IAC, i)
+            if j < 0:
+                data += buf[i:]
+                break
+            data += buf[i:j]
+            if j + 1 >= len(buf):
+                self._iac = buf[j:]
+                break
+            cmd = buf[j + 1]
+            if cmd == IAC:
+                data.append(IAC)
+                i = j + 2
+            elif cmd in (DO, DONT, WILL, WONT):
+                if j + 2 >= len(buf):
+                    self._iac = buf[j:]
+                    break
+                # refuse all options
+                reply += bytes((IAC, WONT if cmd in (DO, DONT) else DONT, buf[j + 2]))
+                i = j + 3
+            elif cmd == SB:
+                k = buf.find(bytes((IAC, SE)), j + 2)
+                if k < 0:
+                    self._iac = buf[j:]
+                    break
+                i = k + 2
+            else:
+                i = j + 2
+        if reply:
+            dprint("telnet negotiation reply", bytes(reply))
             try:
-                data = self._telnet.read_eager()
-            except (OSError, EOFError) as e:
+                self._sock.sendall(reply)
+            except BlockingIOError:
+                pass
+            except OSError as e:
                 raise ConnectionError(e)
-            if len(data):
-                self._fifo.extend(data)
-                timeout_count = 0
-            else:
-                time.sleep(0.25)
-                if self._read_timeout is not None and timeout_count > 4 * self._read_timeout:
-                    break
-                timeout_count += 1
-        data = b''
-        while len(data) < size and len(self._fifo) > 0:
-            data += bytes([self._fifo.popleft()])
-        return data
+        return bytes(data)
 
-    def write(self, data):
-        """Write bytes to device"""
+    def _wait(self, timeout):
+        """Wait for the telnet socket to become readable"""
         try:
-            self._telnet.write(data)
-            return len(data)
-        except (BrokenPipeError, OSError, EOFError) as e:
+            self._selector.select(timeout)
+        except (OSError, ValueError, AttributeError) as e:
             raise ConnectionError(e)
 
     @property
     def connected(self):
         """Connection is active"""
-        return self._telnet != None
+        return self._sock != None
 
     @property
-    def in_waiting(self):
-        """Number of bytes in queue waiting to be read without blocking"""
-        if not self._telnet: return 0
-        n_waiting = len(self._fifo)
-        if not n_waiting:
+    def timeout(self):
+        return self._read_timeout
+
+    @timeout.setter
+    def timeout(self, val):
+        self._read_timeout = val
+
+    @property
+    def address(self):
+        """Serial port or telnet ip"""
+        return self._ip
+
+    def match(self, ip):
+        """Checks if board is connected on ip"""
+        return self._ip == ip
+
+    @property
+    def is_telnet(self):
+        """Board is connected via telnet"""
+        return True
+
+
+WEBREPL_PORT = 8266
+
+# WebREPL file transfer request: b'WA', op, 0, 0, size, len(name), name
+WEBREPL_REQ_S = "<2sBBQLH64s"
+WEBREPL_PUT_FILE = 1
+WEBREPL_GET_FILE = 2
+WEBREPL_CHUNK = 1024
+
+# websocket opcodes
+WS_TEXT = 0x1
+WS_BINARY = 0x2
+WS_CLOSE = 0x8
+WS_PING = 0x9
+WS_PONG = 0xa
+
+
+class WebReplConnection(Connection):
+    """WebREPL (websocket) connection.
+
+    REPL traffic travels in text frames. Binary frames carry the native
+    WebREPL file transfer protocol, which bypasses the REPL altogether.
+    Like webrepl_cli.py, frames are sent unmasked.
+    """
+
+    RCVBUF = 256 * 1024
+
+    def __init__(self, ip, password, read_timeout=5):
+        super().__init__()
+        dprint("WebReplConnection({})".format(ip))
+        self._ip = ip
+        self._read_timeout = read_timeout
+        self._sock = None
+        self._selector = None
+        # received websocket data not yet parsed into frames
+        self._frames = bytearray()
+        # payload of binary frames (file transfer responses)
+        self._bin = ByteFifo()
+        self._sock = open_socket(ip, WEBREPL_PORT, self.RCVBUF)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ)
+        try:
+            self._handshake()
+            self.read_until(1, b'Password: ', timeout=read_timeout)
+            self.write(bytes(password, 'utf-8') + b'\r')
+            self.read_until(1, b'WebREPL connected', timeout=read_timeout)
+            dprint("webrepl: logged in")
+        except ConnectionError as e:
+            dprint("webrepl login:", e)
+            self.close()
+            raise ConnectionError('Failed to establish a WebREPL connection with the board')
+
+    def _handshake(self):
+        """HTTP upgrade to websocket"""
+        key = base64.b64encode(os.urandom(16))
+        send_all(self._sock,
+                 b'GET / HTTP/1.1\r\n'
+                 b'Host: ' + self._ip.encode() + b'\r\n'
+                 b'Connection: Upgrade\r\n'
+                 b'Upgrade: websocket\r\n'
+                 b'Sec-WebSocket-Key: ' + key + b'\r\n'
+                 b'Sec-WebSocket-Version: 13\r\n'
+                 b'\r\n', self._read_timeout)
+        deadline = time.monotonic() + self._read_timeout
+        while b'\r\n\r\n' not in self._frames:
+            if time.monotonic() > deadline:
+                raise ConnectionError("no websocket handshake response")
+            if not self._recv():
+                self._wait(deadline - time.monotonic())
+        header, _, rest = bytes(self._frames).partition(b'\r\n\r\n')
+        dprint("webrepl handshake:", header)
+        if b' 101 ' not in header.split(b'\r\n')[0]:
+            raise ConnectionError("websocket upgrade refused: {}".format(header))
+        self._frames = bytearray(rest)
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Close connection and free up resources"""
+        self._ip = None
+        if getattr(self, '_selector', None):
+            self._selector.close()
+            self._selector = None
+        if getattr(self, '_sock', None):
             try:
-                data = self._telnet.read_eager()
-            except EOFError as e:
-                raise ConnectionError(e)
-            self._fifo.extend(data)
-            return len(data)
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _send_frame(self, opcode, payload):
+        if not self._sock:
+            raise ConnectionError("Board disconnected, cannot write")
+        n = len(payload)
+        if n < 126:
+            header = struct.pack('>BB', 0x80 | opcode, n)
+        elif n < 0x10000:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, n)
         else:
-            return n_waiting
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, n)
+        try:
+            send_all(self._sock, header + bytes(payload), self._read_timeout)
+            self.bytes_sent += len(header) + n
+        except OSError as e:
+            self.close()
+            raise ConnectionError(e)
+
+    def write(self, data):
+        """Write bytes to device"""
+        self._send_frame(WS_TEXT, data)
+        return len(data)
+
+    def _recv(self):
+        """Receive from socket, returns False if nothing was available"""
+        if not self._sock:
+            raise ConnectionError("Board disconnected, cannot read")
+        try:
+            data = self._sock.recv(self.RCVBUF)
+        except (BlockingIOError, InterruptedError):
+            return False
+        except OSError as e:
+            self.close()
+            raise ConnectionError(e)
+        if not data:
+            self.close()
+            raise ConnectionError("WebREPL connection closed")
+        self.bytes_received += len(data)
+        self._frames += data
+        return True
+
+    def _pull(self):
+        """Receive and dispatch complete frames, returns #text bytes"""
+        self._recv()
+        return self._parse_frames()
+
+    def _parse_frames(self):
+        """Text payload to receive buffer, binary to self._bin"""
+        text = 0
+        frames = self._frames
+        pos = 0
+        while len(frames) - pos >= 2:
+            opcode = frames[pos] & 0x0f
+            n = frames[pos + 1] & 0x7f
+            masked = frames[pos + 1] & 0x80
+            hdr = 2
+            if n == 126:
+                if len(frames) - pos < 4: break
+                n = struct.unpack_from('>H', frames, pos + 2)[0]
+                hdr = 4
+            elif n == 127:
+                if len(frames) - pos < 10: break
+                n = struct.unpack_from('>Q', frames, pos + 2)[0]
+                hdr = 10
+            if masked:
+                hdr += 4
+            if len(frames) - pos < hdr + n:
+                break
+            payload = frames[pos + hdr:pos + hdr + n]
+            if masked:
+                mask = frames[pos + hdr - 4:pos + hdr] * (n // 4 + 1)
+                payload = bytes(a ^ b for a, b in zip(payload, mask))
+            pos += hdr + n
+            if opcode == WS_TEXT or opcode == 0:
+                self._rx.extend(payload)
+                text += n
+            elif opcode == WS_BINARY:
+                self._bin.extend(payload)
+            elif opcode == WS_PING:
+                self._send_frame(WS_PONG, payload)
+            elif opcode == WS_CLOSE:
+                self.close()
+                raise ConnectionError("WebREPL connection closed by board")
+        del frames[:pos]
+        return text
+
+    def _wait(self, timeout):
+        """Wait for the socket to become readable"""
+        try:
+            self._selector.select(timeout)
+        except (OSError, ValueError, AttributeError) as e:
+            raise ConnectionError(e)
+
+    def _read_binary(self, size):
+        """Read size bytes of binary frame payload"""
+        deadline = None if self._read_timeout is None else time.monotonic() + self._read_timeout
+        while len(self._bin) < size:
+            received = self._recv()
+            self._parse_frames()
+            if received:
+                continue
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise ConnectionError("WebREPL: timeout in file transfer")
+            self._wait(remaining)
+        return self._bin.read(size)
+
+    def _read_resp(self):
+        """Status of file transfer request, 0 is success"""
+        sig, code = struct.unpack('<2sH', self._read_binary(4))
+        if sig != b'WB':
+            raise ConnectionError("WebREPL: unexpected response {}".format(sig))
+        return code
+
+    def _request(self, op, size, filename):
+        name = filename.encode('utf-8')
+        if len(name) > 64:
+            raise ConnectionError("WebREPL: filename too long, '{}'".format(filename))
+        rec = struct.pack(WEBREPL_REQ_S, b'WA', op, 0, 0, size, len(name), name)
+        self._send_frame(WS_BINARY, rec)
+        return self._read_resp() == 0
+
+    def put_file(self, src_file, dst_filename, filesize):
+        """Upload src_file (open file) to dst_filename on the board"""
+        if not self._request(WEBREPL_PUT_FILE, filesize, dst_filename):
+            return False
+        bytes_remaining = filesize
+        while bytes_remaining > 0:
+            buf = src_file.read(min(bytes_remaining, WEBREPL_CHUNK))
+            if not buf:
+                break
+            self._send_frame(WS_BINARY, buf)
+            bytes_remaining -= len(buf)
+        return self._read_resp() == 0
+
+    def get_file(self, src_filename, dst_file):
+        """Download src_filename on the board to dst_file (open file)"""
+        if not self._request(WEBREPL_GET_FILE, 0, src_filename):
+            return False
+        while True:
+            self._send_frame(WS_BINARY, b'\0')
+            size = struct.unpack('<H', self._read_binary(2))[0]
+            if size == 0:
+                break
+            dst_file.write(self._read_binary(size))
+        return self._read_resp() == 0
+
+    @property
+    def connected(self):
+        """Connection is active"""
+        return self._sock != None
 
     @property
     def timeout(self):
@@ -304,7 +820,7 @@ class TelnetConnection(Connection):
 
     @property
     def address(self):
-        """Serial port or telnet ip"""
+        """Serial port or ip"""
         return self._ip
 
     def match(self, ip):
@@ -312,6 +828,9 @@ class TelnetConnection(Connection):
         return self._ip == ip
 
     @property
-    def is_telnet(self):
-        """Board is connected via telnet"""
+    def is_wireless(self):
+        return True
+
+    @property
+    def has_file_transfer(self):
         return True
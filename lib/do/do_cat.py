@@ -1,4 +1,4 @@
-from fileops import resolve_path, auto, get_mode, mode_exists, mode_isfile, cat
+from fileops import resolve_path, auto_batch, get_mode, mode_exists, mode_isfile, cat
 from printing import eprint
 
 
@@ -14,9 +14,9 @@ def do_cat(self, line):
     #       to write stdin to a temp file, and then copy the file
     #       since we need to know the filesize when copying to the pyboard.
     args = self.line_to_args(line)
-    for filename in args:
-        filename = resolve_path(self.cur_dir, filename)
-        mode = auto(self.boards, get_mode, filename)
+    filenames = [resolve_path(self.cur_dir, filename) for filename in args]
+    modes = auto_batch(self.boards, get_mode, filenames)
+    for filename, mode in zip(filenames, modes):
         if not mode_exists(mode):
             eprint("Cannot access '%s': No such file" % filename)
             continue
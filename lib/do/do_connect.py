@@ -7,6 +7,8 @@ def do_connect(self, line):
     connect telnet [url [user [pwd]]]   Wireless connection. If no url/ip address is
         specified, connects to all known boards advertising repl service via mDNS.
         Optional user (default: 'micro') and password (default: 'python').
+    connect webrepl url [pwd]           Wireless connection to WebREPL (port 8266).
+        Password defaults to config option webrepl_password.
 
     Note: do not connect to the same board via serial AND telnet connections.
           Doing so may block communication with the board.
@@ -57,5 +59,14 @@ def do_connect(self, line):
                 user = self.config.get(board_id, 'user', 'micro')
                 pwd  = self.config.get(board_id, 'password', 'python')
                 self.boards.connect_telnet(b.url, user, pwd)
+    elif connect_type == 'webrepl':
+        if len(args) < 2:
+            eprint('Missing url or ip address')
+            return
+        if self.boards.find_board(args[1]):
+            eprint("board already connected at '{}'".format(args[1]))
+            return
+        pwd = args[2] if len(args) > 2 else self.config.get(0, 'webrepl_password', 'python')
+        self.boards.connect_webrepl(args[1], pwd)
     else:
         eprint('Unrecognized connection TYPE: {}'.format(connect_type))
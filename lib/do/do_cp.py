@@ -1,6 +1,7 @@
 from util import add_arg
-from fileops import auto, resolve_path, is_pattern, process_pattern, get_mode, \
-    mkdir, cp, rsync, listdir_stat, mode_exists, mode_isdir, stat_mode
+from fanout import argparse_fanout, fanout, fanout_boards
+from fileops import auto, auto_batch, resolve_path, is_pattern, process_pattern, get_mode, \
+    mkdir, cp_many, rsync, listdir_stat, mode_exists, mode_isdir, stat_mode
 from printing import eprint
 
 import os
@@ -13,6 +14,14 @@ argparse_cp = (
         help='Copy directories recursively',
         default=False
     ),
+    add_arg(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        help='Continue interrupted transfers from DEST.part',
+        default=False
+    ),
+    *argparse_fanout,
     add_arg(
         'filenames',
         metavar='FILE',
@@ -30,28 +39,32 @@ def do_cp(self, line):
     cp SOURCE... DIRECTORY          Copy multiple SOURCE files to a directory.
     cp [-r] PATTERN DIRECTORY       Copy matching files to DIRECTORY.
     cp [-r|--recursive] [SOURCE|SOURCE_DIR]... DIRECTORY
+    cp --resume SOURCE... DEST      Continue interrupted copies.
+    cp [--all|--boards A,B,C] ...   Copy on several boards concurrently.
 
        The destination must be a directory except in the case of
        copying a single file. To copy directories -r must be specified.
        This will cause directories and their contents to be recursively
        copied.
+       Files are copied to DEST.part and renamed when complete. After an
+       interrupted transfer, --resume continues from DEST.part.
+       With --all or --boards, the default board paths refer to each of
+       the boards.
     """
     args = self.line_to_args(line)
     if len(args.filenames) < 2:
         eprint('Missing destination file')
         return
-    dst_dirname = resolve_path(self.cur_dir, args.filenames[-1])
-    dst_mode = auto(self.boards, get_mode, dst_dirname)
-    d_dst = {}  # Destination directory: lookup stat by basename
-    if args.recursive:
-        dst_files = auto(self.boards, listdir_stat, dst_dirname)
-        if dst_files is None:
-            err = "cp: target {} is not a directory"
-            eprint(err.format(dst_dirname))
-            return
-        for name, stat in dst_files:
-            d_dst[name] = stat
+    targets = fanout_boards(self.boards, args)
+    if targets:
+        fanout(self.boards, targets, lambda devs: copy_files(self, devs, args))
+    else:
+        copy_files(self, self.boards, args)
 
+
+def copy_files(self, devs, args):
+    """cp with args, default board paths refer to devs.default"""
+    dst_dirname = resolve_path(self.cur_dir, args.filenames[-1])
     src_filenames = args.filenames[:-1]
 
     # Process PATTERN
@@ -60,7 +73,7 @@ def do_cp(self, line):
         if len(src_filenames) > 1:
             eprint("Usage: cp [-r] PATTERN DIRECTORY")
             return
-        src_filenames = process_pattern(self.boards, self.cur_dir, sfn)
+        src_filenames = process_pattern(devs, self.cur_dir, sfn)
         if src_filenames is None:
             return
 
@@ -68,30 +81,44 @@ def do_cp(self, line):
         if is_pattern(src_filename):
             eprint("Only one pattern permitted.")
             return
-        src_filename = resolve_path(self.cur_dir, src_filename)
-        src_mode = auto(self.boards, get_mode, src_filename)
+    src_filenames = [resolve_path(self.cur_dir, fn) for fn in src_filenames]
+
+    # get all modes in one go
+    dst_mode, *src_modes = auto_batch(devs, get_mode, [dst_dirname] + src_filenames)
+    d_dst = {}  # Destination directory: lookup stat by basename
+    if args.recursive:
+        dst_files = auto(devs, listdir_stat, dst_dirname)
+        if dst_files is None:
+            err = "cp: target {} is not a directory"
+            eprint(err.format(dst_dirname))
+            return
+        for name, stat in dst_files:
+            d_dst[name] = stat
+
+    for src_filename, src_mode in zip(src_filenames, src_modes):
         if not mode_exists(src_mode):
             eprint("File '{}' doesn't exist".format(src_filename))
             return
+
+    pairs = []  # files, copied together
+    for src_filename, src_mode in zip(src_filenames, src_modes):
         if mode_isdir(src_mode):
             if args.recursive:  # Copying a directory
                 src_basename = os.path.basename(src_filename)
                 dst_filename = os.path.join(dst_dirname, src_basename)
                 if src_basename in d_dst:
-                    dst_stat = d_dst[src_basename]
-                    dst_mode = stat_mode(dst_stat)
-                    if not mode_isdir(dst_mode):
+                    if not mode_isdir(stat_mode(d_dst[src_basename])):
                         err = "Destination {} is not a directory"
                         eprint(err.format(dst_filename))
                         return
                 else:
-                    if not mkdir(dst_filename):
+                    if not mkdir(devs, dst_filename):
                         err = "Unable to create directory {}"
                         eprint(err.format(dst_filename))
                         return
 
-                rsync(src_filename, dst_filename, mirror=False, dry_run=False,
-                      print_func=lambda *args: None, recursed=False)
+                rsync(devs, src_filename, dst_filename, mirror=False,
+                      dry_run=False, recursed=True)
             else:
                 eprint("Omitting directory {}".format(src_filename))
             continue
@@ -100,7 +127,8 @@ def do_cp(self, line):
                 dst_dirname, os.path.basename(src_filename))
         else:
             dst_filename = dst_dirname
-        if not cp(self.boards, src_filename, dst_filename):
+        pairs.append((src_filename, dst_filename))
+    for (src_filename, dst_filename), res in zip(pairs, cp_many(devs, pairs, resume=args.resume)):
+        if not res:
             err = "Unable to copy '{}' to '{}'"
             eprint(err.format(src_filename, dst_filename))
-            break
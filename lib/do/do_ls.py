@@ -1,5 +1,5 @@
 from util import add_arg
-from fileops import auto, is_pattern, resolve_path, validate_pattern, listdir_stat, \
+from fileops import auto_batch, is_pattern, resolve_path, validate_pattern, listdir_stat, \
     get_stat, stat_mode, stat_mtime, stat_size, mode_exists, mode_isdir
 from printing import eprint, oprint
 import printing
@@ -46,10 +46,27 @@ def do_ls(self, line):
     args = self.line_to_args(line)
     if len(args.filenames) == 0:
         args.filenames = ['.']
+    # stat all files and directories in one go
+    filenames = [resolve_path(self.cur_dir, fn) for fn in args.filenames if not is_pattern(fn)]
+    stats = dict(zip(filenames, auto_batch(self.boards, get_stat, filenames)))
+    # (idx, filename, stat, pattern), pattern is None for files
+    entries = []
     for idx, fn in enumerate(args.filenames):
         if not is_pattern(fn):
             filename = resolve_path(self.cur_dir, fn)
-            stat = auto(self.boards, get_stat, filename)
+            stat = stats[filename]
+            entries.append((idx, filename, stat, '*' if mode_isdir(stat_mode(stat)) else None))
+        else:  # A pattern was specified
+            filename, pattern = validate_pattern(
+                self.boards, self.cur_dir, fn)
+            if filename is None:  # An error was printed
+                continue
+            entries.append((idx, filename, None, pattern))
+    # list all directories in one go
+    dirs = [filename for _, filename, _, pattern in entries if pattern]
+    listings = auto_batch(self.boards, listdir_stat, dirs)
+    for idx, filename, stat, pattern in entries:
+        if stat is not None:
             mode = stat_mode(stat)
             if not mode_exists(mode):
                 err = "Cannot access '{}': No such file or directory"
@@ -65,14 +82,8 @@ def do_ls(self, line):
                 if idx > 0:
                     oprint('')
                 oprint("%s:" % filename)
-            pattern = '*'
-        else:  # A pattern was specified
-            filename, pattern = validate_pattern(
-                self.boards, self.cur_dir, fn)
-            if filename is None:  # An error was printed
-                continue
         files = []
-        ldir_stat = auto(self.boards, listdir_stat, filename)
+        ldir_stat = listings.pop(0)
         if ldir_stat is None:
             err = "Cannot access '{}': No such file or directory"
             eprint(err.format(filename))
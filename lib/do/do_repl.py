@@ -14,6 +14,9 @@ def do_repl(self, line):
 
        If you provide a line to the repl command, then that will be executed.
        If you want the REPL to exit, end the line with the ~ character.
+
+       Several lines pasted at once are sent in paste mode (Control-E),
+       so the board does not auto-indent them.
     """
     args = self.line_to_args(line)
     if len(args) > 0 and line[0] != '~':
@@ -34,7 +37,7 @@ def do_repl(self, line):
     mprint('   Hard reset:  Reset button on board or machine.reset()')
     print(printing.MPY_COLOR, end='')
 
-    board.repl(getch)
+    board.repl(getch.keys)
     print()
 
 
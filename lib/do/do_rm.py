@@ -1,5 +1,6 @@
 from util import add_arg
-from fileops import is_pattern, process_pattern, resolve_path, rm
+from fileops import is_pattern, process_pattern, resolve_path, auto_batch, remove_file, \
+    update_sync_manifest
 from printing import eprint
 
 argparse_rm = (
@@ -50,9 +51,10 @@ def do_rm(self, line):
         if filenames is None:
             return
 
-    for filename in filenames:
-        filename = resolve_path(self.cur_dir, filename)
-        if not rm(self.boards, filename, recursive=args.recursive, force=args.force):
-            if not args.force:
-                eprint("Unable to remove '{}' (try -rf if you are sure)".format(filename))
-            break
+    # remove all files in one go
+    filenames = [resolve_path(self.cur_dir, filename) for filename in filenames]
+    results = auto_batch(self.boards, remove_file, filenames, args.recursive, args.force)
+    update_sync_manifest(self.boards, (), filenames)
+    for filename, removed in zip(filenames, results):
+        if not removed and not args.force:
+            eprint("Unable to remove '{}' (try -rf if you are sure)".format(filename))
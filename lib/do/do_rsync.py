@@ -1,4 +1,5 @@
 from util import add_arg
+from fanout import argparse_fanout, fanout, fanout_boards
 from fileops import resolve_path, rsync
 from printing import eprint, qprint
 
@@ -22,6 +23,21 @@ argparse_rsync = (
         help='Shows what would be done without actually performing any file copies.',
         default=False
     ),
+    add_arg(
+        '-c', '--checksum',
+        dest='checksum',
+        action='store_true',
+        help='Compare files by content (SHA-256) rather than size and modification time.',
+        default=False
+    ),
+    add_arg(
+        '-s', '--scan',
+        dest='scan',
+        action='store_true',
+        help="Scan the board tree rather than reading it from the board's sync manifest.",
+        default=False
+    ),
+    *argparse_fanout,
     add_arg(
         'src_dst_dir',
         nargs=argparse.REMAINDER,
@@ -35,12 +51,18 @@ def complete_rsync(self, text, line, begidx, endidx):
     return self.filename_complete(text, line, begidx, endidx)
 
 def do_rsync(self, line):
-    """rsync [-m|--mirror] [-n|--dry-run] [SRC_DIR [DST_DIR]]
+    """rsync [-m|--mirror] [-n|--dry-run] [-c|--checksum] [-s|--scan] [--all|--boards A,B,C] [SRC_DIR [DST_DIR]]
 
        Synchronize destination directory tree to source directory tree.
+       Board trees are recorded in a manifest, /flash/.shell49_manifest, that
+       is updated by the changes shell49 makes. If files were changed
+       otherwise (e.g. by a program on the board), use --scan.
+       With --all or --boards, the default board paths refer to each of the
+       boards and the boards are synchronized concurrently.
     """
-    db = self.boards.default
     args = self.line_to_args(line)
+    targets = fanout_boards(self.boards, args)
+    db = targets[0] if targets else self.boards.default
     sd = args.src_dst_dir
     if len(sd) > 2:
         eprint("*** More than one destination directory given")
@@ -51,5 +73,13 @@ def do_rsync(self, line):
     dst_dir = resolve_path(self.cur_dir, dst_dir)
     if len(sd) < 2:
         qprint("synchronizing {} --> {}".format(src_dir, dst_dir))
+    if targets:
+        fanout(self.boards, targets,
+               lambda devs: rsync(devs, src_dir, dst_dir,
+                                  mirror=not args.mirror, dry_run=args.dry_run,
+                                  recursed=True, checksum=args.checksum,
+                                  scan=args.scan))
+        return
     rsync(self.boards, src_dir, dst_dir,
-          mirror=not args.mirror, dry_run=args.dry_run, recursed=True)
+          mirror=not args.mirror, dry_run=args.dry_run, recursed=True,
+          checksum=args.checksum, scan=args.scan)
@@ -1,4 +1,6 @@
-from printing import eprint, qprint
+from util import add_arg
+from fanout import argparse_fanout, fanout, fanout_boards
+from printing import eprint, qprint, mprint
 import printing
 
 import os
@@ -6,30 +8,49 @@ import os
 LAST_RUN_FILE = ''
 
 
+argparse_run = (
+    *argparse_fanout,
+    add_arg(
+        'file',
+        metavar='FILE',
+        nargs='?',
+        help='File to run, default: file from last invocation'
+    ),
+)
+
+
 def complete_run(self, text, line, begidx, endidx):
     return self.filename_complete(text, line, begidx, endidx)
 
 
 def do_run(self, line):
-    """run [FILE]
+    """run [--all|--boards A,B,C] [FILE]
 
     Send file to remote for execution and print results on console.
 
     If FILE is not specified, executes the file from the last invocation.
+    With --all or --boards the file runs on all listed boards concurrently
+    and the output of each board is shown when it finishes.
     """
     global LAST_RUN_FILE
-    args = line.split()
-    if len(args) > 1:
-        eprint("*** Only one file, please!")
-        return
+    args = self.line_to_args(line)
 
-    if len(args) == 0:
+    if args.file is None:
         file = LAST_RUN_FILE
         qprint("run '{}' on micropython board".format(file))
     else:
-        file = os.path.join(self.cur_dir, args[0])
+        file = os.path.join(self.cur_dir, args.file)
         LAST_RUN_FILE = file
 
+    targets = fanout_boards(self.boards, args)
+    if targets:
+        if not os.path.isfile(os.path.expanduser(file)):
+            eprint("*** File not found on host, '{}'".format(file))
+            return
+        fanout(self.boards, targets,
+               lambda devs: devs.default.execfile(file, data_consumer=mputch, timeout=None))
+        return
+
     print(printing.MPY_COLOR, end='')
     try:
         self.boards.default.execfile(file, data_consumer=putch, timeout=None)
@@ -41,3 +62,8 @@ def do_run(self, line):
 
 def putch(byte):
     print(byte.decode('utf-8'), end='', flush=True)
+
+
+def mputch(byte):
+    """putch for output that is collected per board"""
+    mprint(byte.decode('utf-8', errors='replace'), end='')
@@ -0,0 +1,9 @@
+def do_softreset(self, line):
+    """softreset
+
+    Soft reset the default board (serial connections only).
+
+    shell49 keeps the board in the raw REPL between commands and does not
+    reset it. Use this command to start from a clean interpreter state.
+    """
+    self.boards.default.soft_reset()
@@ -0,0 +1,26 @@
+from fanout import argparse_fanout, fanout, fanout_boards
+from tune import tune
+
+
+argparse_tune = (
+    *argparse_fanout,
+)
+
+
+def do_tune(self, line):
+    """tune [--all|--boards A,B,C]
+
+    Measure file transfer throughput for several buffer sizes and
+    windows and store the fastest in the board's configuration
+    (buffer_size, xfer_window_serial or xfer_window_network).
+
+    With config option autotune set, boards are also tuned when they
+    connect for the first time. Tuning writes trial files of up to 64 kB
+    to the board. Run tune again after changing the connection or firmware.
+    """
+    args = self.line_to_args(line)
+    targets = fanout_boards(self.boards, args)
+    if targets:
+        fanout(self.boards, targets, lambda devs: tune(devs.default) is not None)
+        return
+    tune(self.boards.default)
@@ -0,0 +1,97 @@
+from board import BoardError
+from connection import ConnectionError
+from printing import Capture, cprint, eprint, oprint, qprint
+from util import add_arg, column_print
+
+import queue
+import threading
+import time
+
+
+# options of commands that can run against many boards
+argparse_fanout = (
+    add_arg(
+        '--all',
+        dest='all_boards',
+        action='store_true',
+        help='Run on all connected boards concurrently',
+        default=False
+    ),
+    add_arg(
+        '--boards',
+        dest='boards',
+        metavar='A,B,C',
+        help='Run on the listed boards (name, id, port or ip) concurrently',
+        default=None
+    ),
+)
+
+
+def fanout_boards(boards, args):
+    """Boards selected with --all or --boards, None if neither was given."""
+    if args.boards:
+        return boards.select([name for name in args.boards.split(',') if name])
+    if args.all_boards:
+        return boards.select()
+    return None
+
+
+def fanout(boards, targets, func):
+    """Run func(devs) concurrently, one thread per board in targets.
+    devs is a view of boards with the target as default board, so func
+    runs unchanged commands written for the default board.
+
+    The output of each board is printed as a block when its thread
+    finishes, followed by a summary of time and traffic per board.
+    func fails if it raises, prints an error or returns False.
+    Returns the list of boards that failed.
+    """
+    done = queue.Queue()
+    # boards that fail may disconnect
+    labels = {board: (board.name, board.address) for board in targets}
+
+    def worker(board):
+        sent, received = board.traffic
+        start = time.time()
+        ok = False
+        with Capture() as out:
+            try:
+                ok = func(boards.view(board)) is not False
+            except (BoardError, ConnectionError) as e:
+                eprint(str(e))
+            except Exception as e:
+                eprint("{}: {}".format(type(e).__name__, e))
+            finally:
+                elapsed = time.time() - start
+                if board.connected:
+                    sent, received = (b - a for a, b in zip((sent, received), board.traffic))
+                else:
+                    sent = received = 0
+                done.put((board, ok and not out.error_count, elapsed, sent, received,
+                          out.getvalue()))
+
+    threads = [threading.Thread(target=worker, args=(board,), daemon=True)
+               for board in targets]
+    for t in threads:
+        t.start()
+    results = {}
+    for _ in threads:
+        board, ok, elapsed, sent, received, output = done.get()
+        results[board] = (ok, elapsed, sent, received)
+        qprint("---- {} ({}) {}".format(*labels[board], 'ok' if ok else 'FAILED'))
+        if output:
+            cprint(output, end='', flush=True)
+
+    rows = [("Board", "Port/IP", "Time [s]", "Sent [kB]", "Recv [kB]", "Status")]
+    failed = []
+    for board in targets:
+        ok, elapsed, sent, received = results[board]
+        if not ok:
+            failed.append(board)
+        rows.append((*labels[board], "{:.2f}".format(elapsed), "{:.1f}".format(sent / 1024),
+                     "{:.1f}".format(received / 1024), 'ok' if ok else 'FAILED'))
+    column_print('<<>>> ', rows, oprint)
+    if failed:
+        eprint("Failed on {} of {} boards: {}".format(
+            len(failed), len(targets), ', '.join(labels[b][0] for b in failed)))
+    return failed
@@ -1,10 +1,18 @@
 from printing import dprint, eprint, qprint, oprint
 
 import os
+import io
 import sys
+import time
+import zlib
+import struct
+import hashlib
 import binascii
+import codecs
 import fnmatch
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 """
 Many of the functions defined in this file are sent to the remote upy
@@ -17,16 +25,34 @@ or remote (True). It is set to True in function Device.remote().
 
 IS_UPY = False
 HAS_BUFFER = True
-BUFFER_SIZE = 2048
+# on the host; helpers sent to a board get the board's buffer_size
+BUFFER_SIZE = 4096
 TIME_OFFSET = 0
 
-def set_fileops_params(has_buffer, buffer_size, time_offset):
-    """Called from Board.remote"""
-    global HAS_BUFFER, BUFFER_SIZE, TIME_OFFSET
-    HAS_BUFFER = has_buffer
-    BUFFER_SIZE = buffer_size
-    TIME_OFFSET = time_offset
-
+# files at least COMPRESS_MIN bytes are transferred deflated if that
+# saves at least 1 - COMPRESS_RATIO of the bytes
+COMPRESS_MIN = 512
+COMPRESS_RATIO = 0.8
+# the board inflates uploads with a 2**DEFLATE_WBITS byte window
+DEFLATE_WBITS = 10
+# deflated data is kept in files with this suffix on the board, like
+# .part files they belong to shell49
+DEFLATE_SUFFIX = '.part.z'
+# delta uploads: files of at least delta_min_size (config) bytes whose
+# patch is no larger than DELTA_RATIO of the file, in DELTA_BLOCK blocks
+DELTA_MIN_SIZE = 64 * 1024
+DELTA_RATIO = 0.5
+DELTA_BLOCK = 1024
+# board trees synchronized by rsync are recorded in this file in the board
+# root (see read_manifest), (board, root) -> (generation, entries) last read,
+# (0, None) if the board has none
+SYNC_MANIFEST = '.shell49_manifest'
+_sync_manifests = {}
+# rsync --checksum hashes at most this many bytes per batched call,
+# so the board answers within the read timeout
+CHECKSUM_BATCH_BYTES = 512 * 1024
+# already compressed, not worth trying
+COMPRESSED_EXTENSIONS = ('.gz', '.z', '.zip', '.jpg', '.jpeg', '.png', '.gif', '.mp3')
 
 def find_matching_files(match):
     """Finds all of the files wihch match (used for completion)."""
@@ -173,9 +199,6 @@ def auto(devs, func, filename, *args, **kwargs):
     """
     dev, dev_filename = devs.get_dev_and_path(filename)
     if dev is None:
-        # use large buffer on the host
-        global BUFFER_SIZE
-        BUFFER_SIZE = 4096
         try:
             dev_filename = os.path.expanduser(dev_filename)
         except IndexError:
@@ -185,6 +208,27 @@ def auto(devs, func, filename, *args, **kwargs):
     return res
 
 
+def auto_batch(devs, func, filenames, *args, **kwargs):
+    """Like auto, for a list of filenames. Returns list of results.
+       Calls on the same board are combined into one remote_batch.
+    """
+    results = [None] * len(filenames)
+    by_dev = {}
+    for i, filename in enumerate(filenames):
+        dev, dev_filename = devs.get_dev_and_path(filename)
+        if dev is None:
+            results[i] = func(os.path.expanduser(dev_filename), *args, **kwargs)
+        else:
+            by_dev.setdefault(dev, []).append((i, dev_filename))
+    for dev, items in by_dev.items():
+        res = dev.remote_batch([(func, (fn,) + args, kwargs) for _, fn in items])
+        for (i, _), r in zip(items, res):
+            if isinstance(r, Exception):
+                raise r
+            results[i] = r
+    return results
+
+
 def cat(devs, src_filename, dst_file):
     """Copies the contents of the indicated file to an already opened file."""
     src_filename = os.path.expanduser(src_filename)
@@ -196,7 +240,7 @@ def cat(devs, src_filename, dst_file):
     else:
         filesize = dev.remote_eval(get_filesize, dev_filename)
         return dev.remote(send_file_to_host, dev_filename, dst_file, filesize,
-                          xfer_func=recv_file_from_remote)
+                          **xfer_options(dev), xfer_func=recv_file_from_remote)
 
 
 def chdir(dirname):
@@ -223,10 +267,21 @@ def copy_file(src_filename, dst_filename):
         return False
 
 
-def cp(devs, src_filename, dst_filename):
+def cp(devs, src_filename, dst_filename, resume=False, record=True):
     """Copies one file to another. The source file may be local or remote and
        the destnation file may be local or remote.
+       Transfers between host and board go to dst_filename.part first, resume
+       continues from the part of it that matches the source.
+       With record, a file copied to a board is recorded in its sync manifest.
     """
+    res = copy(devs, src_filename, dst_filename, resume)
+    if res and record:
+        update_sync_manifest(devs, [(dst_filename, None)])
+    return res
+
+
+def copy(devs, src_filename, dst_filename, resume):
+    """cp without recording the copy"""
     src_dev, src_dev_filename = devs.get_dev_and_path(src_filename)
     dst_dev, dst_dev_filename = devs.get_dev_and_path(dst_filename)
 
@@ -238,27 +293,499 @@ def cp(devs, src_filename, dst_filename):
 
     if dst_dev is None:
         # Copying from remote to host
-        with open(dst_dev_filename, 'wb') as dst_file:
-            return src_dev.remote(send_file_to_host, src_dev_filename, dst_file,
-                                  filesize, xfer_func=recv_file_from_remote)
+        part_filename = dst_dev_filename + '.part'
+        offset = 0
+        if resume:
+            offset = download_offset(src_dev, src_dev_filename, part_filename)
+        with open(part_filename, 'ab' if offset else 'wb') as dst_file:
+            res = download(src_dev, src_dev_filename, dst_file, filesize, offset)
+        if res:
+            os.replace(part_filename, dst_dev_filename)
+        elif os.path.getsize(part_filename) == 0:
+            os.remove(part_filename)
+        return res
     if src_dev is None:
         # Copying from host to remote
         with open(src_dev_filename, 'rb') as src_file:
-            res = dst_dev.remote(recv_file_from_host, src_file, dst_dev_filename,
-                                 filesize, xfer_func=send_file_to_remote)
-            return res
+            return upload(dst_dev, src_file, dst_dev_filename, filesize, resume=resume)
 
     # Copying from remote A to remote B. We first copy the file
     # from remote A to the host and then from the host to remote B
     host_temp_file = tempfile.TemporaryFile()
-    if src_dev.remote(send_file_to_host, src_dev_filename, host_temp_file,
-                      filesize, xfer_func=recv_file_from_remote):
+    if download(src_dev, src_dev_filename, host_temp_file, filesize):
         host_temp_file.seek(0)
-        return dst_dev.remote(recv_file_from_host, host_temp_file, dst_dev_filename,
-                              filesize, xfer_func=send_file_to_remote)
+        return upload(dst_dev, host_temp_file, dst_dev_filename, filesize)
     return False
 
 
+def cp_many(devs, pairs, resume=False, record=True):
+    """Copies files [(src_filename, dst_filename), ...] like cp.
+       Files copied from the host to the same board are sent in a single
+       bulk transfer (unless resuming). Returns list of success flags.
+    """
+    results = [None] * len(pairs)
+    bulk = {}
+    for i, (src_filename, dst_filename) in enumerate(pairs):
+        src_dev, src_dev_filename = devs.get_dev_and_path(src_filename)
+        dst_dev, dst_dev_filename = devs.get_dev_and_path(dst_filename)
+        if src_dev is None and dst_dev is not None and not dst_dev.has_file_transfer and \
+           not resume and \
+           os.path.getsize(os.path.expanduser(src_dev_filename)) < delta_min_size(dst_dev):
+            bulk.setdefault(dst_dev, []).append(
+                (i, os.path.expanduser(src_dev_filename), dst_dev_filename))
+        else:
+            results[i] = copy(devs, src_filename, dst_filename, resume)
+    for dev, items in bulk.items():
+        if len(items) == 1:
+            i = items[0][0]
+            results[i] = copy(devs, *pairs[i], False)
+            continue
+        res = upload_files(dev, [(src, dst) for _, src, dst in items])
+        for (i, _, _), r in zip(items, res):
+            results[i] = r
+    if record:
+        update_sync_manifest(devs, [(dst, None) for (_, dst), res in zip(pairs, results) if res])
+    return results
+
+
+def upload_files(dev, files):
+    """Copy host files [(src_filename, dst_filename), ...] to board dev in a
+       single transfer. Returns list of success flags.
+    """
+    start = time.time()
+    results = [False] * len(files)
+    records = []  # (index, dst_filename, mode, data)
+    size = 0
+    for i, (src_filename, dst_filename) in enumerate(files):
+        try:
+            with open(src_filename, 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        size += len(data)
+        z = None
+        if dev.deflate and compress_enabled(dev, dst_filename, len(data)):
+            z = compress(data)
+        if z is None:
+            records.append((i, dst_filename, 'w', data))
+        else:
+            records.append((i, dst_filename, 'z', z))
+    res = dev.remote_eval(recv_files_from_host, len(records), **xfer_options(dev),
+                          xfer_func=partial(send_files_to_remote, records=records))
+    for (i, _, _, _), r in zip(records, res or []):
+        results[i] = r
+    report_throughput('upload', '{} files'.format(len(files)), size, start, 'bulk')
+    return results
+
+
+def upload(dev, src_file, dst_filename, filesize, delta=True, resume=False):
+    """Copy open host file to dst_filename on board dev.
+       resume continues an interrupted upload from dst_filename.part.
+       Large files that exist on the board are patched (delta upload).
+       Compressible files are sent deflated to boards that can inflate.
+    """
+    start = time.time()
+    if dev.has_file_transfer:
+        res = dev.put_file(src_file, dst_filename, filesize)
+        report_throughput('upload', dst_filename, filesize, start, 'webrepl')
+        return res
+    offset = upload_offset(dev, src_file, dst_filename + '.part') if resume else 0
+    if offset:
+        src_file.seek(offset)
+        res = dev.remote_eval(recv_file_from_host, src_file, dst_filename, filesize,
+                              offset, **xfer_options(dev), xfer_func=send_file_to_remote)
+        report_throughput('upload', dst_filename, filesize - offset, start,
+                          'resume at {}'.format(offset))
+        return res
+    if delta and filesize >= delta_min_size(dev):
+        data = src_file.read()
+        res = upload_delta(dev, data, dst_filename)
+        if res is not None:
+            report_throughput('upload', dst_filename, filesize, start, 'delta')
+            return res
+        src_file = io.BytesIO(data)
+    if dev.deflate and compress_enabled(dev, dst_filename, filesize):
+        data = src_file.read()
+        z = compress(data)
+        if z is not None:
+            # compress is deterministic, an interrupted upload of the
+            # deflated data is resumed like any other
+            tmp_filename = dst_filename + DEFLATE_SUFFIX
+            z_file = io.BytesIO(z)
+            offset = upload_offset(dev, z_file, tmp_filename + '.part') if resume else 0
+            z_file.seek(offset)
+            res = dev.remote_eval(recv_file_from_host, z_file, tmp_filename,
+                                  len(z), offset, **xfer_options(dev),
+                                  xfer_func=send_file_to_remote) and \
+                dev.remote_eval(inflate_file, tmp_filename, dst_filename)
+            report_throughput('upload', dst_filename, filesize, start,
+                              'deflate {:.0%}'.format(len(z) / filesize) +
+                              (', resume at {}'.format(offset) if offset else ''))
+            return res
+        src_file = io.BytesIO(data)
+    res = dev.remote_eval(recv_file_from_host, src_file, dst_filename,
+                          filesize, **xfer_options(dev), xfer_func=send_file_to_remote)
+    report_throughput('upload', dst_filename, filesize, start, 'raw')
+    return res
+
+
+def upload_offset(dev, src_file, part_filename):
+    """Size of part_filename on board dev if it matches the start of open
+       host file src_file, else 0."""
+    size, digest = dev.remote_batch([(get_filesize, (part_filename,), {}),
+                                     (file_hash, (part_filename,), {})])
+    if isinstance(size, Exception) or size <= 0 or not isinstance(digest, bytes):
+        return 0
+    data = src_file.read(size)
+    src_file.seek(0)
+    if len(data) == size and hashlib.sha256(data).digest() == digest:
+        return size
+    return 0
+
+
+def download_offset(dev, src_filename, part_filename):
+    """Size of host file part_filename if it matches the start of
+       src_filename on board dev, else 0."""
+    try:
+        size = os.path.getsize(part_filename)
+    except OSError:
+        return 0
+    if size and dev.remote_eval(file_hash, src_filename, size) == file_hash(part_filename):
+        return size
+    return 0
+
+
+def delta_min_size(dev):
+    """Smallest file uploaded as delta to dev"""
+    return dev.get_config('delta_min_size', DELTA_MIN_SIZE)
+
+
+def upload_delta(dev, data, dst_filename):
+    """Update dst_filename on board dev to data by sending only the blocks
+       that changed. None if the board has no usable copy or the patch
+       would be too large, otherwise success.
+    """
+    checksums = dev.remote_eval(block_checksums, dst_filename, DELTA_BLOCK)
+    if not checksums:
+        return None
+    patch = make_patch(data, checksums, DELTA_BLOCK)
+    dprint("delta {}: patch {} bytes for {} bytes".format(dst_filename, len(patch), len(data)))
+    if len(patch) > DELTA_RATIO * len(data):
+        return None
+    patch_filename = dst_filename + '.delta'
+    if upload(dev, io.BytesIO(patch), patch_filename, len(patch), delta=False) and \
+       dev.remote_eval(apply_delta, dst_filename, patch_filename, DELTA_BLOCK,
+                       hashlib.sha256(data).digest()):
+        return True
+    # e.g. file changed since the checksums, send all of it
+    return None
+
+
+def crc32_raw(crc, data):
+    """CRC-32 register after data, starting from register crc"""
+    return zlib.crc32(data, crc ^ 0xffffffff) ^ 0xffffffff
+
+
+def make_patch(data, checksums, block_size):
+    """Patch (see apply_delta) building data from a file with block
+       checksums [(crc32, sha256[:8]), ...], found with a rolling CRC-32.
+    """
+    blocks = {}
+    for i, (crc, strong) in enumerate(checksums):
+        blocks.setdefault(crc, []).append((i, strong))
+    # rolling: drop the byte leaving the window (out) and the initial
+    # register contribution one block back (k)
+    table = [crc32_raw(0, bytes((b,))) for b in range(256)]
+    zeros = bytes(block_size)
+    out = [crc32_raw(0, bytes((b,)) + zeros) for b in range(256)]
+    k = crc32_raw(0xffffffff, zeros + b'\0') ^ crc32_raw(0xffffffff, zeros)
+    ops = []  # (bytes,) literal or [first block, count] copy
+
+    def literal(start, end):
+        if end > start:
+            ops.append((data[start:end],))
+
+    n = len(data)
+    start = pos = 0
+    reg = None
+    while pos + block_size <= n:
+        if reg is None:
+            reg = crc32_raw(0xffffffff, data[pos:pos + block_size])
+        match = None
+        for i, strong in blocks.get(reg ^ 0xffffffff, ()):
+            if hashlib.sha256(data[pos:pos + block_size]).digest()[:8] == strong:
+                match = i
+                break
+        if match is not None:
+            literal(start, pos)
+            if ops and len(ops[-1]) == 2 and ops[-1][0] + ops[-1][1] == match:
+                ops[-1][1] += 1
+            else:
+                ops.append([match, 1])
+            pos += block_size
+            start = pos
+            reg = None
+            continue
+        if pos + block_size < n:
+            reg = ((reg >> 8) ^ table[(reg ^ data[pos + block_size]) & 0xff]) ^ \
+                out[data[pos]] ^ k
+        pos += 1
+    literal(start, n)
+    patch = []
+    for op in ops:
+        if len(op) == 2:
+            patch.append(struct.pack('<BII', 0, op[0], op[1]))
+        else:
+            patch.append(struct.pack('<BII', 1, len(op[0]), 0) + op[0])
+    return b''.join(patch)
+
+
+def block_checksums(filename, block_size):
+    """Function which runs on the pyboard. (crc32, sha256[:8]) of each
+       block_size block of filename, None if it cannot be read.
+    """
+    from binascii import crc32
+    try:
+        import hashlib
+    except ImportError:
+        import uhashlib as hashlib
+    try:
+        res = []
+        buf = bytearray(block_size)
+        mv = memoryview(buf)
+        with open(filename, 'rb') as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                res.append((crc32(mv[0:n]), hashlib.sha256(mv[0:n]).digest()[:8]))
+        return res
+    except:
+        return None
+
+
+def apply_delta(dst_filename, patch_filename, block_size, digest):
+    """Function which runs on the pyboard. Rebuilds dst_filename from its
+       own blocks and the literal data in patch_filename (records: copy
+       (0, first block, count) or literal (1, length, 0) + data), checks the
+       SHA-256 digest of the result and renames it into place.
+    """
+    import os
+    import struct
+    try:
+        import hashlib
+    except ImportError:
+        import uhashlib as hashlib
+    tmp_filename = dst_filename + '.tmp'
+    ok = False
+    try:
+        h = hashlib.sha256()
+        buf = bytearray(block_size)
+        mv = memoryview(buf)
+        with open(dst_filename, 'rb') as old_file:
+            with open(patch_filename, 'rb') as patch_file:
+                with open(tmp_filename, 'wb') as new_file:
+                    while True:
+                        op = patch_file.read(9)
+                        if not op:
+                            break
+                        kind, a, b = struct.unpack('<BII', op)
+                        if kind == 0:
+                            old_file.seek(a * block_size)
+                            for i in range(b):
+                                n = old_file.readinto(buf)
+                                new_file.write(mv[0:n])
+                                h.update(mv[0:n])
+                            continue
+                        while a > 0:
+                            n = patch_file.readinto(mv[0:min(a, block_size)])
+                            if not n:
+                                raise OSError
+                            new_file.write(mv[0:n])
+                            h.update(mv[0:n])
+                            a -= n
+        ok = h.digest() == digest
+    except:
+        pass
+    try:
+        os.remove(patch_filename)
+    except:
+        pass
+    try:
+        if ok:
+            try:
+                os.rename(tmp_filename, dst_filename)
+            except OSError:
+                os.remove(dst_filename)
+                os.rename(tmp_filename, dst_filename)
+        else:
+            os.remove(tmp_filename)
+    except:
+        ok = False
+    return ok
+
+
+def download(dev, src_filename, dst_file, filesize, offset=0):
+    """Copy src_filename on board dev to open host file, from offset on
+       when resuming.
+       Compressible files are sent deflated by boards that can deflate.
+    """
+    start = time.time()
+    if offset:
+        res = dev.remote_eval(send_file_to_host, src_filename, dst_file, filesize,
+                              offset, **xfer_options(dev), xfer_func=recv_file_from_remote)
+        report_throughput('download', src_filename, filesize - offset, start,
+                          'resume at {}'.format(offset))
+        return res
+    if dev.has_file_transfer:
+        res = dev.get_file(src_filename, dst_file)
+        report_throughput('download', src_filename, filesize, start, 'webrepl')
+        return res
+    if dev.deflate > 1 and compress_enabled(dev, src_filename, filesize):
+        tmp_filename = src_filename + DEFLATE_SUFFIX
+        zsize = dev.remote_eval(deflate_file, src_filename, tmp_filename,
+                                int(COMPRESS_RATIO * filesize))
+        if zsize >= 0:
+            # inflated as received, a failed download leaves the data of
+            # the good blocks in dst_file for resuming
+            z = Inflater(dst_file)
+            try:
+                res = dev.remote_eval(send_file_to_host, tmp_filename, z, zsize,
+                                      **xfer_options(dev), xfer_func=recv_file_from_remote)
+                res = z.close() and res
+            finally:
+                from board import BoardError
+                from connection import ConnectionError
+                try:
+                    dev.remote_eval(remove_file, tmp_filename)
+                except (BoardError, ConnectionError):
+                    pass
+            report_throughput('download', src_filename, filesize, start,
+                              'deflate {:.0%}'.format(zsize / filesize))
+            return res
+    res = dev.remote_eval(send_file_to_host, src_filename, dst_file,
+                          filesize, **xfer_options(dev), xfer_func=recv_file_from_remote)
+    report_throughput('download', src_filename, filesize, start, 'raw')
+    return res
+
+
+def xfer_options(dev):
+    """File transfer keyword arguments for the helpers"""
+    return {'window': dev.xfer_window, 'encoding': dev.xfer_encoding}
+
+
+def compress(data):
+    """data deflated for the board, None if that does not save enough"""
+    c = zlib.compressobj(9, zlib.DEFLATED, DEFLATE_WBITS)
+    z = c.compress(data) + c.flush()
+    return z if len(z) <= COMPRESS_RATIO * len(data) else None
+
+
+class Inflater:
+    """Writable stream inflating the zlib data written to it into dst_file"""
+
+    def __init__(self, dst_file):
+        self._dst_file = dst_file
+        self._z = zlib.decompressobj()
+
+    def write(self, data):
+        self._dst_file.write(self._z.decompress(data))
+        return len(data)
+
+    def close(self):
+        """Write the rest, False if the data was incomplete"""
+        self._dst_file.write(self._z.flush())
+        return self._z.eof
+
+
+def compress_enabled(dev, filename, filesize):
+    """Try compressed transfer for filename of size filesize"""
+    return filesize >= COMPRESS_MIN and dev.get_config('compress', True) and \
+        not filename.lower().endswith(COMPRESSED_EXTENSIONS)
+
+
+def report_throughput(direction, filename, filesize, start, mode):
+    """Effective transfer rate, in debug output"""
+    elapsed = max(time.time() - start, 1e-6)
+    dprint("{} {}: {} bytes in {:.3f} s, {:.1f} kB/s effective ({})".format(
+        direction, filename, filesize, elapsed, filesize / 1024 / elapsed, mode))
+
+
+def inflate_file(src_filename, dst_filename):
+    """Function which runs on the pyboard. Decompresses src_filename
+       (zlib format) to dst_filename and removes src_filename. The data is
+       written to dst_filename.part, which replaces dst_filename when
+       complete; on error dst_filename is left as it was.
+    """
+    import os
+    try:
+        import deflate
+        decompress = lambda f: deflate.DeflateIO(f, deflate.ZLIB)
+    except ImportError:
+        import zlib
+        decompress = lambda f: zlib.DecompIO(f, 15)
+    part_filename = dst_filename + '.part'
+    try:
+        buf = bytearray(BUFFER_SIZE)
+        mv = memoryview(buf)
+        with open(src_filename, 'rb') as src_file:
+            with open(part_filename, 'wb') as dst_file:
+                z = decompress(src_file)
+                while True:
+                    n = z.readinto(buf)
+                    if not n:
+                        break
+                    dst_file.write(mv[0:n])
+        try:
+            os.rename(part_filename, dst_filename)
+        except OSError:
+            os.remove(dst_filename)
+            os.rename(part_filename, dst_filename)
+        return True
+    except:
+        try:
+            os.remove(part_filename)
+        except:
+            pass
+        return False
+    finally:
+        try:
+            os.remove(src_filename)
+        except:
+            pass
+
+
+def deflate_file(src_filename, dst_filename, max_size):
+    """Function which runs on the pyboard. Compresses src_filename to
+       dst_filename (zlib format). Returns the compressed size, or -1 (and
+       removes dst_filename) if it exceeds max_size.
+    """
+    import os
+    import deflate
+    try:
+        buf = bytearray(BUFFER_SIZE)
+        mv = memoryview(buf)
+        with open(src_filename, 'rb') as src_file:
+            with open(dst_filename, 'wb') as dst_file:
+                z = deflate.DeflateIO(dst_file, deflate.ZLIB)
+                while True:
+                    n = src_file.readinto(buf)
+                    if not n:
+                        break
+                    z.write(mv[0:n])
+                z.close()
+        size = os.stat(dst_filename)[6]
+        if size <= max_size:
+            return size
+    except:
+        pass
+    try:
+        os.remove(dst_filename)
+    except:
+        pass
+    return -1
+
+
 def eval_str(string):
     """Executes a string containing python code."""
     output = eval(string)
@@ -382,7 +909,10 @@ def make_directory(dirname):
 
 def mkdir(devs, filename):
     """Creates a directory."""
-    return auto(devs, make_directory, filename)
+    res = auto(devs, make_directory, filename)
+    if res:
+        update_sync_manifest(devs, [(filename, None)])
+    return res
 
 
 def remove_file(filename, recursive=False, force=False):
@@ -410,156 +940,469 @@ def remove_file(filename, recursive=False, force=False):
     return True
 
 
+def file_hash(filename, size=-1):
+    """SHA-256 digest of the contents of filename, of its first size bytes
+       if size >= 0. None if it cannot be read.
+    """
+    try:
+        import hashlib
+    except ImportError:
+        import uhashlib as hashlib
+    try:
+        h = hashlib.sha256()
+        buf = bytearray(BUFFER_SIZE)
+        mv = memoryview(buf)
+        with open(filename, 'rb') as f:
+            while size != 0:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                if 0 < size < n:
+                    n = size
+                h.update(mv[0:n])
+                size -= n
+        return h.digest()
+    except:
+        return None
+
+
+def file_hashes(devs, filenames, sizes):
+    """file_hash of each of filenames (of sizes bytes).
+       Board files are hashed in batched calls, host files in parallel.
+    """
+    results = [None] * len(filenames)
+    host = []
+    batch = []
+    batch_bytes = 0
+    with ThreadPoolExecutor() as pool:
+        for i, (filename, size) in enumerate(zip(filenames, sizes)):
+            dev, dev_filename = devs.get_dev_and_path(filename)
+            if dev is None:
+                host.append((i, pool.submit(file_hash, os.path.expanduser(dev_filename))))
+                continue
+            if batch and batch_bytes + size > CHECKSUM_BATCH_BYTES:
+                for j, h in zip(batch, auto_batch(devs, file_hash, [filenames[j] for j in batch])):
+                    results[j] = h
+                batch = []
+                batch_bytes = 0
+            batch.append(i)
+            batch_bytes += size
+        if batch:
+            for j, h in zip(batch, auto_batch(devs, file_hash, [filenames[j] for j in batch])):
+                results[j] = h
+        for i, future in host:
+            results[i] = future.result()
+    return results
+
+
 def rm(devs, filename, recursive=False, force=False):
     """Removes a file or directory tree."""
-    return auto(devs, remove_file, filename, recursive, force)
-
-
-def make_dir(devs, dst_dir, dry_run, recursed):
-    """Creates a directory. Produces information in case of dry run.
-    Isues error where necessary.
-    """
-    parent = os.path.split(dst_dir.rstrip(
-        '/'))[0]  # Check for nonexistent parent
-    parent_files = auto(devs, listdir_stat,
-                        parent) if parent else True  # Relative dir
-    if dry_run:
-        if recursed:  # Assume success: parent not actually created yet
-            qprint("Creating directory {}".format(dst_dir))
-        elif parent_files is None:
-            qprint("Unable to create {}".format(dst_dir))
-        return True
-    if not mkdir(devs, dst_dir):
-        eprint("Unable to create {}".format(dst_dir))
-        return False
-    return True
+    res = auto(devs, remove_file, filename, recursive, force)
+    update_sync_manifest(devs, (), [filename])
+    return res
 
 
-def file_dir(devs, directory):
-    """Dict name->stat of files in directory,
-       filted by rsync_includes, rsync_excludes
+def walk_manifest(root, includes, excludes, recursive=True, save=None):
+    """Entries (path relative to root, mode, size, mtime, None) of root and the
+       tree below it. The last field is the SHA-256 digest recorded for files
+       copied by rsync --checksum (see update_manifest). Names matching excludes are skipped,
+       files must match includes (* and ? wildcards).
+       On the board entries are printed as they are found and the number of
+       entries is returned, on the host the list of entries is returned.
+       With save, the board also writes them to the sync manifest file save
+       (see read_manifest).
+    """
+    import os
+
+    def match(name, pat):
+        if not pat:
+            return not name
+        if pat[0] == '*':
+            return any(match(name[i:], pat[1:]) for i in range(len(name) + 1))
+        return len(name) > 0 and pat[0] in ('?', name[0]) and match(name[1:], pat[1:])
+
+    entries = []
+    count = 0
+    root = root.rstrip('/')
+    out = None
+    if IS_UPY and save:
+        gen = 0
+        try:
+            with open(save) as f:
+                for line in f:
+                    pass
+            gen = eval(line)[1]
+        except:
+            pass
+        try:
+            # rewritten in place, so the stat of root is not changed by it
+            open(save, 'a').close()
+            fingerprint = os.stat(root)
+            out = open(save, 'w')
+        except OSError:
+            pass
+    stack = ['']
+    while stack:
+        path = stack.pop()
+        filename = root + '/' + path if path else root or '/'
+        try:
+            st = os.stat(filename)
+        except OSError:
+            continue
+        is_dir = st[0] & 0x4000 != 0
+        name = path.split('/')[-1]
+        if path and not is_dir and not any(match(name, pat) for pat in includes):
+            continue
+        mtime = st[8] + TIME_OFFSET if IS_UPY else int(st[8])
+        entry = (path, st[0], st[6], mtime, None)
+        if IS_UPY:
+            print(repr(entry))
+            if out:
+                out.write(repr(entry) + '\n')
+            count += 1
+        else:
+            entries.append(entry)
+        if is_dir and (recursive or not path):
+            for name in os.listdir(filename):
+                if not any(match(name, pat) for pat in excludes):
+                    stack.append(path + '/' + name if path else name)
+    if out:
+        out.write(repr(('#', gen + 1, fingerprint[:7] + fingerprint[8:],
+                        includes, excludes, count)) + '\n')
+        out.close()
+    return count if IS_UPY else entries
+
+
+def read_manifest(filename, root, includes, excludes, gen=0):
+    """Function which runs on the pyboard. Prints the entries of the sync
+       manifest filename of root (see walk_manifest) and returns
+       (generation, number of entries), or (generation, -2) without printing
+       them if the manifest is still at generation gen.
+       Returns (0, -1) if there is no valid manifest: it is incomplete, was
+       made with other includes or excludes, or the stat of root changed.
+       The manifest is a line per entry followed by the line
+       ('#', generation, stat of root, includes, excludes, number of entries).
+    """
+    import os
+    try:
+        st = os.stat(root)
+        count = -1
+        with open(filename) as f:
+            for line in f:
+                count += 1
+        trailer = eval(line)
+        if trailer[0] != '#' or trailer[5] != count or trailer[2] != st[:7] + st[8:] or \
+           trailer[3] != includes or trailer[4] != excludes:
+            return (0, -1)
+        if trailer[1] == gen:
+            return (gen, -2)
+        with open(filename) as f:
+            for _ in range(count):
+                print(f.readline(), end='')
+        return (trailer[1], count)
+    except:
+        return (0, -1)
+
+
+def update_manifest(filename, root, written, removed):
+    """Function which runs on the pyboard. Records changes made to the tree at
+       root in its sync manifest filename: written [(path, digest), ...] are
+       stat'ed, removed paths and the trees below them are dropped. Returns
+       (generation, [(mode, size, mtime) or None for each of written]),
+       (0, None) if there is no valid manifest; an invalid one is removed.
+    """
+    import os
+    try:
+        with open(filename) as f:
+            lines = f.readlines()
+        trailer = eval(lines.pop())
+        if trailer[0] != '#' or trailer[5] != len(lines):
+            raise ValueError
+        stats = []
+        for path, _ in written:
+            try:
+                st = os.stat(root + '/' + path if path else root)
+                stats.append((st[0], st[6], st[8] + TIME_OFFSET))
+            except OSError:
+                stats.append(None)
+        paths = set(path for path, _ in written)
+        st = os.stat(root)
+        count = 0
+        with open(filename, 'w') as f:
+            for line in lines:
+                path = eval(line)[0]
+                if path in paths or any(path == p or path.startswith(p + '/') for p in removed):
+                    continue
+                f.write(line)
+                count += 1
+            for (path, digest), file_st in zip(written, stats):
+                if file_st:
+                    f.write(repr((path,) + file_st + (digest,)) + '\n')
+                    count += 1
+            f.write(repr(('#', trailer[1] + 1, st[:7] + st[8:],
+                          trailer[3], trailer[4], count)) + '\n')
+        return (trailer[1] + 1, stats)
+    except:
+        try:
+            os.remove(filename)
+        except:
+            pass
+        return (0, None)
+
+
+def manifest(devs, root, recursive=True, scan=False, save=True):
+    """Dict path -> (mode, size, mtime, digest) of the tree at root
+       (see walk_manifest), filtered by rsync_includes, rsync_excludes.
+       The root itself is path '', missing if root does not exist.
+       Board trees come from the sync manifest of the board root if it is
+       valid, unless scan. Otherwise the tree is scanned, and with save the
+       sync manifest rewritten.
     """
-    dev, filename = devs.get_dev_and_path(directory)
     inc = devs.config.get(0, 'rsync_includes',
                           default='*.py,*.json,*.txt,*.html').split(',')
     exc = devs.config.get(0, 'rsync_excludes', default='.DS_store,__*__').split(',')
-    files = auto(devs, listdir_stat, directory)
-    if not files:
-        files = []
-    d = {}
-    for name, stat in files:
-        y = any(map((lambda x: fnmatch.fnmatch(name, x)), inc)) or is_dir(stat)
-        n = any(map((lambda x: fnmatch.fnmatch(name, x)), exc))
-        if y and not n:
-            d[name] = stat
+    dev, dev_root = devs.get_dev_and_path(root)
+    if dev is None:
+        dev_root = os.path.expanduser(dev_root)
+        entries = walk_manifest(dev_root, inc, exc, recursive)
+        return {e[0]: e[1:] for e in entries}
+    exc.append(SYNC_MANIFEST)
+    s_root = sync_root(dev, dev_root) if recursive else None
+    entries = None
+    if s_root:
+        entries = sync_manifest(dev, s_root, inc, exc, scan, save)
+    if entries is None:
+        return {e[0]: e[1:] for e in board_manifest(dev, dev_root, inc, exc, recursive)}
+    sub = dev_root.rstrip('/')[len(s_root):].strip('/')
+    if not sub:
+        return {e[0]: e[1:] for e in entries}
+    return {e[0][len(sub) + 1:]: e[1:] for e in entries
+            if e[0] == sub or e[0].startswith(sub + '/')}
+
+
+def board_manifest(dev, dev_root, inc, exc, recursive, save=None):
+    """walk_manifest on board dev, returns the list of entries"""
+    lines = dev.remote(walk_manifest, dev_root, inc, exc, recursive, save) \
+               .decode('utf-8').splitlines()
+    count = int(lines.pop())
+    entries = [eval(line) for line in lines]
+    if len(entries) != count:
+        from board import BoardError
+        raise BoardError("walk_manifest: got {} of {} entries".format(len(entries), count))
+    return entries
+
+
+def sync_root(dev, dev_filename):
+    """Board root directory (e.g. /flash) holding the sync manifest for
+       dev_filename, None if there is none or config sync_manifest is off.
+    """
+    if not dev.get_config('sync_manifest', True):
+        return None
+    for root_dir in dev.root_dirs:
+        if (dev_filename.rstrip('/') + '/').startswith(root_dir):
+            return root_dir.rstrip('/')
+    return None
+
+
+def sync_manifest(dev, root, inc, exc, scan, save):
+    """Entries of the tree at board root from its sync manifest. The
+       manifest is only sent if it changed since the last call. Without a
+       valid manifest (or with scan) the tree is scanned and, with save, the
+       manifest rewritten; returns None if it is not.
+    """
+    key = (dev, root)
+    filename = root + '/' + SYNC_MANIFEST
+    entries = None
+    if not scan:
+        gen, entries = _sync_manifests.get(key, (0, None))
+        lines = dev.remote(read_manifest, filename, root, inc, exc, gen if entries else 0) \
+                   .decode('utf-8').splitlines()
+        gen, count = eval(lines.pop())
+        if count == -1:
+            dprint("sync manifest {} not valid".format(filename))
+            entries = None
+        elif count >= 0:
+            entries = [eval(line) for line in lines]
+            if len(entries) != count:
+                from board import BoardError
+                raise BoardError("read_manifest: got {} of {} entries".format(len(entries), count))
+        if entries is None:
+            _sync_manifests.pop(key, None)
         else:
-            dprint("squashing {} y={} n={}".format(name, y, n))
-    return d
+            _sync_manifests[key] = (gen, entries)
+    if entries is None and save:
+        dprint("scan {}, write {}".format(root, filename))
+        entries = board_manifest(dev, root, inc, exc, True, filename)
+        _sync_manifests.pop(key, None)
+    return entries
 
 
-def rsync(devs, src_dir, dst_dir, mirror, dry_run, recursed):
-    """Synchronizes 2 directory trees."""
+def update_sync_manifest(devs, written, removed=()):
+    """Record writes [(filename, digest or None), ...] and removals
+       [filename, ...] made by shell49 in the sync manifests of the boards.
+    """
+    changes = {}
+    for filenames, i in ((list(written), 0), ([(fn, None) for fn in removed], 1)):
+        for filename, digest in filenames:
+            dev, dev_filename = devs.get_dev_and_path(filename)
+            root = sync_root(dev, dev_filename) if dev else None
+            if root:
+                path = dev_filename.rstrip('/')[len(root):].strip('/')
+                changes.setdefault((dev, root), ([], []))[i].append(
+                    (path, digest) if i == 0 else path)
+    for key, (w, r) in changes.items():
+        cached = _sync_manifests.get(key)
+        if cached and cached[1] is None:
+            # no manifest on the board, nothing to update
+            continue
+        dev, root = key
+        gen, stats = dev.remote_eval(update_manifest, root + '/' + SYNC_MANIFEST, root, w, r)
+        _sync_manifests.pop(key, None)
+        if not gen:
+            _sync_manifests[key] = (0, None)
+        elif cached and cached[0] == gen - 1:
+            # apply the same changes to the entries read before
+            paths = set(p for p, _ in w)
+            entries = [e for e in cached[1] if e[0] not in paths and not
+                       any(e[0] == p or e[0].startswith(p + '/') for p in r)]
+            entries += [(p,) + st + (d,) for (p, d), st in zip(w, stats) if st]
+            _sync_manifests[key] = (gen, entries)
+
+
+def rsync(devs, src_dir, dst_dir, mirror, dry_run, recursed, checksum=False, scan=False):
+    """Synchronizes 2 directory trees.
+       With checksum, files are compared by content hash instead of size and mtime.
+       Board trees are read from, and changes recorded in, the sync manifest
+       of the board root; scan ignores it and scans the tree.
+    """
 
     # This test is a hack to avoid errors when accessing /flash. When the
     # cache synchronisation issue is solved it should be removed
     if not isinstance(src_dir, str) or not len(src_dir):
         return
 
+    # both trees in one call each
+    m_src = manifest(devs, src_dir, recursed, save=not dry_run)
+    m_dst = manifest(devs, dst_dir, recursed, scan, save=not dry_run)
+
     # check that source is a directory
-    sstat = auto(devs, get_stat, src_dir)
-    if not is_dir(sstat):
+    if not mode_isdir(m_src.get('', (0,))[0]):
         eprint("*** Source {} is not a directory".format(src_dir))
         return
 
+    # changes for the sync manifest
+    written = []
+    removed = []
+
     # create destination directory if it does not exist
-    sstat = auto(devs, get_stat, dst_dir)
-    if not file_exists(sstat):
+    if '' not in m_dst:
         qprint("Create {} on remote".format(dst_dir))
         if not dry_run:
-            if recursed and not make_dir(devs, dst_dir, dry_run, recursed):
+            if not auto(devs, make_directory, dst_dir):
                 eprint("*** Unable to create directory", dst_dir)
-    elif not is_dir(sstat):
-        eprint("*** Destination {} is not a directory".format(src_dir))
+                return
+            written.append((dst_dir, None))
+    elif not mode_isdir(m_dst[''][0]):
+        eprint("*** Destination {} is not a directory".format(dst_dir))
         return
 
-    # get list of src & dst files and stats
-    qprint("   checking {}".format(dst_dir))
-    d_src = file_dir(devs, src_dir)
-    d_dst = file_dir(devs, dst_dir)
-
-    # determine what needs to be copied or deleted
-    set_dst = set(d_dst.keys())
-    set_src = set(d_src.keys())
-    to_add = set_src - set_dst  # Files to copy to dest
-    to_del = set_dst - set_src  # To delete from dest
-    to_upd = set_dst.intersection(set_src)  # In both: may need updating
-
-    if False:
-        eprint("rsync {} -> {}".format(src_dir, dst_dir))
-        eprint("  sources", set_src)
-        eprint("  dest   ", set_dst)
-        eprint("  add    ", to_add)
-        eprint("  delete ", to_del)
-        eprint("  update ", to_upd)
-
-    # add ...
-    for f in to_add:
-        src = os.path.join(src_dir, f)
-        dst = os.path.join(dst_dir, f)
-        qprint("Adding {}".format(dst))
-        if is_dir(d_src[f]):
-            if recursed:
-                rsync(devs, src, dst, mirror, dry_run, recursed)
-        else:
-            if not dry_run:
-                if not cp(devs, src, dst):
-                    eprint("*** Unable to add {} --> {}".format(src, dst))
+    def join(root, path):
+        return root.rstrip('/') + '/' + path
+
+    # determine what needs to be copied or deleted, parents before children
+    skip = []  # subtrees with a directory / file conflict
+    to_add = []
+    to_upd = []
+    for path in sorted(p for p in m_src if p):
+        if any(path.startswith(s + '/') for s in skip):
+            continue
+        s_mode = m_src[path][0]
+        if path not in m_dst:
+            to_add.append(path)
+            continue
+        d_mode = m_dst[path][0]
+        if mode_isdir(s_mode) and not mode_isdir(d_mode):
+            eprint("Source '{}' is a directory and destination "
+                   "'{}' is a file. Ignoring".format(join(src_dir, path), join(dst_dir, path)))
+            skip.append(path)
+        elif not mode_isdir(s_mode) and mode_isdir(d_mode):
+            eprint("Source '{}' is a file and destination "
+                   "'{}' is a directory. Ignoring".format(join(src_dir, path), join(dst_dir, path)))
+            skip.append(path)
+        elif not mode_isdir(s_mode):
+            to_upd.append(path)
+    to_del = []
+    if mirror:
+        for path in sorted(p for p in m_dst if p and p not in m_src):
+            # removing a directory removes its contents
+            if not any(path.startswith(d + '/') for d in to_del):
+                to_del.append(path)
+
+    # add ... (directories, in one batch; files are copied with the updates)
+    to_copy = []
+    for path in to_add:
+        qprint("Adding {}".format(join(dst_dir, path)))
+        if not mode_isdir(m_src[path][0]):
+            to_copy.append(path)
+    new_dirs = [join(dst_dir, path) for path in to_add if mode_isdir(m_src[path][0])]
+    if new_dirs and not dry_run:
+        for dst, res in zip(new_dirs, auto_batch(devs, make_directory, new_dirs)):
+            if res:
+                written.append((dst, None))
+            else:
+                eprint("Unable to create {}".format(dst))
 
     # delete ...
-    for f in to_del:
-        if not mirror:
-            break
-        dst = os.path.join(dst_dir, f)
-        qprint("Removing {}".format(dst))
-        if not dry_run:
-            res = rm(devs, dst, recursive=True, force=True)
+    for path in to_del:
+        qprint("Removing {}".format(join(dst_dir, path)))
+    if to_del and not dry_run:
+        dsts = [join(dst_dir, path) for path in to_del]
+        for dst, res in zip(dsts, auto_batch(devs, remove_file, dsts, True, True)):
+            # also if it failed, what is left may be incomplete
+            removed.append(dst)
             if not res:
-                eprint("Cannot remove {}", dst)
-
-    # update ...
-    for f in to_upd:
-        src = os.path.join(src_dir, f)
-        dst = os.path.join(dst_dir, f)
-        if is_dir(d_src[f]):
-            if is_dir(d_dst[f]):
-                # src and dst are directories
-                if recursed:
-                    rsync(devs, src, dst, mirror, dry_run, recursed)
-            else:
-                msg = "Source '{}' is a directory and destination " \
-                      "'{}' is a file. Ignoring"
-                eprint(msg.format(src, dst))
+                eprint("Cannot remove {}".format(dst))
+
+    # update ... (with checksum, files of the same size are hashed)
+    digests = {}
+    if checksum:
+        same_size = [path for path in to_upd if m_src[path][1] == m_dst[path][1]]
+        names = [join(src_dir, path) for path in same_size] + \
+                [join(dst_dir, path) for path in same_size]
+        hashes = file_hashes(devs, names, [m_src[path][1] for path in same_size] * 2)
+        n = len(same_size)
+        for path, h_src, h_dst in zip(same_size, hashes[:n], hashes[n:]):
+            digests[path] = (h_src, h_dst)
+    for path in to_upd:
+        src = join(src_dir, path)
+        dst = join(dst_dir, path)
+        s_stat = m_src[path]
+        d_stat = m_dst[path]
+        if checksum:
+            h_src, h_dst = digests.get(path, (None, None))
+            changed = s_stat[1] != d_stat[1] or h_src is None or h_src != h_dst
+            msg = "Copying {} (content differs from {})"
         else:
-            if is_dir(d_dst[f]):
-                msg = "Source '{}' is a file and destination " \
-                      "'{}' is a directory. Ignoring"
-                eprint(msg.format(src, dst))
+            changed = s_stat[1] != d_stat[1] or s_stat[2] > d_stat[2]
+            msg = "Copying {} (newer than {})"
+        if changed:
+            qprint(msg.format(src, dst))
+            to_copy.append(path)
+        else:
+            dprint(path, "NO update src time:", s_stat[2], "dst time", d_stat[2],
+                   "delta", s_stat[2] - d_stat[2])
+
+    # copy ... (all files to the same board in one transfer)
+    if to_copy and not dry_run:
+        pairs = [(join(src_dir, path), join(dst_dir, path)) for path in to_copy]
+        for path, (src, dst), res in zip(to_copy, pairs, cp_many(devs, pairs, record=False)):
+            if res:
+                written.append((dst, digests.get(path, (None,))[0]))
             else:
-                if False:
-                    eprint("BEB src {} > dst {} delta={}".format(
-                        stat_mtime(d_src[f]), stat_mtime(d_dst[f]),
-                        stat_mtime(d_src[f]) - stat_mtime(d_dst[f])))
-                if stat_size(d_src[f]) != stat_size(d_dst[f]) or \
-                   stat_mtime(d_src[f]) > stat_mtime(d_dst[f]):
-                    msg = "Copying {} (newer than {})"
-                    qprint(msg.format(src, dst))
-                    if not dry_run:
-                        if not cp(devs, src, dst):
-                            eprint(
-                                "*** Unable to update {} --> {}".format(src, dst))
-                else:
-                    dprint(f, "NO update src time:", stat_mtime(d_src[f]), "dst time", stat_mtime(
-                        d_dst[f]), "delta", stat_mtime(d_src[f]) - stat_mtime(d_dst[f]))
+                eprint("*** Unable to copy {} --> {}".format(src, dst))
+
+    if written or removed:
+        update_sync_manifest(devs, written, removed)
 
 
 # 0x0D's sent from the host get transformed into 0x0A's, and 0x0A sent to the
@@ -568,10 +1411,23 @@ def rsync(devs, src_dir, dst_dir, mirror, dry_run, recursed):
 # to use hexlify in order to get unaltered data.
 
 
-def recv_file_from_host(src_file, dst_filename, filesize, dst_mode='wb'):
-    """Function which runs on the pyboard. Matches up with send_file_to_remote."""
+def recv_file_from_host(src_file, dst_filename, filesize, offset=0, window=1,
+                        encoding=None):
+    """Function which runs on the pyboard. Matches up with send_file_to_remote.
+       Without stdin buffer the data is encoded ('base64' or 'hex').
+       The data is written to dst_filename.part, after its first offset bytes
+       when resuming, which is renamed to dst_filename when complete.
+       Each block starts with 'B' and is followed by its CRC32 (8 hex digits).
+       Blocks from the first corrupted one on are acked with NAK (\\x15) and
+       not written, the host then stops with 'E'. The board picks the block buffer size (at most BUFFER_SIZE) from its
+       free memory and reports it with the window, and the peak heap use
+       (8 hex digits each) after the last ack.
+    """
+    import os
     import sys
     import binascii
+    import gc
+    crc32 = getattr(binascii, 'crc32', None)
     if HAS_BUFFER:
         try:
             import pyb
@@ -587,127 +1443,535 @@ def recv_file_from_host(src_file, dst_filename, filesize, dst_mode='wb'):
             # This gets reset each time the REPL runs a line, so we don't need to
             # worry about resetting it ourselves
             usb.setinterrupt(-1)
+    part_filename = dst_filename + '.part'
     try:
-        with open(dst_filename, dst_mode) as dst_file:
-            bytes_remaining = filesize
-            if not HAS_BUFFER:
-                bytes_remaining *= 2  # hexlify makes each byte into 2
-            buf_size = BUFFER_SIZE
-            write_buf = bytearray(buf_size)
-            read_buf = bytearray(buf_size)
+        dst_file = open(part_filename, 'ab' if offset else 'wb')
+    except:
+        # window 0: host does not send the file
+        sys.stdout.write('0')
+        return False
+    ok = True
+    try:
+        with dst_file:
+            bytes_remaining = filesize - offset
+            # a single buffer for the whole transfer, blocks are read into
+            # it and written from it; at most a quarter of the free heap
+            gc.collect()
+            free = gc.mem_free()
+            buf_size = max(64, min(BUFFER_SIZE, free // 4)) & ~3
+            # file bytes per block, encoded block fits in buf_size
+            if HAS_BUFFER:
+                block_size = buf_size
+            elif encoding == 'base64':
+                block_size = buf_size // 4 * 3
+            else:
+                block_size = buf_size // 2
+            # room for the crc
+            buf = bytearray(buf_size + 8)
+            mv = memoryview(buf)
+            # blocks in flight wait in the input buffers, limit by free memory
+            window = max(1, min(window, (free - buf_size) // (8 * buf_size), 63))
+            sys.stdout.write(chr(0x30 + window) + '{:08x}'.format(buf_size))
+            peak = gc.mem_alloc()
+            stdin = sys.stdin.buffer if HAS_BUFFER else sys.stdin
+            # view of the encoded block, made again only when the size
+            # changes: all blocks are full but the last
+            view = None
+            seq = 0
             while bytes_remaining > 0:
-                read_size = min(bytes_remaining, buf_size)
-                buf_remaining = read_size
-                buf_index = 0
-                while buf_remaining > 0:
-                    if HAS_BUFFER:
-                        bytes_read = sys.stdin.buffer.readinto(
-                            read_buf, bytes_remaining)
-                    else:
-                        bytes_read = sys.stdin.readinto(
-                            read_buf, bytes_remaining)
-                    if bytes_read > 0:
-                        write_buf[buf_index:bytes_read] = read_buf[0:bytes_read]
-                        buf_index += bytes_read
-                        buf_remaining -= bytes_read
+                # 'E' if the host stopped after a NAK
+                stdin.readinto(buf, 1)
+                if buf[0] != 0x42:
+                    break
+                block = min(bytes_remaining, block_size)
                 if HAS_BUFFER:
-                    dst_file.write(write_buf[0:read_size])
+                    read_size = block
+                elif encoding == 'base64':
+                    read_size = (block + 2) // 3 * 4
                 else:
-                    dst_file.write(binascii.unhexlify(write_buf[0:read_size]))
-                # Send back an ack as a form of flow control
-                sys.stdout.write('\x06')
-                bytes_remaining -= read_size
-        return True
+                    read_size = block * 2
+                end = read_size + 8
+                n = stdin.readinto(buf, end) or 0
+                while n < end:
+                    # short read, the rest into a slice
+                    n += stdin.readinto(mv[n:end]) or 0
+                if view is None or len(view) != read_size:
+                    view = mv[0:read_size]
+                if ok:
+                    try:
+                        if HAS_BUFFER:
+                            data = view
+                        elif encoding == 'base64':
+                            data = binascii.a2b_base64(view)
+                        else:
+                            data = binascii.unhexlify(view)
+                        if crc32 and '{:08x}'.format(crc32(data)).encode() != buf[read_size:end]:
+                            raise ValueError
+                        dst_file.write(data)
+                    except:
+                        # corrupted, keep the good blocks for resuming
+                        ok = False
+                    data = None
+                peak = max(peak, gc.mem_alloc())
+                # Send back an ack with sequence number as a form of flow control
+                sys.stdout.write(('\x06' if ok else '\x15') + chr(0x30 + seq % 64))
+                seq += 1
+                bytes_remaining -= block
+            sys.stdout.write('{:08x}'.format(peak))
+        if ok:
+            try:
+                os.rename(part_filename, dst_filename)
+            except OSError:
+                os.remove(dst_filename)
+                os.rename(part_filename, dst_filename)
+        return ok
     except:
         return False
 
 
-def send_file_to_remote(dev, src_file, dst_filename, filesize, dst_mode='wb'):
+def block_size(encoding, buf_size=None):
+    """File bytes per transfer block, encoded block fits in buf_size
+       (default BUFFER_SIZE)"""
+    if buf_size is None:
+        buf_size = BUFFER_SIZE
+    if encoding == 'base64':
+        return buf_size // 4 * 3
+    if encoding == 'hex':
+        return buf_size // 2
+    return buf_size
+
+
+def encode(buf, encoding):
+    """Transfer block for file bytes buf"""
+    if encoding == 'base64':
+        return binascii.b2a_base64(buf, newline=False)
+    if encoding == 'hex':
+        return binascii.hexlify(buf)
+    return buf
+
+
+def decode(buf, encoding):
+    """File bytes of transfer block buf"""
+    if encoding == 'base64':
+        return binascii.a2b_base64(buf)
+    if encoding == 'hex':
+        return binascii.unhexlify(buf)
+    return bytes(buf)
+
+
+def encoded_size(size, encoding):
+    """Size of size file bytes on the wire"""
+    if encoding == 'base64':
+        return (size + 2) // 3 * 4
+    if encoding == 'hex':
+        return size * 2
+    return size
+
+
+def recv_files_from_host(count, window=1, encoding=None):
+    """Function which runs on the pyboard. Matches up with send_files_to_remote.
+       Receives count files, each a header (size, mode 'w' or 'z' for deflated
+       data, hexlified path) followed by the data in blocks with their CRC32.
+       The blocks of all files share one window. Files are written to
+       path.part and renamed when complete. Returns list of success flags.
+       Blocks from the first corrupted one on are acked with NAK (\\x15) and
+       not written; the host then sends 'E' instead of the next header or
+       block, which ends the transfer. The last block of a file is acked
+       when the file is complete, after it was inflated and renamed.
+       Like recv_file_from_host, the board picks the block buffer size from
+       its free memory and reports it with the window, and the peak heap use
+       after the last ack.
+    """
+    import os
+    import sys
+    import binascii
+    import gc
+    crc32 = getattr(binascii, 'crc32', None)
+    if HAS_BUFFER:
+        try:
+            import pyb
+            usb = pyb.USB_VCP()
+        except:
+            try:
+                import machine
+                usb = machine.USB_VCP()
+            except:
+                usb = None
+        if usb and usb.isconnected():
+            # We don't want 0x03 bytes in the data to be interpreted as a Control-C
+            usb.setinterrupt(-1)
+    # a single buffer for the whole transfer, headers and blocks are read
+    # into it and written from it; at most a quarter of the free heap
+    gc.collect()
+    free = gc.mem_free()
+    buf_size = max(64, min(BUFFER_SIZE, free // 4)) & ~3
+    # file bytes per block, encoded block fits in buf_size
+    if HAS_BUFFER:
+        block_size = buf_size
+    elif encoding == 'base64':
+        block_size = buf_size // 4 * 3
+    else:
+        block_size = buf_size // 2
+    # room for the crc
+    buf = bytearray(buf_size + 8)
+    mv = memoryview(buf)
+    # blocks in flight wait in the input buffers, limit by free memory
+    window = max(1, min(window, (free - buf_size) // (8 * buf_size), 63))
+    sys.stdout.write(chr(0x30 + window) + '{:08x}'.format(buf_size))
+    peak = gc.mem_alloc()
+
+    stdin = sys.stdin.buffer if HAS_BUFFER else sys.stdin
+    # views of buf by size, made once: prefix, header, full and last blocks
+    views = {}
+
+    def view(n):
+        v = views.get(n)
+        if v is None:
+            v = views[n] = mv[0:n]
+        return v
+
+    def read(n):
+        # n <= buf_size + 8 bytes from the host, valid until the next read
+        k = stdin.readinto(buf, n) or 0
+        while k < n:
+            # short read, the rest into a slice
+            k += stdin.readinto(mv[k:n]) or 0
+        return view(n)
+
+    status = []
+    seq = 0
+    # cleared by the first corrupted block, the host then stops sending
+    intact = True
+    remaining = 0
+    for i in range(count):
+        # each header and block starts with 'B', 'E' if the host stopped
+        if read(1)[0] != 0x42:
+            break
+        header = bytes(read(12)).decode()
+        size = int(header[0:8], 16)
+        mode = header[8]
+        n = int(header[9:12], 16) * 2
+        path = b''
+        while len(path) < n:
+            path += bytes(read(min(n - len(path), buf_size)))
+        path = binascii.unhexlify(path).decode('utf-8')
+        part_filename = path + '.part'
+        # deflated data goes to path + DEFLATE_SUFFIX
+        filename = path + '.part.z' if mode == 'z' else part_filename
+        f = None
+        if intact:
+            try:
+                f = open(filename, 'wb')
+            except:
+                pass
+        remaining = size
+        while remaining > 0:
+            if read(1)[0] != 0x42:
+                break
+            block = min(remaining, block_size)
+            if HAS_BUFFER:
+                read_size = block
+            elif encoding == 'base64':
+                read_size = (block + 2) // 3 * 4
+            else:
+                read_size = block * 2
+            end = read_size + 8
+            read(end)
+            if intact:
+                try:
+                    if HAS_BUFFER:
+                        data = view(read_size)
+                    elif encoding == 'base64':
+                        data = binascii.a2b_base64(view(read_size))
+                    else:
+                        data = binascii.unhexlify(view(read_size))
+                    if crc32 and '{:08x}'.format(crc32(data)).encode() != buf[read_size:end]:
+                        raise ValueError
+                except:
+                    intact = False
+            if intact and f:
+                try:
+                    f.write(data)
+                except:
+                    f.close()
+                    f = None
+            data = None
+            peak = max(peak, gc.mem_alloc())
+            # blocks are received even if they cannot be written,
+            # from the first corrupted one on they are NAKed
+            ack = ('\x06' if intact else '\x15') + chr(0x30 + seq % 64)
+            seq += 1
+            remaining -= block
+            if remaining > 0:
+                sys.stdout.write(ack)
+        ok = f is not None and intact and remaining <= 0
+        if f:
+            f.close()
+        if ok and mode == 'z':
+            try:
+                try:
+                    import deflate
+                    decompress = lambda f: deflate.DeflateIO(f, deflate.ZLIB)
+                except ImportError:
+                    import zlib
+                    decompress = lambda f: zlib.DecompIO(f, 15)
+                with open(filename, 'rb') as src_file:
+                    with open(part_filename, 'wb') as dst_file:
+                        z = decompress(src_file)
+                        while True:
+                            k = z.readinto(buf)
+                            if not k:
+                                break
+                            dst_file.write(view(k))
+            except:
+                ok = False
+        if mode == 'z':
+            try:
+                os.remove(filename)
+            except:
+                pass
+        try:
+            if ok:
+                try:
+                    os.rename(part_filename, path)
+                except OSError:
+                    os.remove(path)
+                    os.rename(part_filename, path)
+            else:
+                os.remove(part_filename)
+        except:
+            ok = False
+        if size and remaining <= 0:
+            # the last block is acked when the file is complete, the host
+            # sends nothing while it is inflated
+            sys.stdout.write(ack)
+        status.append(ok)
+        if remaining > 0:
+            # stopped by the host
+            break
+    sys.stdout.write('{:08x}'.format(peak))
+    return status + [False] * (count - len(status))
+
+
+def send_files_to_remote(dev, count, window=1, encoding=None, records=()):
     """Intended to be passed to the `remote` function as the xfer_func argument.
-       Matches up with recv_file_from_host.
+       Matches up with recv_files_from_host.
+       records: [(index, dst_filename, mode, data), ...]
     """
-    bytes_remaining = filesize
-    while bytes_remaining > 0:
-        if dev.has_buffer:
-            buf_size = BUFFER_SIZE
-        else:
-            buf_size = BUFFER_SIZE // 2
-        read_size = min(bytes_remaining, buf_size)
-        buf = src_file.read(read_size)
-        #sys.stdout.write('\r%d/%d' % (filesize - bytes_remaining, filesize))
-        # sys.stdout.flush()
-        if dev.has_buffer:
-            dev.write(buf)
-        else:
-            dev.write(binascii.hexlify(buf))
-        # Wait for ack so we don't get too far ahead of the remote
-        while True:
-            char = dev.read(1)
-            if char == b'\x06':
+    window = recv_window(dev)
+    # block buffer size picked by the board
+    buf_size = block_size(encoding, int(dev.read(8), 16))
+    sent = acked = 0
+    ok = True
+    for i, (_, dst_filename, mode, data) in enumerate(records):
+        path = dst_filename.encode('utf-8')
+        dev.write(b'B' + '{:08x}{}{:03x}'.format(len(data), mode, len(path)).encode('ascii') +
+                  binascii.hexlify(path))
+        for offset in range(0, len(data), buf_size):
+            # keep window blocks in flight, across files
+            while sent - acked >= window:
+                ok = recv_ack(dev, acked) and ok
+                acked += 1
+            if not ok:
                 break
-            # This should only happen if an error occurs
-            sys.stdout.write(chr(ord(char)))
-        bytes_remaining -= read_size
-    # sys.stdout.write('\r')
+            buf = data[offset:offset + buf_size]
+            dev.write(b'B' + encode(buf, encoding) + block_crc(buf))
+            sent += 1
+        if ok and mode == 'z' and not dev.is_wireless and i < len(records) - 1:
+            # the board acks the last block after inflating the file, wait
+            # rather than overflow its small UART input buffer meanwhile;
+            # network links have flow control
+            while acked < sent:
+                ok = recv_ack(dev, acked) and ok
+                acked += 1
+        if not ok:
+            # a block was corrupted, the rest would be discarded
+            dprint("upload {} files: NAK, stopped".format(len(records)))
+            dev.write(b'E')
+            break
+    while acked < sent:
+        recv_ack(dev, acked)
+        acked += 1
+    dev.heap_peak = int(dev.read(8), 16)
+    dprint("upload {} files: block buffer {} bytes, board heap peak {} bytes".format(
+        len(records), buf_size, dev.heap_peak))
+
+
+def recv_window(dev):
+    """Window negotiated by the board at the start of a transfer.
+       0 if the board cannot transfer the file.
+    """
+    c = dev.read(1)
+    return c[0] - 0x30 if c else 0
+
+
+def recv_ack(dev, seq):
+    """Wait for the board to acknowledge block seq.
+       False if the board rejected the block (NAK, e.g. bad CRC).
+    """
+    ack = dev.read(2)
+    if ack[1:] == bytes((0x30 + seq % 64,)) and ack[:1] in (b'\x06', b'\x15'):
+        return ack[:1] == b'\x06'
+    from board import BoardError
+    raise BoardError("file transfer: expected ack {}, got {}".format(seq, ack))
+
+
+def block_crc(buf):
+    """CRC32 trailer of transfer block with file bytes buf"""
+    return '{:08x}'.format(zlib.crc32(buf)).encode('ascii')
 
 
-def recv_file_from_remote(dev, src_filename, dst_file, filesize):
+def send_file_to_remote(dev, src_file, dst_filename, filesize, offset=0, window=1,
+                        encoding=None):
+    """Intended to be passed to the `remote` function as the xfer_func argument.
+       Matches up with recv_file_from_host.
+       Sends src_file from its current position (offset) in blocks followed
+       by their CRC32, up to window (as negotiated by the board) ahead of
+       the acks. Stops after a NAK, the board then reports failure.
+    """
+    window = recv_window(dev)
+    if window == 0:
+        return
+    # block buffer size picked by the board
+    buf_size = block_size(encoding, int(dev.read(8), 16))
+    remaining = filesize - offset
+    blocks = (remaining + buf_size - 1) // buf_size
+    sent = acked = 0
+    ok = True
+    while sent < blocks:
+        # keep window blocks in flight
+        while sent - acked >= window:
+            ok = recv_ack(dev, acked) and ok
+            acked += 1
+        if not ok:
+            # a block was corrupted, the rest would be discarded
+            dprint("upload {}: NAK, stopped".format(dst_filename))
+            dev.write(b'E')
+            break
+        buf = src_file.read(min(buf_size, remaining - sent * buf_size))
+        dev.write(b'B' + encode(buf, encoding) + block_crc(buf))
+        sent += 1
+    while acked < sent:
+        recv_ack(dev, acked)
+        acked += 1
+    dev.heap_peak = int(dev.read(8), 16)
+    dprint("upload {}: block buffer {} bytes, board heap peak {} bytes".format(
+        dst_filename, buf_size, dev.heap_peak))
+
+
+def recv_file_from_remote(dev, src_filename, dst_file, filesize, offset=0, window=1,
+                          encoding=None):
     """Intended to be passed to the `remote` function as the xfer_func argument.
        Matches up with send_file_to_host.
+       Blocks from the first one with a bad CRC on are not written and
+       acked with NAK (\\x15), the board then stops with 'E' and reports
+       failure.
     """
-    bytes_remaining = filesize
-    if not dev.has_buffer:
-        bytes_remaining *= 2  # hexlify makes each byte into 2
-    buf_size = BUFFER_SIZE
-    write_buf = bytearray(buf_size)
+    if recv_window(dev) == 0:
+        return
+    bytes_remaining = filesize - offset
+    max_block = block_size(encoding, dev.buffer_size)
+    # one buffer for the whole transfer, blocks are received into it and
+    # written from it in place
+    buf = bytearray(encoded_size(max_block, encoding) + 8)
+    mv = memoryview(buf)
+    text = None
+    if isinstance(dst_file, io.TextIOBase):
+        # cat to a text stream, characters may straddle blocks
+        text = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    seq = 0
+    ok = True
     while bytes_remaining > 0:
-        read_size = min(bytes_remaining, buf_size)
-        buf_remaining = read_size
-        buf_index = 0
-        while buf_remaining > 0:
-            read_buf = dev.read(buf_remaining)
-            bytes_read = len(read_buf)
-            if bytes_read:
-                write_buf[buf_index:bytes_read] = read_buf[0:bytes_read]
-                buf_index += bytes_read
-                buf_remaining -= bytes_read
-        if dev.has_buffer:
-            dst_file.write((write_buf[0:read_size]).decode('utf-8'))
-        else:
-            dst_file.write(binascii.unhexlify(write_buf[0:read_size]))
-        # Send an ack to the remote as a form of flow control
-        dev.write(b'\x06')   # ASCII ACK is 0x06
-        bytes_remaining -= read_size
-
-
-def send_file_to_host(src_filename, dst_file, filesize):
-    """Function which runs on the pyboard. Matches up with recv_file_from_remote."""
+        # each block starts with 'B', 'E' if the board stopped after a NAK
+        if dev.read(1) != b'B':
+            break
+        block = min(bytes_remaining, max_block)
+        read_size = encoded_size(block, encoding)
+        end = read_size + 8
+        n = 0
+        while n < end:
+            n += dev.readinto(mv[n:end])
+        if ok:
+            try:
+                data = mv[:read_size] if encoding is None else decode(mv[:read_size], encoding)
+                crc = mv[read_size:end]
+                ok = crc == b'--------' or crc == block_crc(data)
+            except (binascii.Error, ValueError):
+                ok = False
+            if not ok:
+                dprint("download {}: block {} corrupted".format(src_filename, seq))
+        if ok:
+            dst_file.write(text.decode(data) if text else data)
+        # Send an ack with sequence number to the remote as a form of flow control
+        dev.write((b'\x06' if ok else b'\x15') + bytes((0x30 + seq % 64,)))
+        seq += 1
+        bytes_remaining -= block
+    if text:
+        dst_file.write(text.decode(b'', final=True))
+
+
+def send_file_to_host(src_filename, dst_file, filesize, offset=0, window=1, encoding=None):
+    """Function which runs on the pyboard. Matches up with recv_file_from_remote.
+       Sends the file from offset in blocks starting with 'B' and followed
+       by their CRC32 (8 hex digits, '--------' if the board has no crc32),
+       up to window blocks ahead of the acks from the host. After a NAK no
+       more blocks are sent, 'E' follows the remaining acks.
+       Without stdout buffer the data is encoded ('base64' or 'hex').
+    """
     import sys
     import binascii
+    import gc
+    crc32 = getattr(binascii, 'crc32', None)
     try:
-        with open(src_filename, 'rb') as src_file:
-            bytes_remaining = filesize
+        src_file = open(src_filename, 'rb')
+    except:
+        # window 0: board does not send the file
+        sys.stdout.write('0')
+        return False
+    ok = True
+    try:
+        with src_file:
+            src_file.seek(offset)
+            bytes_remaining = filesize - offset
             if HAS_BUFFER:
                 buf_size = BUFFER_SIZE
+            elif encoding == 'base64':
+                buf_size = BUFFER_SIZE // 4 * 3
             else:
                 buf_size = BUFFER_SIZE // 2
-            while bytes_remaining > 0:
-                read_size = min(bytes_remaining, buf_size)
-                buf = src_file.read(read_size)
-                if HAS_BUFFER:
-                    sys.stdout.buffer.write(buf)
-                else:
-                    sys.stdout.write(binascii.hexlify(buf))
-                bytes_remaining -= read_size
-                # Wait for an ack so we don't get ahead of the remote
-                while True:
-                    char = sys.stdin.read(1)
-                    if char:
-                        if char == '\x06':
-                            break
-                        # This should only happen if an error occurs
-                        sys.stdout.write(char)
-        return True
+            gc.collect()
+            window = max(1, min(window, gc.mem_free() // (8 * buf_size), 63))
+            sys.stdout.write(chr(0x30 + window))
+            sent = 0
+            acked = 0
+            while ok and bytes_remaining > 0 or acked < sent:
+                if ok and bytes_remaining > 0 and sent - acked < window:
+                    read_size = min(bytes_remaining, buf_size)
+                    buf = src_file.read(read_size)
+                    sys.stdout.write('B')
+                    if HAS_BUFFER:
+                        sys.stdout.buffer.write(buf)
+                    elif encoding == 'base64':
+                        # strip the newline
+                        sys.stdout.write(binascii.b2a_base64(buf)[:-1])
+                    else:
+                        sys.stdout.write(binascii.hexlify(buf))
+                    sys.stdout.write('{:08x}'.format(crc32(buf)) if crc32 else '--------')
+                    bytes_remaining -= read_size
+                    sent += 1
+                    continue
+                # Wait for an ack so we don't get too far ahead of the remote
+                char = sys.stdin.read(1)
+                if char == '\x06' or char == '\x15':
+                    if sys.stdin.read(1) != chr(0x30 + acked % 64):
+                        return False
+                    # NAK: the host discards the rest, stop sending
+                    if char == '\x15':
+                        ok = False
+                    acked += 1
+            if bytes_remaining > 0:
+                sys.stdout.write('E')
+        return ok
     except:
         return False
 
@@ -22,20 +22,43 @@ class _Getch:
     def __call__(self):
         return self.impl()
 
+    def keys(self):
+        """Gets a character and all input following it right away,
+        e.g. the rest of pasted text or of an escape sequence."""
+        return self.impl(burst=True)
+
+
+# seconds to wait for more input once a burst has started
+BURST_GAP = 0.01
+
 
 class _GetchUnix:
     def __init__(self):
         pass
 
-    def __call__(self):
+    def __call__(self, burst=False):
+        import os
+        import select
         import sys
         import tty
         import termios
         fd = sys.stdin.fileno()
         old_settings = termios.tcgetattr(fd)
         try:
-            tty.setraw(sys.stdin.fileno())
-            ch = sys.stdin.buffer.read(1)
+            # keep input typed ahead (or pasted) while not in raw mode
+            tty.setraw(fd, termios.TCSANOW if burst else termios.TCSAFLUSH)
+            if not burst:
+                ch = sys.stdin.buffer.read(1)
+            else:
+                # unbuffered, so select sees all pending input
+                ch = os.read(fd, 1)
+                gap = 0
+                while select.select([fd], [], [], gap)[0]:
+                    more = os.read(fd, 4096)
+                    if not more:
+                        break
+                    ch += more
+                    gap = BURST_GAP
         finally:
             termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
             return ch
@@ -46,7 +69,14 @@ class _GetchWindows:
     def __init__(self):
         pass
 
-    def __call__(self):
+    def __call__(self, burst=False):
+        import msvcrt
+        char = self._getch()
+        while burst and msvcrt.kbhit():
+            char += self._getch()
+        return char
+
+    def _getch(self):
         import msvcrt
         lookup = {b'M': b'\x1b\x5b\x43',
                   b'P': b'\x1b\x5b\x42',
@@ -1,4 +1,6 @@
+import io
 import sys
+import threading
 
 # Attributes
 # 0 Reset all attributes
@@ -58,6 +60,9 @@ OUTPUT_COLOR = LT_MAGENTA
 DEBUG = False
 QUIET = False
 
+# per thread output redirection, see Capture
+_local = threading.local()
+
 def debug(enable=None):
     """Set/get debug flag"""
     global DEBUG
@@ -90,8 +95,35 @@ def nocolor():
     END_COLOR = ''
 
 
+class Capture(io.StringIO):
+    """Collects the output printed by the current thread while active:
+
+        with Capture() as out:
+            ...
+        print(out.getvalue(), out.error_count)
+
+    error_count counts the calls to eprint.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.error_count = 0
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = getattr(_local, 'capture', None)
+        _local.capture = self
+        return self
+
+    def __exit__(self, *exc):
+        _local.capture = self._outer
+
+
 def cprint(*a, color=NO_COLOR, file=sys.stdout, **kw):
     """Same as print but with optional color parameter,"""
+    capture = getattr(_local, 'capture', None)
+    if capture is not None:
+        file = capture
     print(color, end='', file=file)
     print(*a, **kw, file=file)
     print(END_COLOR, end='', file=file)
@@ -113,6 +145,9 @@ def eprint(*a, **kw):
         if not a[0].startswith('*'):
             a = list(a)
             a[0] = "*** " + a[0]
+    capture = getattr(_local, 'capture', None)
+    if capture is not None:
+        capture.error_count += 1
     cprint(*a, color=ERR_COLOR, **kw)
 
 
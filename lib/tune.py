@@ -0,0 +1,150 @@
+from board import BoardError
+from connection import ConnectionError
+from fileops import recv_file_from_host, send_file_to_remote, send_file_to_host, \
+    recv_file_from_remote, remove_file, xfer_options
+from printing import dprint, qprint
+
+from contextlib import contextmanager
+import io
+import os
+import time
+
+
+# block buffer sizes and windows tried
+BUFFER_SIZES = (256, 512, 1024, 2048, 4096, 8192)
+WINDOWS_SERIAL = (1, 2, 4)
+WINDOWS_NETWORK = (1, 2, 4, 8, 16)
+# seconds per trial (upload and download), limits of the data sent
+TRIAL_TIME = 0.5
+TRIAL_MIN = 4 * 1024
+TRIAL_MAX = 64 * 1024
+# a larger window or buffer must be this much faster to be chosen
+MARGIN = 1.05
+
+
+def mem_free():
+    """Function which runs on the pyboard. Free heap after collection."""
+    import gc
+    gc.collect()
+    return gc.mem_free()
+
+
+@contextmanager
+def xfer_params(board, buffer_size, window):
+    """Board transfers in the with block use buffer_size and window.
+       Sets the board's config options, restores them on exit."""
+    values = {'buffer_size': buffer_size, board.xfer_window_option: window}
+    options = board.config_options()
+    saved = {option: board.get_config(option) for option in values if option in options}
+    for option, value in values.items():
+        board.set_config(option, value)
+    try:
+        yield
+    finally:
+        for option in values:
+            if option in saved:
+                board.set_config(option, saved[option])
+            else:
+                board.remove_config_option(option)
+
+
+def trial(board, filename, data):
+    """Seconds to upload and download data with the board's current
+       parameters, None if the transfer failed."""
+    options = xfer_options(board)
+    try:
+        # define the helpers for these parameters before timing
+        board.remote_eval(recv_file_from_host, io.BytesIO(), filename, 0, **options,
+                          xfer_func=send_file_to_remote)
+        board.remote_eval(send_file_to_host, filename, io.BytesIO(), 0, **options,
+                          xfer_func=recv_file_from_remote)
+        start = time.perf_counter()
+        ok = board.remote_eval(recv_file_from_host, io.BytesIO(data), filename, len(data),
+                               **options, xfer_func=send_file_to_remote)
+        out = io.BytesIO()
+        ok = ok and board.remote_eval(send_file_to_host, filename, out, len(data),
+                                      **options, xfer_func=recv_file_from_remote)
+        elapsed = time.perf_counter() - start
+    except (BoardError, ConnectionError, OSError) as e:
+        dprint("tune: {}".format(e))
+        return None
+    if not ok or out.getvalue() != data:
+        return None
+    return elapsed
+
+
+def tune(board):
+    """Measure upload and download throughput for several buffer sizes
+       and windows, within the board's free memory and the windows suitable
+       for its connection. The fastest are stored in the board's config
+       (buffer_size, xfer_window_serial or xfer_window_network) and used for
+       all transfers; xfer_tuned records the result.
+       Returns the options set, None if the board was not tuned.
+    """
+    if board.has_file_transfer:
+        qprint("{}: file transfers use the connection's file transfer, not tuned".format(
+            board.name))
+        return None
+    free = board.remote_eval(mem_free)
+    root = board.root_dirs[0] if board.root_dirs else '/'
+    filename = root + '.shell49_tune'
+    link = 'network' if board.is_wireless else 'serial'
+    windows = WINDOWS_NETWORK if board.is_wireless else WINDOWS_SERIAL
+    # the board's block buffer takes at most a quarter of the free heap,
+    # leave room for the window
+    sizes = [s for s in BUFFER_SIZES if s <= free // 8] or BUFFER_SIZES[:1]
+    buffer_size, window = board.buffer_size, board.xfer_window
+    qprint("Tuning transfers to {} ({}, {} bytes free) ...".format(board.name, link, free))
+    try:
+        # size the data so a trial takes about TRIAL_TIME at the current rate
+        elapsed = trial(board, filename, os.urandom(TRIAL_MIN))
+        if elapsed is None:
+            raise BoardError("tune: transfer failed with buffer_size {}, window {}".format(
+                buffer_size, window))
+        rate = 2 * TRIAL_MIN / elapsed
+        size = int(min(TRIAL_MAX, max(TRIAL_MIN, rate * TRIAL_TIME / 2))) // 1024 * 1024
+        data = os.urandom(size)
+        times = {}
+
+        def measure(b, w):
+            if (b, w) not in times:
+                with xfer_params(board, b, w):
+                    times[(b, w)] = trial(board, filename, data)
+                dprint("tune: buffer_size {:5d} window {:2d}: {}".format(
+                    b, w, times[(b, w)]))
+            return times[(b, w)]
+
+        def best(candidates):
+            # smallest within MARGIN of the fastest
+            done = [(c, measure(*c)) for c in candidates]
+            done = [(c, t) for c, t in done if t is not None]
+            if not done:
+                return None
+            fastest = min(t for _, t in done)
+            return next(c for c, t in done if t <= fastest * MARGIN)
+
+        current = measure(buffer_size, window)
+        # buffer size at the current window, then the window for it
+        found = best([(b, window) for b in sizes])
+        if found:
+            found = best([(found[0], w) for w in windows]) or found
+    finally:
+        try:
+            board.remote_eval(remove_file, filename)
+        except (BoardError, ConnectionError):
+            pass
+    if not found:
+        raise BoardError("tune: all transfers to {} failed".format(board.name))
+    buffer_size, window = found
+    rate = 2 * size / times[found]
+    options = {
+        'buffer_size': buffer_size,
+        board.xfer_window_option: window,
+        'xfer_tuned': {'link': link, 'mem_free': free, 'rate': round(rate / 1024, 1)},
+    }
+    for option, value in options.items():
+        board.set_config(option, value)
+    qprint("{}: buffer_size {}, window {}: {:.1f} kB/s{}".format(
+        board.name, buffer_size, window, rate / 1024,
+        " (was {:.1f} kB/s)".format(2 * size / current / 1024) if current else ""))
+    return options
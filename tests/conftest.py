@@ -0,0 +1,48 @@
+"""Fixtures: fake boards from bench/fakerepl.py served in a background thread."""
+
+import os, sys
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..', 'lib'))
+sys.path.insert(0, os.path.join(here, '..', 'bench'))
+
+from fakerepl import FakeBoardServer
+from telnet import connect
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def server():
+    """Fake telnet board with sys.stdin.buffer"""
+    return FakeBoardServer(uid=b'testbuf').start()
+
+
+@pytest.fixture(scope='module')
+def unbuffered_server():
+    """Fake telnet board without sys.stdin.buffer"""
+    return FakeBoardServer(uid=b'testnobuf', buffered=False).start()
+
+
+@pytest.fixture
+def boards(server):
+    """ActiveBoards connected to server"""
+    boards = connect(server)
+    yield boards
+    boards.default.disconnect()
+
+
+@pytest.fixture
+def flipper():
+    """Function making a function that flips a bit of the nth block passed
+       through it, and the number of blocks it saw"""
+    def make(nth):
+        blocks = [0]
+
+        def flip(data):
+            if len(data) > 64:
+                blocks[0] += 1
+                if blocks[0] == nth:
+                    data = bytes(data[:10]) + bytes([data[10] ^ 0x01]) + bytes(data[11:])
+            return data
+        return flip, blocks
+    return make
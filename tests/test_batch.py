@@ -0,0 +1,65 @@
+"""Batched remote calls: one exec on the board for many calls."""
+
+import board as board_module
+from board import BoardError
+from fileops import auto, auto_batch, get_stat
+
+import os
+
+import pytest
+
+
+def board_fail(name):
+    """Raises on the board for names with an x"""
+    if 'x' in name:
+        raise ValueError(name)
+    return len(name)
+
+
+@pytest.fixture
+def files(server):
+    """Board files /flash/b{i}.py of i bytes"""
+    filenames = []
+    for i in range(70):
+        with open(os.path.join(server.root, 'flash', 'b{}.py'.format(i)), 'w') as f:
+            f.write('#' * i)
+        filenames.append('/flash/b{}.py'.format(i))
+    return filenames
+
+
+def test_same_as_single_calls(boards, files, tmp_path):
+    host_file = str(tmp_path / 'host.py')
+    with open(host_file, 'w') as f:
+        f.write('host = 1\n')
+    filenames = files[:10] + [host_file] + files[10:]
+    single = [auto(boards, get_stat, fn) for fn in filenames]
+    assert auto_batch(boards, get_stat, filenames) == single
+    assert [st[6] for st in single] == list(range(10)) + [9] + list(range(10, 70))
+
+
+def test_split(boards, files, monkeypatch):
+    """Calls are sent REMOTE_BATCH_MAX at a time"""
+    monkeypatch.setattr(board_module, 'REMOTE_BATCH_MAX', 16)
+    board = boards.default
+    execs = []
+    remote_exec = board._remote_exec
+    def counting(*args, **kwargs):
+        execs.append(args)
+        return remote_exec(*args, **kwargs)
+    monkeypatch.setattr(board, '_remote_exec', counting)
+    stats = board.remote_batch([(get_stat, (fn,), {}) for fn in files])
+    assert len(execs) == 5
+    assert [st[6] for st in stats] == list(range(70))
+
+
+def test_errors(boards):
+    """A call that raises on the board is a BoardError in its place, the
+       others complete"""
+    res = boards.default.remote_batch([(board_fail, (name,), {})
+                                       for name in ('a', 'xb', 'cc')])
+    assert res[0] == 1 and res[2] == 2
+    assert isinstance(res[1], BoardError)
+    assert 'ValueError' in str(res[1])
+    # auto_batch raises it
+    with pytest.raises(BoardError):
+        auto_batch(boards, board_fail, ['/flash/a', '/flash/xb'])
@@ -0,0 +1,109 @@
+"""Bulk upload (cp_many): many files in one transfer."""
+
+from telnet import connect
+
+import fileops
+from fileops import cp, cp_many
+
+import binascii
+import os
+
+import pytest
+
+
+def read(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def test_inflate_before_next_file(server, monkeypatch, tmp_path):
+    """On a serial link the host sends nothing while the board inflates a
+       compressed file"""
+    srcs = []
+    for i in range(4):
+        srcs.append(str(tmp_path / 'z{}.py'.format(i)))
+        with open(srcs[-1], 'wb') as f:
+            # hex digits, compressed to about half
+            f.write(binascii.hexlify(os.urandom(4096)))
+    dst_dir = os.path.join(server.root, 'flash', 'zbulk')
+    os.mkdir(dst_dir)
+    pairs = [(src, '/flash/zbulk/' + os.path.basename(src)) for src in srcs]
+    headers = [binascii.hexlify(dst.encode()) for _, dst in pairs]
+    boards = connect(server, compress=True, buffer_size=1024, xfer_window_serial=4)
+    board = boards.default
+    events = []
+    write = board.write
+
+    def logging_write(data):
+        data = bytes(data)
+        events.append('header' if any(data.endswith(h) for h in headers) else 'block')
+        return write(data)
+    recv_ack = fileops.recv_ack
+
+    def logging_ack(dev, seq):
+        events.append('ack')
+        return recv_ack(dev, seq)
+    # the host waits on serial links only
+    monkeypatch.setattr(type(board._serial), 'is_wireless', False)
+    monkeypatch.setattr(board, 'write', logging_write)
+    monkeypatch.setattr(fileops, 'recv_ack', logging_ack)
+    try:
+        assert cp_many(boards, pairs) == [True] * len(pairs)
+    finally:
+        board.disconnect()
+    # more than one block per file, all acked before the next header
+    assert events.count('header') == len(pairs)
+    assert events.count('block') > 2 * len(pairs)
+    for i, event in enumerate(events):
+        if event == 'header':
+            assert events[:i].count('block') == events[:i].count('ack')
+    for src, dst in pairs:
+        assert read(os.path.join(server.root, dst[1:])) == read(src)
+    assert sorted(os.listdir(dst_dir)) == sorted(os.path.basename(src) for src in srcs)
+
+
+def small_files(tmp_path, n):
+    """n small host files, half of them compressible, some empty"""
+    names = []
+    for i in range(n):
+        name = str(tmp_path / 'f{}.py'.format(i))
+        with open(name, 'wb') as f:
+            if i % 2:
+                f.write(os.urandom(i * 37 % 3000))
+            else:
+                f.write(b'print("hello")\n' * (i * 7 % 200))
+        names.append(name)
+    return names
+
+
+@pytest.mark.parametrize('compress', (False, True))
+def test_cp_many_round_trip(compress, server, unbuffered_server, tmp_path):
+    for tag, srv in (('buf', server), ('nobuf', unbuffered_server)):
+        subdir = 'many{}{}'.format(tag, int(compress))
+        dst_dir = os.path.join(srv.root, 'flash', subdir)
+        os.mkdir(dst_dir)
+        names = small_files(tmp_path, 30)
+        pairs = [(src, '/flash/{}/{}'.format(subdir, os.path.basename(src))) for src in names]
+        boards = connect(srv, compress=compress)
+        try:
+            assert cp_many(boards, pairs) == [True] * len(pairs)
+            # the same files one by one
+            assert all(cp(boards, src, dst + '.1') for src, dst in pairs)
+        finally:
+            boards.default.disconnect()
+        for src, dst in pairs:
+            assert read(os.path.join(srv.root, dst[1:])) == read(src)
+            assert read(os.path.join(srv.root, dst[1:] + '.1')) == read(src)
+        # no temp files left
+        assert sorted(os.listdir(dst_dir)) == sorted(
+            os.path.basename(dst) + ext for _, dst in pairs for ext in ('', '.1'))
+
+
+def test_cp_many_failure_per_file(boards, server, tmp_path):
+    """Failures are reported per file, the others are copied"""
+    os.mkdir(os.path.join(server.root, 'flash', 'fail'))
+    names = small_files(tmp_path, 2)
+    res = cp_many(boards, [(names[0], '/flash/nodir/x.py'), (names[1], '/flash/fail/y.py')])
+    assert res == [False, True]
+    assert read(os.path.join(server.root, 'flash', 'fail', 'y.py')) == read(names[1])
+    assert not os.path.exists(os.path.join(server.root, 'flash', 'nodir'))
@@ -0,0 +1,103 @@
+"""Deflated transfers: temporary files and resuming."""
+
+from telnet import connect
+
+from fileops import cp
+
+import binascii
+import os
+
+import pytest
+
+SIZE = 48 * 1024
+
+
+@pytest.fixture
+def data(tmp_path):
+    """Host file src of SIZE hex digits (deflated to about half), and its contents"""
+    data = binascii.hexlify(os.urandom(SIZE // 2))
+    with open(str(tmp_path / 'src'), 'wb') as f:
+        f.write(data)
+    return data
+
+
+def read(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def test_user_z_files_kept(server, data, tmp_path):
+    flash = os.path.join(server.root, 'flash', 'zkeep')
+    os.mkdir(flash)
+    for name in ('up.txt.z', 'down.txt.z'):
+        with open(os.path.join(flash, name), 'wb') as f:
+            f.write(b'user data')
+    with open(os.path.join(flash, 'down.txt'), 'wb') as f:
+        f.write(data)
+    boards = connect(server, compress=True)
+    board = boards.default
+    sent = board.traffic[0]
+    try:
+        assert cp(boards, str(tmp_path / 'src'), '/flash/zkeep/up.txt')
+        assert board.traffic[0] - sent < SIZE * 0.8
+        assert cp(boards, '/flash/zkeep/down.txt', str(tmp_path / 'dst'))
+    finally:
+        board.disconnect()
+    assert read(os.path.join(flash, 'up.txt')) == data
+    assert read(str(tmp_path / 'dst')) == data
+    for name in ('up.txt.z', 'down.txt.z'):
+        assert read(os.path.join(flash, name)) == b'user data'
+    assert sorted(os.listdir(flash)) == ['down.txt', 'down.txt.z', 'up.txt', 'up.txt.z']
+
+
+def test_upload_resumed(server, flipper, data, tmp_path):
+    board_file = os.path.join(server.root, 'flash', 'zup.txt')
+    boards = connect(server, compress=True, buffer_size=1024)
+    board = boards.default
+    write = board.write
+    flip, _ = flipper(10)
+    board.write = lambda data: write(flip(data))
+    try:
+        assert not cp(boards, str(tmp_path / 'src'), '/flash/zup.txt')
+    finally:
+        board.write = write
+    part = os.path.getsize(board_file + '.part.z.part')
+    assert part > 0
+    sent = board.traffic[0]
+    assert cp(boards, str(tmp_path / 'src'), '/flash/zup.txt', resume=True)
+    # the deflated data of the good blocks is not sent again
+    resent = board.traffic[0] - sent
+    board.disconnect()
+    assert resent < SIZE * 0.8 - part
+    assert read(board_file) == data
+    for suffix in ('.part', '.part.z', '.part.z.part'):
+        assert not os.path.exists(board_file + suffix)
+
+
+def test_download_streamed(server, flipper, data, tmp_path):
+    board_file = os.path.join(server.root, 'flash', 'zdown.txt')
+    with open(board_file, 'wb') as f:
+        f.write(data)
+    dst = str(tmp_path / 'dst')
+    boards = connect(server, compress=True, buffer_size=1024)
+    board = boards.default
+    readinto = board.readinto
+    flip, _ = flipper(10)
+
+    def flip_into(buf):
+        n = readinto(buf)
+        buf[:n] = flip(buf[:n])
+        return n
+    board.readinto = flip_into
+    try:
+        assert not cp(boards, '/flash/zdown.txt', dst)
+    finally:
+        board.readinto = readinto
+    # the good blocks were inflated into the part file
+    part = read(dst + '.part')
+    assert 0 < len(part) < SIZE and data.startswith(part)
+    assert not os.path.exists(board_file + '.part.z')
+    assert cp(boards, '/flash/zdown.txt', dst, resume=True)
+    board.disconnect()
+    assert read(dst) == data
+    assert not os.path.exists(board_file + '.part.z')
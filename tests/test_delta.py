@@ -0,0 +1,89 @@
+"""Delta uploads: only the changed blocks of a large board file are sent."""
+
+from telnet import connect
+
+import fileops
+from fileops import cp, make_patch, block_checksums, apply_delta, DELTA_BLOCK
+
+import hashlib
+import os
+import random
+
+
+def table(size):
+    """CSV data table rows of approximately size bytes"""
+    rnd = random.Random(size)
+    return ['{},{:.4f},{:.4f},{}\n'.format(i, rnd.random(), rnd.random(),
+                                            rnd.choice(['ok', 'warn', 'fail']))
+            for i in range(size // 24)]
+
+
+def write(filename, rows):
+    with open(filename, 'w') as f:
+        f.write(''.join(rows))
+
+
+def read(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def test_patch(tmp_path):
+    """A patch against the old blocks rebuilds the new data"""
+    old = str(tmp_path / 'old')
+    rows = table(50 * 1024)
+    write(old, rows)
+    # changed, inserted and removed lines shift the later blocks
+    rows[10] = 'changed\n'
+    rows.insert(len(rows) // 2, 'inserted\n')
+    del rows[-100]
+    data = ''.join(rows).encode()
+    patch = make_patch(data, block_checksums(old, DELTA_BLOCK), DELTA_BLOCK)
+    assert len(patch) < 8 * DELTA_BLOCK
+    patch_file = str(tmp_path / 'old.delta')
+    with open(patch_file, 'wb') as f:
+        f.write(patch)
+    assert apply_delta(old, patch_file, DELTA_BLOCK, hashlib.sha256(data).digest())
+    assert read(old) == data
+    assert sorted(os.listdir(str(tmp_path))) == ['old']
+
+
+def test_patch_digest_mismatch(tmp_path):
+    """The old file is kept if the result does not match the digest"""
+    old = str(tmp_path / 'old')
+    write(old, table(8 * 1024))
+    before = read(old)
+    patch_file = str(tmp_path / 'old.delta')
+    with open(patch_file, 'wb') as f:
+        f.write(make_patch(before + b'more', block_checksums(old, DELTA_BLOCK), DELTA_BLOCK))
+    assert not apply_delta(old, patch_file, DELTA_BLOCK, hashlib.sha256(b'other').digest())
+    assert read(old) == before
+    assert sorted(os.listdir(str(tmp_path))) == ['old']
+
+
+def test_cp_delta(server, tmp_path, monkeypatch):
+    src = str(tmp_path / 'table.csv')
+    board_file = os.path.join(server.root, 'flash', 'delta', 'table.csv')
+    os.mkdir(os.path.dirname(board_file))
+    rows = table(100 * 1024)
+    write(src, rows)
+    results = []
+    upload_delta = fileops.upload_delta
+
+    def recording(dev, data, dst_filename):
+        results.append(upload_delta(dev, data, dst_filename))
+        return results[-1]
+    monkeypatch.setattr(fileops, 'upload_delta', recording)
+    boards = connect(server, delta_min_size=64 * 1024, compress=False)
+    try:
+        # no board copy yet, sent in full
+        assert cp(boards, src, '/flash/delta/table.csv')
+        assert results == [None]
+        rows[len(rows) // 2] = 'changed\n'
+        write(src, rows)
+        assert cp(boards, src, '/flash/delta/table.csv')
+        assert results == [None, True]
+    finally:
+        boards.default.disconnect()
+    assert read(board_file) == read(src)
+    assert os.listdir(os.path.dirname(board_file)) == ['table.csv']
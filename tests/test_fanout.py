@@ -0,0 +1,72 @@
+"""Fan-out: one command run on many boards concurrently."""
+
+from fakerepl import FakeBoardServer
+
+from activeboards import ActiveBoards
+from config import Config
+from fanout import fanout
+from fileops import manifest, rsync
+from printing import Capture
+import printing
+
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def servers():
+    return [FakeBoardServer(uid='fanout{}'.format(i).encode()).start() for i in range(3)]
+
+
+@pytest.fixture
+def fleet(servers, tmp_path):
+    """ActiveBoards connected to all servers, boards named b0, b1, ..."""
+    printing.quiet(True)
+    cfg = Config(str(tmp_path / 'shell49_rc.py'))
+    cfg.set(0, 'autotune', False)
+    boards = ActiveBoards(cfg)
+    for server in servers:
+        boards.connect_telnet(server.address)
+    for i, board in enumerate(boards.boards()):
+        board.name = 'b{}'.format(i)
+    yield boards
+    for board in boards.boards():
+        board.disconnect()
+
+
+def test_rsync_all(fleet, servers, tmp_path):
+    src = str(tmp_path / 'src')
+    for i in range(4):
+        os.makedirs(os.path.join(src, 'd{}'.format(i)))
+        with open(os.path.join(src, 'd{}'.format(i), 'f.py'), 'w') as f:
+            f.write('x = {}\n'.format(i) * (i + 1))
+    targets = fleet.select()
+    assert len(targets) == len(servers)
+    with Capture() as out:
+        failed = fanout(fleet, targets,
+                        lambda devs: rsync(devs, src, '/flash/t', mirror=True,
+                                           dry_run=False, recursed=True))
+    assert not failed, out.getvalue()
+    for board in targets:
+        devs = fleet.view(board)
+        assert manifest(devs, src).keys() == manifest(devs, '/flash/t').keys()
+    # summary row of each board
+    summary = out.getvalue()
+    assert all('b{}'.format(i) in summary for i in range(len(servers)))
+
+
+def test_failure_reported(fleet):
+    """A failing board is reported, the others complete"""
+    targets = fleet.select()
+    done = []
+
+    def func(devs):
+        if devs.default.name == 'b1':
+            devs.default.exec('1/0')
+        done.append(devs.default.name)
+    with Capture() as out:
+        failed = fanout(fleet, targets, func)
+    assert [b.name for b in failed] == ['b1'], out.getvalue()
+    assert sorted(done) == ['b0', 'b2']
+    assert 'FAILED' in out.getvalue()
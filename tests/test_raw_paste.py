@@ -0,0 +1,34 @@
+"""Raw-paste mode: detected on connect, code of any size runs."""
+
+from fakerepl import FakeBoardServer
+from telnet import connect
+
+import pytest
+
+
+@pytest.fixture(scope='module', params=(False, True), ids=('raw', 'raw-paste'))
+def paste_server(request):
+    """Fake telnet board with and without raw-paste support"""
+    return FakeBoardServer(uid=b'paste' + bytes([request.param]),
+                           raw_paste=request.param).start(), request.param
+
+
+def code(size):
+    """Python source of approximately size bytes"""
+    line = "x = [i * i for i in range(10)]  # padding padding padding\n"
+    return line * (size // len(line)) + "print(len(x))\n"
+
+
+def test_exec(paste_server):
+    server, raw_paste = paste_server
+    boards = connect(server)
+    board = boards.default
+    try:
+        board.exec("pass")
+        assert board._raw_paste == raw_paste
+        for size in (100, 1024, 8 * 1024, 32 * 1024):
+            board._exec_no_output(code(size))
+            assert board._exec_output() == b'10\r\n'
+        assert board.exec("print(1 + 1)") == b'2\r\n'
+    finally:
+        board.disconnect()
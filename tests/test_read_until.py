@@ -0,0 +1,41 @@
+"""Connection.read_until: result, data_consumer and the bytes kept after
+the ending, with the ending anywhere in the received chunks."""
+
+from read_until import LoopbackConnection, payload
+
+from connection import ConnectionError
+
+import pytest
+
+
+@pytest.mark.parametrize('chunk', (1, 2, 3, 4096))
+@pytest.mark.parametrize('size', (0, 1, 1000, 64 * 1024))
+def test_read_until(size, chunk):
+    data = payload(size)
+    conn = LoopbackConnection(data, chunk)
+    consumed = []
+    res = conn.read_until(1, b'\x04', data_consumer=consumed.append)
+    assert res == data[:size + 1]
+    assert b''.join(bytes(b) for b in consumed) == res
+    # the rest is kept for the next read
+    assert conn.read_until(1, b'\x04>') == b'\x04>'
+
+
+def test_ending_straddles_chunks():
+    conn = LoopbackConnection(b'abc\x04>def\x04>', 4)
+    assert conn.read_until(1, b'\x04>') == b'abc\x04>'
+    assert conn.read_until(1, b'\x04>') == b'def\x04>'
+
+
+def test_min_num_bytes():
+    """The ending is not searched in the first min_num_bytes - len(ending)"""
+    conn = LoopbackConnection(b'\x04\x04>OK\x04>', 3)
+    assert conn.read_until(5, b'\x04>') == b'\x04\x04>OK\x04>'
+
+
+def test_timeout():
+    conn = LoopbackConnection(b'no ending', 4)
+    consumed = []
+    with pytest.raises(ConnectionError):
+        conn.read_until(1, b'\x04', timeout=0.05, data_consumer=consumed.append)
+    assert b''.join(bytes(b) for b in consumed) == b'no ending'
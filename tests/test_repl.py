@@ -0,0 +1,16 @@
+"""Interactive repl: pasted code."""
+
+from repl_paste import code, run
+
+
+def test_paste(boards, monkeypatch):
+    board = boards.default
+    writes = []
+    write = board._serial.write
+    monkeypatch.setattr(board._serial, 'write', lambda b: writes.append(bytes(b)) or write(b))
+    data, result = code(200)
+    _, _, out = run(board, data, True)
+    # paste mode, all of the code in one write
+    assert b'\x05' + data.replace(b'\n', b'\r') + b'\x04' in writes
+    assert result in out
+    assert b'Error' not in out
@@ -0,0 +1,192 @@
+"""Per-block CRC32: corrupted blocks are NAKed, the sender stops early and
+the good blocks are kept for cp --resume, as after a dropped connection."""
+
+from latency import LatencyProxy
+from telnet import connect
+
+from connection import ConnectionError
+from fileops import cp, cp_many
+
+import os
+
+import pytest
+
+SIZE = 128 * 1024
+BUFFER_SIZE = 1024
+
+
+@pytest.fixture
+def data(tmp_path):
+    """Host file src of SIZE random bytes, and its contents"""
+    data = os.urandom(SIZE)
+    with open(str(tmp_path / 'src'), 'wb') as f:
+        f.write(data)
+    return data
+
+
+def read(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('encoding', (None, 'base64', 'hex'))
+def test_upload_corrupted(encoding, server, unbuffered_server, flipper, data, tmp_path):
+    server = server if encoding is None else unbuffered_server
+    name = '/flash/nak_up_{}'.format(encoding)
+    board_file = os.path.join(server.root, name[1:])
+    boards = connect(server, compress=False, xfer_encoding=encoding, buffer_size=BUFFER_SIZE)
+    board = boards.default
+    write = board.write
+    flip, blocks = flipper(5)
+    board.write = lambda data: write(flip(data))
+    try:
+        assert not cp(boards, str(tmp_path / 'src'), name)
+    finally:
+        board.write = write
+    # the host stopped within a window of the corrupted block
+    assert blocks[0] < 5 + 64
+    assert not os.path.exists(board_file)
+    part = os.path.getsize(board_file + '.part')
+    assert 0 < part < SIZE
+    assert cp(boards, str(tmp_path / 'src'), name, resume=True)
+    board.disconnect()
+    assert read(board_file) == data
+    assert not os.path.exists(board_file + '.part')
+
+
+@pytest.mark.parametrize('encoding', (None, 'base64', 'hex'))
+def test_download_corrupted(encoding, server, unbuffered_server, flipper, data, tmp_path):
+    server = server if encoding is None else unbuffered_server
+    name = '/flash/nak_down_{}'.format(encoding)
+    with open(os.path.join(server.root, name[1:]), 'wb') as f:
+        f.write(data)
+    dst = str(tmp_path / 'dst')
+    boards = connect(server, compress=False, xfer_encoding=encoding, buffer_size=BUFFER_SIZE)
+    board = boards.default
+    readinto = board.readinto
+    flip, _ = flipper(5)
+
+    def flip_into(buf):
+        n = readinto(buf)
+        buf[:n] = flip(buf[:n])
+        return n
+    board.readinto = flip_into
+    received = board.traffic[1]
+    try:
+        assert not cp(boards, name, dst)
+    finally:
+        board.readinto = readinto
+    # the board stopped sending within a window of the corrupted block
+    assert board.traffic[1] - received < SIZE // 2
+    assert not os.path.exists(dst)
+    part = os.path.getsize(dst + '.part')
+    assert 0 < part < SIZE
+    assert cp(boards, name, dst, resume=True)
+    board.disconnect()
+    assert read(dst) == data
+    assert not os.path.exists(dst + '.part')
+
+
+@pytest.mark.parametrize('encoding', (None, 'base64'))
+def test_bulk_upload_corrupted(encoding, server, unbuffered_server, flipper, tmp_path):
+    server = server if encoding is None else unbuffered_server
+    srcs = []
+    for i in range(20):
+        srcs.append(str(tmp_path / 'bulk{}'.format(i)))
+        with open(srcs[-1], 'wb') as f:
+            f.write(os.urandom(8 * 1024))
+    name = '/flash/bulk_{}'.format(encoding)
+    dst_dir = os.path.join(server.root, name[1:])
+    os.mkdir(dst_dir)
+    boards = connect(server, compress=False, xfer_encoding=encoding, buffer_size=2048)
+    board = boards.default
+    write = board.write
+    flip, blocks = flipper(20)
+    board.write = lambda data: write(flip(data))
+    res = cp_many(boards, [(src, name + '/' + os.path.basename(src)) for src in srcs])
+    board.disconnect()
+    # files from the one with the corrupted block on fail
+    bad = res.index(False)
+    assert res == [True] * bad + [False] * (len(srcs) - bad)
+    assert blocks[0] < len(srcs) * 4, "host kept sending after the NAK"
+    assert sorted(os.listdir(dst_dir)) == sorted(os.path.basename(s) for s in srcs[:bad])
+
+
+@pytest.fixture
+def proxy(server):
+    """Latency proxy to server, its connections can be cut"""
+    return LatencyProxy(server.address, 0.001).start()
+
+
+def cut_after(proxy, nth):
+    """Function passing data through that cuts the proxy connections
+       after the nth block"""
+    blocks = [0]
+
+    def cut(data):
+        if len(data) > 64:
+            blocks[0] += 1
+            if blocks[0] == nth:
+                proxy.cut()
+        return data
+    return cut
+
+
+@pytest.mark.parametrize('resume', (True, False))
+def test_upload_interrupted(resume, server, proxy, data, tmp_path):
+    name = '/flash/cut_up_{}'.format(resume)
+    board_file = os.path.join(server.root, name[1:])
+    boards = connect(proxy, compress=False, buffer_size=BUFFER_SIZE)
+    board = boards.default
+    write = board.write
+    cut = cut_after(proxy, 20)
+    board.write = lambda data: write(cut(data))
+    with pytest.raises(ConnectionError):
+        cp(boards, str(tmp_path / 'src'), name)
+    assert not os.path.exists(board_file)
+    part = os.path.getsize(board_file + '.part')
+    assert 0 < part < SIZE
+    boards = connect(proxy, compress=False, buffer_size=BUFFER_SIZE)
+    board = boards.default
+    sent = board.traffic[0]
+    assert cp(boards, str(tmp_path / 'src'), name, resume=resume)
+    sent = board.traffic[0] - sent
+    board.disconnect()
+    assert read(board_file) == data
+    assert not os.path.exists(board_file + '.part')
+    # resumed after the blocks on the board, or sent again from byte 0
+    if resume:
+        assert sent < SIZE - part + SIZE // 4
+    else:
+        assert sent > SIZE
+
+
+def test_download_interrupted(server, proxy, data, tmp_path):
+    name = '/flash/cut_down'
+    with open(os.path.join(server.root, name[1:]), 'wb') as f:
+        f.write(data)
+    dst = str(tmp_path / 'dst')
+    boards = connect(proxy, compress=False, buffer_size=BUFFER_SIZE)
+    board = boards.default
+    readinto = board.readinto
+    cut = cut_after(proxy, 20)
+
+    def cut_into(buf):
+        n = readinto(buf)
+        cut(buf[:n])
+        return n
+    board.readinto = cut_into
+    with pytest.raises(ConnectionError):
+        cp(boards, name, dst)
+    assert not os.path.exists(dst)
+    part = os.path.getsize(dst + '.part')
+    assert 0 < part < SIZE
+    boards = connect(proxy, compress=False, buffer_size=BUFFER_SIZE)
+    board = boards.default
+    received = board.traffic[1]
+    assert cp(boards, name, dst, resume=True)
+    received = board.traffic[1] - received
+    board.disconnect()
+    assert read(dst) == data
+    assert not os.path.exists(dst + '.part')
+    assert received < SIZE - part + SIZE // 4
@@ -0,0 +1,157 @@
+"""rsync: planning from the board manifest, --checksum comparison."""
+
+import fileops
+from fileops import cp, manifest, mode_isdir, rm, rsync
+
+import os
+
+import pytest
+
+
+def write(root, path, data):
+    filename = os.path.join(root, path)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w') as f:
+        f.write(data)
+
+
+def board_file(server, path):
+    with open(os.path.join(server.root, 'flash', path)) as f:
+        return f.read()
+
+
+@pytest.fixture
+def hashed(boards, monkeypatch):
+    """Board files hashed by file_hash, a list per remote_batch call"""
+    calls = []
+    remote_batch = boards.default.remote_batch
+    def counting(batch):
+        names = [args[0] for func, args, _ in batch if func is fileops.file_hash]
+        if names:
+            calls.append(names)
+        return remote_batch(batch)
+    monkeypatch.setattr(boards.default, 'remote_batch', counting)
+    return calls
+
+
+def test_checksum_hashes_same_size_only(boards, server, hashed, tmp_path):
+    src = str(tmp_path)
+    write(src, 'same.py', 'a = 1\n')
+    write(src, 'size.py', 'b = 1\n')
+    write(src, 'equal.py', 'c = 1\n')
+    rsync(boards, src, '/flash/c1', mirror=True, dry_run=False, recursed=True)
+    write(src, 'same.py', 'a = 2\n')
+    write(src, 'size.py', 'b = 22\n')
+    write(src, 'new.py', 'd = 1\n')
+    del hashed[:]
+    rsync(boards, src, '/flash/c1', mirror=True, dry_run=False, recursed=True, checksum=True)
+    # new files and files of another size are copied without hashing
+    assert sorted(sum(hashed, [])) == ['/flash/c1/equal.py', '/flash/c1/same.py']
+    for name, data in (('same.py', 'a = 2\n'), ('size.py', 'b = 22\n'), ('new.py', 'd = 1\n'),
+                       ('equal.py', 'c = 1\n')):
+        assert board_file(server, 'c1/' + name) == data
+
+
+def test_checksum_batches(boards, hashed, monkeypatch, tmp_path):
+    src = str(tmp_path)
+    for i in range(6):
+        write(src, 'f{}.py'.format(i), 'x' * 100)
+    rsync(boards, src, '/flash/c2', mirror=True, dry_run=False, recursed=True)
+    monkeypatch.setattr(fileops, 'CHECKSUM_BATCH_BYTES', 250)
+    del hashed[:]
+    rsync(boards, src, '/flash/c2', mirror=True, dry_run=False, recursed=True, checksum=True)
+    assert [len(names) for names in hashed] == [2, 2, 2]
+
+
+def tree(root, dirs):
+    """dirs subdirectories of root, 2 levels deep, with a few files each"""
+    for i in range(dirs):
+        for j in range(3):
+            write(root, 'd{}/e{}/f{}.py'.format(i // 4, i, j), 'x = {}\n'.format(j) * (i + 1))
+
+
+def in_sync(boards, root):
+    """The sync manifest agrees with the board (directory mtimes may not)"""
+    def stats(m):
+        return {path: st[:1] if mode_isdir(st[0]) else st[:3] for path, st in m.items()}
+    return stats(manifest(boards, root)) == stats(manifest(boards, root, scan=True, save=False))
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Board tree scans (board_manifest calls), a list of roots"""
+    calls = []
+    board_manifest = fileops.board_manifest
+    def counting(dev, dev_root, *args, **kwargs):
+        calls.append(dev_root)
+        return board_manifest(dev, dev_root, *args, **kwargs)
+    monkeypatch.setattr(fileops, 'board_manifest', counting)
+    return calls
+
+
+def test_manifest_follows_cp_rm(boards, tmp_path):
+    src = str(tmp_path)
+    tree(src, 8)
+    rsync(boards, src, '/flash/m1', mirror=True, dry_run=False, recursed=True)
+    assert manifest(boards, src).keys() == manifest(boards, '/flash/m1').keys()
+    assert in_sync(boards, '/flash/m1')
+    write(src, 'd0/e0/new.py', 'new = 1\n')
+    assert cp(boards, os.path.join(src, 'd0/e0/new.py'), '/flash/m1/d0/e0/new.py')
+    rm(boards, '/flash/m1/d0/e1', recursive=True)
+    assert in_sync(boards, '/flash/m1')
+    rsync(boards, src, '/flash/m1', mirror=True, dry_run=False, recursed=True)
+    assert in_sync(boards, '/flash/m1')
+    assert manifest(boards, src).keys() == manifest(boards, '/flash/m1').keys()
+
+
+def test_no_scan_after_copy(boards, scans, tmp_path):
+    """A no-op rsync after one that copied uses the manifest"""
+    src = str(tmp_path)
+    tree(src, 4)
+    rsync(boards, src, '/flash/m2', mirror=True, dry_run=False, recursed=True)
+    write(src, 'd0/e0/f0.py', 'changed = 1\n')
+    rsync(boards, src, '/flash/m2', mirror=True, dry_run=False, recursed=True)
+    del scans[:]
+    rsync(boards, src, '/flash/m2', mirror=True, dry_run=False, recursed=True)
+    assert scans == []
+
+
+def test_changed_root_invalidates(boards, server, scans, tmp_path):
+    """Changed by someone else: the board root stat no longer matches"""
+    src = str(tmp_path)
+    tree(src, 4)
+    rsync(boards, src, '/flash/m3', mirror=True, dry_run=False, recursed=True)
+    rsync(boards, src, '/flash/m3', mirror=True, dry_run=False, recursed=True)
+    del scans[:]
+    flash = os.path.join(server.root, 'flash')
+    with open(os.path.join(flash, 'other_m3.py'), 'w') as f:
+        f.write('other = 1\n')
+    # mtimes have a resolution of seconds, make it a later one
+    mtime = os.stat(flash).st_mtime + 2
+    os.utime(flash, (mtime, mtime))
+    rsync(boards, src, '/flash/m3', mirror=True, dry_run=False, recursed=True)
+    assert scans
+    assert in_sync(boards, '/flash/m3')
+    del scans[:]
+    rsync(boards, src, '/flash/m3', mirror=True, dry_run=False, recursed=True)
+    assert scans == []
+
+
+def test_update_without_manifest(boards, server, monkeypatch, tmp_path):
+    """Without a manifest on the board, cp asks only once to update it"""
+    if os.path.exists(os.path.join(server.root, 'flash', fileops.SYNC_MANIFEST)):
+        os.remove(os.path.join(server.root, 'flash', fileops.SYNC_MANIFEST))
+    src = str(tmp_path / 'new.py')
+    with open(src, 'w') as f:
+        f.write('new = 1\n')
+    board = boards.default
+    updates = []
+    remote_eval = board.remote_eval
+    def counting(func, *args, **kwargs):
+        if func is fileops.update_manifest:
+            updates.append(args)
+        return remote_eval(func, *args, **kwargs)
+    monkeypatch.setattr(board, 'remote_eval', counting)
+    for _ in range(3):
+        assert cp(boards, src, '/flash/m4.py')
+    assert len(updates) == 1
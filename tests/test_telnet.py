@@ -0,0 +1,101 @@
+"""Telnet transport: login, IAC handling and the board file system."""
+
+from fakerepl import FakeBoardServer
+from telnet import connect
+
+from connection import TelnetConnection, Connection, ConnectionError, \
+    IAC, DONT, DO, WONT, WILL, SB
+from fileops import cp
+
+import os
+
+import pytest
+
+SE = 240
+ECHO, SGA, TTYPE = 1, 3, 24
+
+
+class FakeSocket:
+    """recv returns the given segments one at a time, sendall records"""
+
+    def __init__(self, segments):
+        self._segments = list(segments)
+        self.sent = b''
+
+    def recv(self, n):
+        return self._segments.pop(0)
+
+    def sendall(self, data):
+        self.sent += data
+
+    def close(self):
+        pass
+
+
+def telnet(segments):
+    """TelnetConnection reading segments from a FakeSocket, and the socket"""
+    conn = TelnetConnection.__new__(TelnetConnection)
+    Connection.__init__(conn)
+    conn._read_timeout = 1
+    conn._selector = None
+    conn._iac = b''
+    conn._sock = FakeSocket(segments)
+    for _ in segments:
+        conn._pull()
+    return conn._rx.read(len(conn._rx)), conn._sock.sent
+
+
+def test_iac_escape():
+    assert telnet([b'a\xff\xffb'])[0] == b'a\xffb'
+
+
+def test_iac_split_across_segments():
+    assert telnet([b'a\xff', b'\xffb'])[0] == b'a\xffb'
+    assert telnet([b'a\xff', bytes((DO,)), bytes((ECHO,)) + b'b'])[0] == b'ab'
+
+
+def test_negotiation_refused():
+    data, sent = telnet([bytes((IAC, WILL, ECHO, IAC, WILL, SGA, IAC, DO, TTYPE)) + b'>'])
+    assert data == b'>'
+    assert sent == bytes((IAC, DONT, ECHO, IAC, DONT, SGA, IAC, WONT, TTYPE))
+
+
+def test_subnegotiation_skipped():
+    data, sent = telnet([b'a' + bytes((IAC, SB, TTYPE, 1, IAC)), bytes((SE,)) + b'b'])
+    assert data == b'ab'
+    assert sent == b''
+
+
+def test_login():
+    server = FakeBoardServer(uid=b'testlogin').start()
+    boards = connect(server)
+    try:
+        assert boards.default.connected
+        assert boards.default.root_dirs == ['/flash/']
+    finally:
+        boards.default.disconnect()
+
+
+def test_login_failed():
+    server = FakeBoardServer(uid=b'testlogin', password='secret').start()
+    with pytest.raises(ConnectionError):
+        connect(server)
+
+
+def test_iac_in_file(server, tmp_path):
+    """0xff is escaped by the host and the board in both directions"""
+    boards = connect(server)
+    data = b'\xff' * 300 + bytes((IAC, SB, TTYPE, IAC, SE, IAC, DO, ECHO)) + bytes(range(256))
+    src = str(tmp_path / 'src')
+    dst = str(tmp_path / 'dst')
+    with open(src, 'wb') as f:
+        f.write(data)
+    try:
+        assert cp(boards, src, '/flash/iac')
+        with open(os.path.join(server.root, 'flash', 'iac'), 'rb') as f:
+            assert f.read() == data
+        assert cp(boards, '/flash/iac', dst)
+        with open(dst, 'rb') as f:
+            assert f.read() == data
+    finally:
+        boards.default.disconnect()
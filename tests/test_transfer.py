@@ -0,0 +1,108 @@
+"""File transfers: every byte value survives upload and download with each
+encoding, with and without deflate, at sizes around the block boundaries,
+and multi-byte characters survive cat."""
+
+from telnet import connect
+
+import fileops
+from fileops import cp
+
+import io
+import os
+
+import pytest
+
+ENCODINGS = (None, 'hex', 'base64')
+
+
+def sizes(block):
+    return (1, 2, 3, 255, 256, 257, block - 1, block, block + 1, 3 * block + 2)
+
+
+def round_trip(boards, server, data, tmp_path):
+    src = str(tmp_path / 'src')
+    dst = str(tmp_path / 'dst')
+    with open(src, 'wb') as f:
+        f.write(data)
+    assert cp(boards, src, '/flash/data')
+    with open(os.path.join(server.root, 'flash', 'data'), 'rb') as f:
+        assert f.read() == data
+    assert cp(boards, '/flash/data', dst)
+    with open(dst, 'rb') as f:
+        assert f.read() == data
+    # no .part or compressed temp files left behind
+    assert sorted(os.listdir(os.path.join(server.root, 'flash'))) == ['data']
+    os.remove(dst)
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_codec_byte_values(encoding):
+    for value in range(256):
+        buf = bytes([value])
+        assert fileops.decode(fileops.encode(buf, encoding), encoding) == buf
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_codec_blocks(encoding):
+    data = bytes(range(256)) * 64
+    block = fileops.block_size(encoding)
+    for i in range(0, len(data), block):
+        enc = fileops.encode(data[i:i + block], encoding)
+        assert len(enc) <= fileops.BUFFER_SIZE
+        assert len(enc) == fileops.encoded_size(len(data[i:i + block]), encoding)
+        assert fileops.decode(enc, encoding) == data[i:i + block]
+
+
+@pytest.mark.parametrize('compress', (False, True))
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_cp_round_trip(encoding, compress, server, unbuffered_server, tmp_path):
+    # the encodings are only used by boards without sys.stdin.buffer
+    server = server if encoding is None else unbuffered_server
+    boards = connect(server, xfer_encoding=encoding, buffer_size=1024, compress=compress)
+    try:
+        assert boards.default.xfer_encoding == encoding
+        block = fileops.block_size(encoding, boards.default.buffer_size)
+        for size in sizes(block):
+            data = (bytes(range(256)) * (size // 256 + 1))[:size]
+            round_trip(boards, server, data, tmp_path)
+        # one byte value per file
+        for value in range(256):
+            round_trip(boards, server, bytes([value]), tmp_path)
+    finally:
+        boards.default.disconnect()
+
+
+@pytest.mark.parametrize('encoding', (None, 'base64'))
+def test_download_large(encoding, server, unbuffered_server, tmp_path):
+    server = server if encoding is None else unbuffered_server
+    data = os.urandom(512 * 1024)
+    board_file = os.path.join(server.root, 'flash', 'large')
+    with open(board_file, 'wb') as f:
+        f.write(data)
+    dst = str(tmp_path / 'large')
+    boards = connect(server, xfer_encoding=encoding, buffer_size=4096, compress=False)
+    try:
+        assert cp(boards, '/flash/large', dst)
+    finally:
+        boards.default.disconnect()
+        os.remove(board_file)
+    with open(dst, 'rb') as f:
+        assert f.read() == data
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_cat_utf8(encoding, server, unbuffered_server):
+    """Characters straddling blocks are decoded whole"""
+    server = server if encoding is None else unbuffered_server
+    text = 'a\u00f1b\u20acc\U0001f600' * (3 * 1024 // 13)
+    board_file = os.path.join(server.root, 'flash', 'text.txt')
+    with open(board_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+    out = io.StringIO()
+    boards = connect(server, xfer_encoding=encoding, buffer_size=1024)
+    try:
+        fileops.cat(boards, '/flash/text.txt', out)
+    finally:
+        boards.default.disconnect()
+        os.remove(board_file)
+    assert out.getvalue() == text
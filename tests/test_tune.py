@@ -0,0 +1,69 @@
+"""Transfer tuning: opt-in on connect, result stored in the board config."""
+
+from telnet import connect, transfer
+
+from activeboards import ActiveBoards
+from config import Config
+from fileops import cp
+import activeboards
+import printing
+import tune
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def quick(monkeypatch):
+    """Short trials"""
+    monkeypatch.setattr(tune, 'TRIAL_TIME', 0.01)
+    monkeypatch.setattr(tune, 'TRIAL_MAX', tune.TRIAL_MIN)
+
+
+def test_not_tuned_by_default(server, monkeypatch, tmp_path):
+    tuned = []
+    monkeypatch.setattr(activeboards, 'tune', tuned.append)
+    printing.quiet(True)
+    boards = ActiveBoards(Config(str(tmp_path / 'shell49_rc.py')))
+    boards.connect_telnet(server.address)
+    boards.default.disconnect()
+    assert tuned == []
+
+
+def test_autotune(server, quick, tmp_path):
+    boards = connect(server, buffer_size=1024, compress=False, autotune=True)
+    dev = boards.default
+    try:
+        tuned = dev.get_config('xfer_tuned')
+        assert tuned is not None
+        assert tuned['link'] == 'network'
+        assert not os.path.exists(os.path.join(server.root, 'flash', '.shell49_tune'))
+        # host to host copies leave the board's block size alone
+        src = str(tmp_path / 'a')
+        with open(src, 'wb') as f:
+            f.write(os.urandom(10000))
+        buffer_size = dev.buffer_size
+        assert cp(boards, src, str(tmp_path / 'b'))
+        assert dev.buffer_size == buffer_size
+        transfer(boards, server, 8 * 1024)
+    finally:
+        dev.disconnect()
+
+
+def test_trial_transport_error(boards, monkeypatch):
+    def broken(*args, **kwargs):
+        raise OSError(5, "link down")
+    monkeypatch.setattr(boards.default, 'remote_eval', broken)
+    assert tune.trial(boards.default, '/flash/.shell49_tune', b'x' * 1024) is None
+
+
+def test_autotune_fails(server, monkeypatch):
+    def broken(board):
+        raise OSError(5, "link down")
+    monkeypatch.setattr(activeboards, 'tune', broken)
+    boards = connect(server, autotune=True)
+    # connected with the default parameters
+    assert boards.default.connected
+    assert boards.default.get_config('xfer_tuned') is None
+    boards.default.disconnect()
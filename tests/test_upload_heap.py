@@ -0,0 +1,69 @@
+"""Board side receive loops of uploads: blocks are read into the single
+buffer itself, not into a memoryview slice made for each block."""
+
+from fakerepl import FakeBoard, FakeStdin
+from upload_heap import Session
+
+from board import helper_source
+from fileops import block_crc, block_size, encode, recv_file_from_host, \
+    recv_files_from_host
+
+import binascii
+import os
+
+import pytest
+
+BUFFER_SIZE = 1024
+
+
+def blocks(data, encoding):
+    n = block_size(encoding, BUFFER_SIZE)
+    return b''.join(b'B' + encode(data[i:i + n], encoding) + block_crc(data[i:i + n])
+                    for i in range(0, len(data), n))
+
+
+def run(func, stream, encoding, tmp_path, monkeypatch, *args):
+    """Run board helper func on stream, returns its result and the
+       buffers readinto was called with"""
+    buffers = []
+    readinto = FakeStdin.readinto
+
+    def recording(self, buf, n=None):
+        buffers.append(buf)
+        return readinto(self, buf, n)
+    monkeypatch.setattr(FakeStdin, 'readinto', recording)
+    os.makedirs(str(tmp_path / 'flash'), exist_ok=True)
+    board = FakeBoard(Session(stream), str(tmp_path), buffered=encoding is None)
+    src, _ = helper_source(func, encoding is None, BUFFER_SIZE, 0)
+    exec(src, board._globals)
+    return board._globals[func.__name__](*args, encoding=encoding), buffers
+
+
+@pytest.mark.parametrize('encoding', (None, 'base64'))
+def test_single_buffer(encoding, tmp_path, monkeypatch):
+    data = os.urandom(20 * BUFFER_SIZE + 100)
+    res, buffers = run(recv_file_from_host, blocks(data, encoding), encoding, tmp_path,
+                       monkeypatch, None, '/flash/data', len(data), 0, 8)
+    assert res
+    with open(str(tmp_path / 'flash' / 'data'), 'rb') as f:
+        assert f.read() == data
+    # prefix and block of each
+    n = block_size(encoding, BUFFER_SIZE)
+    assert len(buffers) == 2 * -(-len(data) // n)
+    assert all(type(buf) is bytearray for buf in buffers)
+
+
+@pytest.mark.parametrize('encoding', (None, 'base64'))
+def test_bulk_single_buffer(encoding, tmp_path, monkeypatch):
+    files = [('/flash/f{}'.format(i), os.urandom(i * 700)) for i in range(6)]
+    stream = b''
+    for path, data in files:
+        stream += b'B' + '{:08x}w{:03x}'.format(len(data), len(path)).encode() + \
+            binascii.hexlify(path.encode()) + blocks(data, encoding)
+    res, buffers = run(recv_files_from_host, stream, encoding, tmp_path, monkeypatch,
+                       len(files), 8)
+    assert res == [True] * len(files)
+    for path, data in files:
+        with open(str(tmp_path) + path, 'rb') as f:
+            assert f.read() == data
+    assert all(type(buf) is bytearray for buf in buffers)
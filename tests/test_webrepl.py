@@ -0,0 +1,53 @@
+"""WebREPL transport: handshake, password and native binary file transfer."""
+
+from fakerepl import FakeBoardServer
+from webrepl import connect
+
+from connection import ConnectionError
+from fileops import cp
+
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def webrepl_server():
+    """Fake WebREPL board"""
+    return FakeBoardServer(uid=b'testwebrepl', webrepl=True).start()
+
+
+def test_connect(webrepl_server):
+    boards = connect(webrepl_server, True)
+    try:
+        assert boards.default.connected
+        assert boards.default.has_file_transfer
+        assert boards.default.root_dirs == ['/flash/']
+    finally:
+        boards.default.disconnect()
+
+
+def test_password_denied():
+    server = FakeBoardServer(uid=b'testwebrepl', webrepl=True, password='secret').start()
+    with pytest.raises(ConnectionError):
+        connect(server, True)
+
+
+@pytest.mark.parametrize('size', (0, 1, 256, 1023, 1024, 1025, 64 * 1024 + 3))
+def test_put_get(webrepl_server, tmp_path, size):
+    """binary put and get of all byte values"""
+    boards = connect(webrepl_server, True)
+    data = (bytes(range(256)) * (size // 256 + 1))[:size]
+    src = str(tmp_path / 'src')
+    dst = str(tmp_path / 'dst')
+    with open(src, 'wb') as f:
+        f.write(data)
+    try:
+        assert cp(boards, src, '/flash/data')
+        with open(os.path.join(webrepl_server.root, 'flash', 'data'), 'rb') as f:
+            assert f.read() == data
+        assert cp(boards, '/flash/data', dst)
+        with open(dst, 'rb') as f:
+            assert f.read() == data
+    finally:
+        boards.default.disconnect()